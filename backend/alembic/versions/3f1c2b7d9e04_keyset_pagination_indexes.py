@@ -0,0 +1,19 @@
+"""add composite indexes for keyset pagination of posts and comments"""
+
+from alembic import op
+
+
+revision = '3f1c2b7d9e04'
+down_revision = '1234567890ab'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_posts_created_at_id', 'posts', ['created_at', 'id'])
+    op.create_index('ix_comments_post_id_created_at_id', 'comments', ['post_id', 'created_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_comments_post_id_created_at_id', table_name='comments')
+    op.drop_index('ix_posts_created_at_id', table_name='posts')
@@ -0,0 +1,43 @@
+"""add weighted full-text search vector to posts"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = '8a4e6c1d2b53'
+down_revision = '3f1c2b7d9e04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+
+    op.execute("""
+        CREATE FUNCTION posts_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER posts_search_vector_update
+        BEFORE INSERT OR UPDATE OF title, content ON posts
+        FOR EACH ROW EXECUTE FUNCTION posts_search_vector_update()
+    """)
+
+    # Backfill existing rows through the trigger
+    op.execute("UPDATE posts SET title = title")
+
+    op.create_index('ix_posts_search_vector', 'posts', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_posts_search_vector', table_name='posts')
+    op.execute("DROP TRIGGER posts_search_vector_update ON posts")
+    op.execute("DROP FUNCTION posts_search_vector_update()")
+    op.drop_column('posts', 'search_vector')
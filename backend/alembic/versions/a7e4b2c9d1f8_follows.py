@@ -0,0 +1,29 @@
+"""add follows and users.follower_count"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'a7e4b2c9d1f8'
+down_revision = 'f3c9d7a2b1e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'follows',
+        sa.Column('follower_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('followee_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+    op.create_index('ix_follows_followee_id', 'follows', ['followee_id'])
+    op.add_column('users', sa.Column('follower_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_posts_owner_id_created_at', 'posts', ['owner_id', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_posts_owner_id_created_at', table_name='posts')
+    op.drop_column('users', 'follower_count')
+    op.drop_index('ix_follows_followee_id', table_name='follows')
+    op.drop_table('follows')
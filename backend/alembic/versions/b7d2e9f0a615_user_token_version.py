@@ -0,0 +1,18 @@
+"""add token_version to users for access token revocation"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'b7d2e9f0a615'
+down_revision = '8a4e6c1d2b53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,39 @@
+"""index foreign keys and published posts by created_at, concurrently
+
+comments.user_id, comments.parent_id and votes.post_id had no index, so the
+ON DELETE CASCADE from users/posts/comments and per-post vote lookups scanned
+the whole table. posts.owner_id is already served by
+ix_posts_owner_id_created_at and comments.post_id by the composite comment
+indexes.
+
+The indexes are built with CREATE INDEX CONCURRENTLY outside the migration
+transaction, so writes to large tables are not blocked while they build. If a
+build fails Postgres leaves an INVALID index behind; drop it and rerun.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'b8f1d3e5a2c4'
+down_revision = 'a7e4b2c9d1f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_comments_user_id', 'comments', ['user_id'], postgresql_concurrently=True)
+        op.create_index('ix_comments_parent_id', 'comments', ['parent_id'], postgresql_concurrently=True,
+                        postgresql_where=sa.text('parent_id IS NOT NULL'))
+        op.create_index('ix_votes_post_id', 'votes', ['post_id'], postgresql_concurrently=True)
+        op.create_index('ix_posts_published_created_at_id', 'posts', ['created_at', 'id'], postgresql_concurrently=True,
+                        postgresql_where=sa.text('published'))
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_posts_published_created_at_id', table_name='posts', postgresql_concurrently=True)
+        op.drop_index('ix_votes_post_id', table_name='votes', postgresql_concurrently=True)
+        op.drop_index('ix_comments_parent_id', table_name='comments', postgresql_concurrently=True)
+        op.drop_index('ix_comments_user_id', table_name='comments', postgresql_concurrently=True)
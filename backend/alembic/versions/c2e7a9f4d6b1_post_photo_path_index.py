@@ -0,0 +1,28 @@
+"""index posts.photo_path, concurrently
+
+/uploads looks up the post a requested file belongs to, to check that it is
+published or that the requester owns it, on every image request.
+
+Built with CREATE INDEX CONCURRENTLY outside the migration transaction, as in
+b8f1d3e5a2c4; if the build fails, drop the INVALID index and rerun.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'c2e7a9f4d6b1'
+down_revision = 'b8f1d3e5a2c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_posts_photo_path', 'posts', ['photo_path'], postgresql_concurrently=True,
+                        postgresql_where=sa.text('photo_path IS NOT NULL'))
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_posts_photo_path', table_name='posts', postgresql_concurrently=True)
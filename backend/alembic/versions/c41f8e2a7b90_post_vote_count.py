@@ -0,0 +1,23 @@
+"""add denormalized vote_count to posts"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'c41f8e2a7b90'
+down_revision = 'b7d2e9f0a615'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('vote_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute("""
+        UPDATE posts SET vote_count = counts.n
+        FROM (SELECT post_id, count(*) AS n FROM votes GROUP BY post_id) AS counts
+        WHERE posts.id = counts.post_id
+    """)
+
+
+def downgrade():
+    op.drop_column('posts', 'vote_count')
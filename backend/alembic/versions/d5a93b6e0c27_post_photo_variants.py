@@ -0,0 +1,18 @@
+"""add photo_variants to posts"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'd5a93b6e0c27'
+down_revision = 'c41f8e2a7b90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('photo_variants', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('posts', 'photo_variants')
@@ -0,0 +1,29 @@
+"""threaded comments: parent_id, materialized path, depth and reply_count"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'e2b8c4f1a9d3'
+down_revision = 'd5a93b6e0c27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('comments', sa.Column('parent_id', sa.Integer(), sa.ForeignKey('comments.id', ondelete='CASCADE'), nullable=True))
+    op.add_column('comments', sa.Column('path', sa.String(collation='C'), nullable=True))
+    op.add_column('comments', sa.Column('depth', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('comments', sa.Column('reply_count', sa.Integer(), server_default='0', nullable=False))
+    # Every existing comment becomes a top-level thread of its own
+    op.execute("UPDATE comments SET path = lpad(id::text, 10, '0')")
+    op.alter_column('comments', 'path', nullable=False)
+    op.create_index('ix_comments_post_id_path', 'comments', ['post_id', 'path'])
+
+
+def downgrade():
+    op.drop_index('ix_comments_post_id_path', table_name='comments')
+    op.drop_column('comments', 'reply_count')
+    op.drop_column('comments', 'depth')
+    op.drop_column('comments', 'path')
+    op.drop_column('comments', 'parent_id')
@@ -0,0 +1,35 @@
+"""make ix_comments_post_id_created_at_id partial to top-level comments, concurrently
+
+A page of threads starts from the post's oldest top-level comments (WHERE
+post_id = ? AND parent_id IS NULL ORDER BY created_at, id LIMIT n). The full
+index also holds every reply, which the scan had to step over; the partial one
+only holds top-level comments. The post_id foreign key is still served by
+ix_comments_post_id_path.
+
+Built with CREATE INDEX CONCURRENTLY outside the migration transaction, as in
+b8f1d3e5a2c4; if the build fails, drop the INVALID index and rerun.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'e6f1a3c8b2d7'
+down_revision = 'd9a4f2c6e813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_comments_top_level_post_id_created_at_id', 'comments', ['post_id', 'created_at', 'id'],
+                        postgresql_concurrently=True, postgresql_where=sa.text('parent_id IS NULL'))
+        op.drop_index('ix_comments_post_id_created_at_id', table_name='comments', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_comments_post_id_created_at_id', 'comments', ['post_id', 'created_at', 'id'],
+                        postgresql_concurrently=True)
+        op.drop_index('ix_comments_top_level_post_id_created_at_id', table_name='comments',
+                      postgresql_concurrently=True)
@@ -0,0 +1,29 @@
+"""add trending hot_score to posts"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'f3c9d7a2b1e6'
+down_revision = 'e2b8c4f1a9d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('posts', sa.Column('hot_score', sa.Float(), server_default='0', nullable=False))
+    op.add_column('posts', sa.Column('hot_updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False))
+    # Seed from the existing votes and comments as if they had all arrived when
+    # the post was created, with the default weights and 12 hour half-life
+    op.execute("""
+        UPDATE posts SET hot_score =
+            (posts.vote_count * 1.0 + 2.0 * (SELECT count(*) FROM comments WHERE comments.post_id = posts.id))
+            * exp(greatest(-700, -ln(2) / 43200 * extract(epoch FROM now() - posts.created_at)))
+    """)
+    op.create_index('ix_posts_hot_score_id', 'posts', ['hot_score', 'id'], postgresql_where=sa.text('published'))
+
+
+def downgrade():
+    op.drop_index('ix_posts_hot_score_id', table_name='posts')
+    op.drop_column('posts', 'hot_updated_at')
+    op.drop_column('posts', 'hot_score')
@@ -0,0 +1,241 @@
+import bisect
+import hashlib
+import json
+import math
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+
+from .config import settings
+from .ttl_cache import TTLCache
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # optional, only needed for cache_backend = "redis"
+    redis = None
+
+
+# Response cache for the public read endpoints.
+#
+# Entries are keyed on the route path plus the sorted query string and list
+# the tags they depend on ("posts", "post:<id>", "comments:<post id>", ...).
+# The backend keeps a version clock: every invalidation advances it and stamps
+# the tags it affects with the new value. A miss notes the clock before the
+# endpoint queries, and the entry is stored with that version; it stays valid
+# while none of its tags has been stamped later. So a write that commits while
+# the query runs still invalidates the entry built from it, including writes to
+# tags only known once the query has returned (the ids on the page). Entries
+# also expire after cache_ttl_seconds.
+#
+# Pages read from a replica (see app/replicas.py) may be built from data up to
+# request.state.cache_lag seconds old. They are stored under the version the
+# clock had that long ago, so invalidations the replica may not have replayed
+# yet still make them stale; backends keep the times of the bumps of the last
+# lag_window seconds for that. Those pages also expire after
+# request.state.cache_ttl. Requests with request.state.cache_bypass set (users
+# reading their own writes) neither read nor fill the cache.
+
+
+class MemoryBackend:
+    shared = False
+
+    def __init__(self, max_entries: int, ttl: float, lag_window: float = 0.0):
+        self._entries = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._clock = 0
+        self._stamps = {}
+        self._lag_window = lag_window
+        self._bumped_at = []  # monotonic times of the bumps within lag_window
+        self._lock = threading.Lock()
+
+    async def get(self, key):
+        return self._entries.get(key)
+
+    async def set(self, key, entry, ttl=None):
+        self._entries.set(key, entry, ttl)
+
+    async def version(self, lag: float = 0.0):
+        # The clock as it was `lag` seconds ago, for lag up to lag_window
+        with self._lock:
+            if not lag:
+                return self._clock
+            since = time.monotonic() - lag
+            return self._clock - (len(self._bumped_at) - bisect.bisect_right(self._bumped_at, since))
+
+    async def last_bumped(self, tags):
+        with self._lock:
+            return max((self._stamps.get(tag, 0) for tag in tags), default=0)
+
+    async def bump(self, tags):
+        with self._lock:
+            self._clock += 1
+            for tag in tags:
+                self._stamps[tag] = self._clock
+            if self._lag_window:
+                now = time.monotonic()
+                del self._bumped_at[:bisect.bisect_right(self._bumped_at, now - self._lag_window)]
+                self._bumped_at.append(now)
+
+    async def clear(self):
+        self._entries.clear()
+
+
+class RedisBackend:
+    # Works with Redis and API-compatible servers (KeyDB, Dragonfly, Valkey).
+    # A bump advances the clock and stamps its tags in one script, so stamps
+    # never go backwards when two invalidations race. Bump times are a sorted
+    # set scored by the server's clock.
+    shared = True
+
+    BUMP = """
+    local version = redis.call('INCR', KEYS[1])
+    for i = 3, #KEYS do
+        redis.call('SET', KEYS[i], version)
+    end
+    local window = tonumber(ARGV[1])
+    if window > 0 then
+        local time = redis.call('TIME')
+        local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+        redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - window)
+        redis.call('ZADD', KEYS[2], now, version)
+    end
+    return version
+    """
+
+    VERSION = """
+    local clock = tonumber(redis.call('GET', KEYS[1]) or 0)
+    local lag = tonumber(ARGV[1])
+    if lag <= 0 then
+        return clock
+    end
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    return clock - redis.call('ZCOUNT', KEYS[2], '(' .. (now - lag), '+inf')
+    """
+
+    def __init__(self, url: str, ttl: float, lag_window: float = 0.0, prefix: str = "blog:cache:"):
+        if redis is None:
+            raise RuntimeError("cache_backend 'redis' requires the redis package")
+        self._client = redis.from_url(url)
+        self._bump = self._client.register_script(self.BUMP)
+        self._version = self._client.register_script(self.VERSION)
+        self._ttl = int(ttl)
+        self._lag_window = lag_window
+        self._prefix = prefix
+
+    async def get(self, key):
+        raw = await self._client.get(self._prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key, entry, ttl=None):
+        await self._client.set(self._prefix + key, json.dumps(entry),
+                               ex=self._ttl if ttl is None else max(1, math.ceil(ttl)))
+
+    async def version(self, lag: float = 0.0):
+        return int(await self._version(keys=[f"{self._prefix}clock", f"{self._prefix}bumped_at"], args=[lag]))
+
+    async def last_bumped(self, tags):
+        if not tags:
+            return 0
+        values = await self._client.mget([f"{self._prefix}tag:{tag}" for tag in tags])
+        return max(int(value or 0) for value in values)
+
+    async def bump(self, tags):
+        await self._bump(keys=[f"{self._prefix}clock", f"{self._prefix}bumped_at",
+                               *(f"{self._prefix}tag:{tag}" for tag in tags)],
+                         args=[self._lag_window])
+
+    async def clear(self):
+        async for key in self._client.scan_iter(match=f"{self._prefix}*"):
+            await self._client.delete(key)
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def key(request: Request):
+        params = urlencode(sorted(request.query_params.multi_items()))
+        return f"{request.url.path}?{params}"
+
+    async def lookup(self, request: Request):
+        # (entry, None) on a hit; (None, version) on a miss, where version is
+        # what the endpoint passes to store() once it has queried
+        if self.backend is None or getattr(request.state, "cache_bypass", False):
+            return None, None
+        entry = await self.backend.get(self.key(request))
+        # Entries written before the version clock have no "version"
+        if entry is not None and "version" in entry:
+            if await self.backend.last_bumped(entry["tags"]) <= entry["version"]:
+                self.hits += 1
+                return entry, None
+        self.misses += 1
+        return None, await self.backend.version(getattr(request.state, "cache_lag", 0.0))
+
+    async def store(self, request: Request, version, body: bytes, tags, headers=None):
+        entry = {
+            "body": body.decode(),
+            "headers": headers or {},
+            "etag": '"' + hashlib.sha1(body).hexdigest() + '"',
+            "last_modified": formatdate(time.time(), usegmt=True),
+            "tags": list(dict.fromkeys(tags)),
+            "version": version,
+        }
+        if self.backend is not None and version is not None:
+            await self.backend.set(self.key(request), entry, getattr(request.state, "cache_ttl", None))
+        return entry
+
+    async def invalidate(self, *tags):
+        if self.backend is not None:
+            await self.backend.bump(tags)
+
+    def _is_fresh(self, request: Request, entry):
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            return entry["etag"] in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*"
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(entry["last_modified"]) <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def respond(self, request: Request, entry):
+        headers = {
+            **entry["headers"],
+            "ETag": entry["etag"],
+            "Last-Modified": entry["last_modified"],
+            "Cache-Control": "no-cache",
+        }
+        if self._is_fresh(request, entry):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+
+def _create_backend():
+    # Bump times are only needed for pages read from replicas
+    lag_window = settings.replica_lag_tolerance_seconds if settings.database_replica_urls else 0.0
+    if settings.cache_backend == "memory":
+        return MemoryBackend(settings.cache_max_entries, settings.cache_ttl_seconds, lag_window)
+    if settings.cache_backend == "redis":
+        return RedisBackend(settings.cache_redis_url, settings.cache_ttl_seconds, lag_window)
+    return None
+
+
+response_cache = ResponseCache(_create_backend())
@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -10,6 +11,119 @@ class Settings(BaseSettings):
     secret_key : str
     algorithm : str
     access_token_expire_minutes: int
+    # Full SQLAlchemy URL; overrides the postgres settings above (e.g. sqlite for tests)
+    database_url: Optional[str] = None
+    # Read replicas for the public read endpoints, as a JSON list of URLs
+    # (DATABASE_REPLICA_URLS='["postgresql://...@replica1/db"]'). A replica
+    # more than replica_lag_tolerance_seconds behind is skipped, and a user
+    # reads from the primary for that long after each of their writes. Lag is
+    # measured at most every replica_lag_check_seconds per replica
+    database_replica_urls: List[str] = []
+    replica_lag_tolerance_seconds: float = 2.0
+    replica_lag_check_seconds: float = 1.0
+    # Serve requests through AsyncEngine/asyncpg (aiosqlite for SQLite URLs)
+    # instead of the threadpool + psycopg2
+    database_async: bool = False
+    # Connection pool; db_pgbouncer switches to NullPool without prepared
+    # statements for running behind PgBouncer in transaction mode
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_pgbouncer: bool = False
+    # Response cache for public reads: "memory", "redis" or "none"
+    cache_backend: str = "memory"
+    cache_redis_url: str = "redis://localhost:6379/0"
+    cache_ttl_seconds: int = 30
+    cache_max_entries: int = 2048
+    # Uploaded files: "local" (under upload_dir) or "s3" (any S3-compatible service)
+    storage_backend: str = "local"
+    upload_dir: str = "uploads"
+    upload_max_bytes: int = 10 * 1024 * 1024
+    s3_bucket: Optional[str] = None
+    s3_endpoint_url: Optional[str] = None
+    s3_region: Optional[str] = None
+    s3_public_url: Optional[str] = None
+    # Processes that build image variants (thumbnails, WebP) after uploads
+    image_workers: int = 2
+    # Hand the bytes of /uploads responses to the front proxy: "" (serve them
+    # here), "nginx" (X-Accel-Redirect to media_accel_prefix) or "sendfile"
+    # (X-Sendfile with the absolute path)
+    media_accel: str = ""
+    media_accel_prefix: str = "/protected-uploads"
+    # Limits on one page of comment threads: levels of replies, replies shown
+    # per comment, and total comments
+    comment_max_depth: int = 6
+    comment_max_breadth: int = 20
+    comment_max_rows: int = 500
+    # Trending feed: score added per vote / comment, half-life of the score,
+    # and how often stored scores are decayed (0 disables the task). Of the
+    # workers on a host only the one holding trending_decay_lock_file (in the
+    # temp dir when unset) runs the task
+    trending_vote_weight: float = 1.0
+    trending_comment_weight: float = 2.0
+    trending_half_life_hours: float = 12.0
+    trending_decay_interval_seconds: int = 300
+    trending_decay_lock_file: Optional[str] = None
+    # Home timelines for /feed: "memory" or "redis" (timeline_redis_url, or
+    # cache_redis_url when unset), ids kept per user, and the follower count
+    # above which a writer's posts are read at query time instead of fanned out
+    timeline_backend: str = "memory"
+    timeline_redis_url: Optional[str] = None
+    timeline_max_length: int = 500
+    fanout_max_followers: int = 10000
+    # Per-route request, SQL, bcrypt and serialization histograms at /metrics,
+    # and pyinstrument profiles of sampled requests or of requests sending
+    # "X-Profile: <profile_token>", written to profile_dir
+    instrumentation_enabled: bool = False
+    profile_sample_rate: float = 0.0
+    profile_token: Optional[str] = None
+    profile_dir: str = "profiles"
+    # Write-behind votes: buffer them in process and write them in batches,
+    # every vote_buffer_interval_ms or once vote_buffer_max_items are waiting.
+    # vote_buffer_durability "commit" answers once the vote's batch has
+    # committed; "none" answers 202 as soon as it is buffered, and loses what
+    # is still buffered if the process dies
+    vote_buffer_enabled: bool = False
+    vote_buffer_durability: str = "commit"
+    vote_buffer_interval_ms: int = 10
+    vote_buffer_max_items: int = 1000
+    # Rate limits of login (per client IP, per login name from one IP, and a
+    # looser one per login name from anywhere),
+    # votes (per user) and comments (per IP and per user), as "<count>/<second|
+    # minute|hour|day>" or "" for none. rate_limit_backend "memory" counts per
+    # process and keeps at most rate_limit_max_keys buckets; "redis" is shared
+    # by all workers (rate_limit_redis_url, or cache_redis_url when unset)
+    rate_limit_enabled: bool = True
+    rate_limit_backend: str = "memory"
+    rate_limit_redis_url: Optional[str] = None
+    rate_limit_max_keys: int = 100000
+    rate_limit_login_ip: str = "20/minute"
+    rate_limit_login_account: str = "5/minute"
+    rate_limit_login_username: str = "100/hour"
+    rate_limit_vote_user: str = "60/minute"
+    rate_limit_comment_ip: str = "30/minute"
+    rate_limit_comment_user: str = "10/minute"
+    # Event loop and HTTP parser of the gunicorn workers ("auto" picks uvloop
+    # and httptools when installed, else asyncio and h11)
+    server_loop: str = "auto"
+    server_http: str = "auto"
+    # Before a worker takes traffic: fill its connection pools up to
+    # db_pool_size and GET warmup_paths in process to fill the response cache
+    warmup_enabled: bool = True
+    warmup_paths: List[str] = ["/posts", "/posts/trending"]
+    # Rows per INSERT / cursor fetch in bulk import and export, and the
+    # longest line accepted by the NDJSON import
+    bulk_batch_size: int = 1000
+    bulk_max_line_bytes: int = 1024 * 1024
+    # How long authenticated user rows (and their token versions) are cached
+    user_cache_ttl_seconds: int = 60
+    # bcrypt process pool: worker processes, max running + queued calls, and
+    # the Retry-After sent with the 503 once that limit is reached
+    hash_workers: int = 2
+    hash_queue_limit: int = 64
+    hash_retry_after_seconds: int = 1
 
     class Config:
         env_file = ".env"
@@ -1,25 +1,163 @@
+from contextlib import asynccontextmanager
 from sqlalchemy import create_engine
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from starlette.concurrency import run_in_threadpool
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import time
+import uuid
 from .config import settings
+from .pool_metrics import InstrumentedQueuePool, InstrumentedAsyncQueuePool
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_name}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_username}"
+SQLALCHEMY_DATABASE_URL = settings.database_url or f"postgresql://{settings.database_name}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_username}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Same database through an asyncio driver, used when settings.database_async is on
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+_url = make_url(SQLALCHEMY_DATABASE_URL)
+SQLALCHEMY_ASYNC_DATABASE_URL = _url.set(drivername=ASYNC_DRIVERS.get(_url.get_backend_name(), _url.drivername))
+
+def _engine_options(poolclass, is_async=False):
+    if settings.db_pgbouncer:
+        # PgBouncer owns pooling; asyncpg must not reuse named prepared statements
+        # because consecutive transactions may land on different server connections.
+        options = {"poolclass": NullPool}
+        if is_async:
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            }
+        return options
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(InstrumentedQueuePool))
 
 SessionLocal = sessionmaker(autocommit = False , autoflush = False , bind = engine)
 
+async_engine = (
+    create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, **_engine_options(InstrumentedAsyncQueuePool, is_async=True))
+    if settings.database_async else None
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base =  declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+
+class ThreadedSession:
+    """The AsyncSession interface over a regular Session.
+
+    Each call runs in the threadpool, so routers can be written once against
+    the async API and still run on the synchronous engine when
+    settings.database_async is off.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+        self.bind = session.bind
+
+    async def execute(self, statement, params=None, **kw):
+        return await run_in_threadpool(self.sync_session.execute, statement, params, **kw)
+
+    async def scalar(self, statement, params=None, **kw):
+        return await run_in_threadpool(self.sync_session.scalar, statement, params, **kw)
+
+    async def scalars(self, statement, params=None, **kw):
+        return await run_in_threadpool(self.sync_session.scalars, statement, params, **kw)
+
+    async def get(self, entity, ident, **kw):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kw)
+
+    async def merge(self, instance, **kw):
+        return await run_in_threadpool(self.sync_session.merge, instance, **kw)
+
+    async def refresh(self, instance, attribute_names=None):
+        return await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def delete(self, instance):
+        return await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self):
+        return await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        return await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        return await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self):
+        return await run_in_threadpool(self.sync_session.close)
+
+    async def stream(self, statement, params=None, **kw):
+        # Server-side cursor; rows are fetched in the threadpool as they are consumed
+        statement = statement.execution_options(stream_results=True)
+        result = await run_in_threadpool(self.sync_session.execute, statement, params, **kw)
+        return ThreadedStreamResult(result)
+
+    async def run_sync(self, fn, *args, **kw):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kw)
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    def expunge(self, instance):
+        self.sync_session.expunge(instance)
+
+
+class ThreadedStreamResult:
+    """The AsyncResult.partitions() interface over a streaming sync Result."""
+
+    def __init__(self, result):
+        self.result = result
+
+    async def partitions(self, size):
+        try:
+            while rows := await run_in_threadpool(self.result.fetchmany, size):
+                yield rows
+        finally:
+            await run_in_threadpool(self.result.close)
+
+
+@asynccontextmanager
+async def session_scope():
+    # A session for work outside a request, e.g. background tasks
+    if settings.database_async:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = ThreadedSession(SessionLocal(expire_on_commit=False))
+        try:
+            yield db
+        finally:
+            await db.close()
+
+
+async def get_db():
+    async with session_scope() as db:
         yield db
-    finally:
-        db.close()  
+
+
+def dialect_insert(db):
+    # insert() with the dialect's ON CONFLICT support
+    return pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
 
 # while True:
 #   try:
@@ -31,4 +169,4 @@ def get_db():
 #   except Exception as error:
 #     print("connection to database failed")  
 #     print("error" , error)  
-#     time.sleep(2)        
\ No newline at end of file
+#     time.sleep(2)        
@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import update
+
+from . import models
+from .cache import response_cache
+from .config import settings
+from .database import session_scope
+from .storage import staging_dir, storage, store_file, variants_prefix
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional, derivatives are skipped without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# name: (longest side in pixels, format). Renditions are produced largest first,
+# each resized from the previous one of the same decoded image.
+VARIANTS = {
+    "medium": (1024, "JPEG"),
+    "medium_webp": (1024, "WEBP"),
+    "thumbnail": (320, "JPEG"),
+    "thumbnail_webp": (320, "WEBP"),
+}
+CONTENT_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+SAVE_OPTIONS = {"JPEG": {"quality": 82, "optimize": True, "progressive": True}, "WEBP": {"quality": 80, "method": 4}}
+
+
+def render_variants(src_path: str, staging_dir: str):
+    """Decode `src_path` once and write every variant to a staging file.
+
+    Runs in the image process pool. Re-encoding without passing `exif` drops
+    EXIF/XMP metadata; orientation is applied to the pixels first. Returns
+    {name: (tmp_path, sha256, content type)}.
+    """
+    with Image.open(src_path) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+    results = {}
+    current = image
+    for name, (size, fmt) in sorted(VARIANTS.items(), key=lambda item: -item[1][0]):
+        if max(current.size) > size:
+            current = current.copy()
+            current.thumbnail((size, size), Image.LANCZOS)
+        rendition = current.convert("RGB") if fmt == "JPEG" else current
+
+        fd, tmp_path = tempfile.mkstemp(dir=staging_dir)
+        with os.fdopen(fd, "wb") as out:
+            rendition.save(out, format=fmt, **SAVE_OPTIONS[fmt])
+        with open(tmp_path, "rb") as saved:
+            digest = hashlib.file_digest(saved, "sha256").hexdigest()
+        results[name] = (tmp_path, digest, CONTENT_TYPES[fmt])
+    return results
+
+
+_image_pool = None
+
+
+def _get_image_pool():
+    global _image_pool
+    if _image_pool is None:
+        _image_pool = ProcessPoolExecutor(max_workers=settings.image_workers)
+    return _image_pool
+
+
+def shutdown_image_pool():
+    global _image_pool
+    if _image_pool is not None:
+        _image_pool.shutdown(wait=True, cancel_futures=True)
+        _image_pool = None
+
+
+async def process_post_photo(post_id: int, key: str):
+    # Background task started once an upload is stored: build the variants and
+    # record them on the post, unless a newer photo has replaced it meanwhile.
+    if Image is None:
+        logger.warning("Pillow is not installed, skipping image variants for post %s", post_id)
+        return
+
+    try:
+        tmp_dir = await staging_dir()
+        async with storage.local_copy(key) as src_path:
+            rendered = await asyncio.get_running_loop().run_in_executor(
+                _get_image_pool(), render_variants, src_path, tmp_dir
+            )
+
+        variants = {}
+        for name, (tmp_path, digest, content_type) in rendered.items():
+            try:
+                variant_key = await store_file(tmp_path, digest, content_type, variants_prefix(key))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+            variants[name] = storage.url(variant_key)
+
+        async with session_scope() as db:
+            result = await db.execute(
+                update(models.Post)
+                .where(models.Post.id == post_id, models.Post.photo_path == storage.url(key))
+                .values(photo_variants=variants)
+            )
+            await db.commit()
+        if result.rowcount:
+            await response_cache.invalidate(f"post:{post_id}")
+    except Exception:
+        logger.exception("Building image variants for post %s failed", post_id)
@@ -0,0 +1,234 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .serialization import FastJSONResponse
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # optional, only needed for request profiles
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+# Opt-in per-route instrumentation (instrumentation_enabled).
+#
+# InstrumentationMiddleware gives every request a RequestStats in a context
+# variable. SQLAlchemy cursor events, the bcrypt pool and response rendering
+# add to whatever stats are current, including from the threadpool and the
+# async driver's greenlets, which inherit the context. When the response has
+# been sent the totals go into per-route histograms exported at /metrics in
+# the Prometheus text format. Background tasks run after that and are not
+# counted.
+#
+# Requests can also be profiled with pyinstrument: a random
+# profile_sample_rate of them, and any request with an X-Profile header equal
+# to profile_token. Profiles are written to profile_dir as HTML.
+
+# Upper bounds of the histogram buckets: seconds, and statements per request
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+METRICS = {
+    # name: (help, buckets)
+    "http_request_duration_seconds": ("Wall time from request to last body byte", SECONDS_BUCKETS),
+    "db_statements_per_request": ("SQL statements executed per request", COUNT_BUCKETS),
+    "db_duration_seconds": ("Time spent executing SQL per request", SECONDS_BUCKETS),
+    "bcrypt_duration_seconds": ("Time spent waiting on password hashing per request", SECONDS_BUCKETS),
+    "serialization_duration_seconds": ("Time spent encoding response bodies per request", SECONDS_BUCKETS),
+}
+
+
+class RequestStats:
+    __slots__ = ("sql_count", "sql_seconds", "bcrypt_seconds", "serialize_seconds", "open")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.bcrypt_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.open = True
+
+
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_stats():
+    stats = _current.get()
+    return stats if stats is not None and stats.open else None
+
+
+@contextmanager
+def timed(field: str):
+    # Adds the duration of the block to the current request's `field`
+    stats = current_stats()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(stats, field, getattr(stats, field) + time.perf_counter() - start)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class RouteMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (metric name, method, route, status) -> Histogram
+        self._histograms = {}
+
+    def observe(self, method, route, status, values):
+        with self._lock:
+            for name, value in values.items():
+                key = (name, method, route, status)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(METRICS[name][1])
+                histogram.observe(value)
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for name, (help_text, _) in METRICS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, method, route, status), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    labels = f'method="{method}",route="{route}",status="{status}"'
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+            return "\n".join(lines) + "\n"
+
+
+route_metrics = RouteMetrics()
+
+
+def instrument_engine(engine):
+    # Statement timings per connection; executemany counts as one statement
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        stats = current_stats()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_seconds += time.perf_counter() - start
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+class InstrumentedJSONResponse(FastJSONResponse):
+    def render(self, content):
+        with timed("serialize_seconds"):
+            return super().render(content)
+
+
+def _wants_profile(scope):
+    if Profiler is None:
+        return False
+    if settings.profile_token:
+        for name, value in scope["headers"]:
+            if name == b"x-profile" and value.decode("latin-1") == settings.profile_token:
+                return True
+    return settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate
+
+
+def _write_profile(profiler, method, path):
+    os.makedirs(settings.profile_dir, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{path.strip('/').replace('/', '_') or 'root'}.html"
+    file_path = os.path.join(settings.profile_dir, name)
+    with open(file_path, "w") as out:
+        out.write(profiler.output_html())
+    return file_path
+
+
+class InstrumentationMiddleware:
+    # Plain ASGI middleware so the request runs in this task and context
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        start = time.perf_counter()
+        elapsed = None
+        profiler = None
+        if _wants_profile(scope):
+            profiler = Profiler(async_mode="enabled")
+            profiler.start()
+
+        async def send_wrapper(message):
+            nonlocal status, elapsed
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                elapsed = time.perf_counter() - start
+                stats.open = False
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if elapsed is None:
+                elapsed = time.perf_counter() - start
+            stats.open = False
+            if profiler is not None:
+                profiler.stop()
+                try:
+                    file_path = await run_in_threadpool(_write_profile, profiler, scope["method"], scope["path"])
+                    logger.info("profile of %s %s written to %s", scope["method"], scope["path"], file_path)
+                except OSError:
+                    logger.exception("could not write request profile")
+
+            route = scope.get("route")
+            route_metrics.observe(scope["method"], route.path if route is not None else "unmatched", status, {
+                "http_request_duration_seconds": elapsed,
+                "db_statements_per_request": stats.sql_count,
+                "db_duration_seconds": stats.sql_seconds,
+                "bcrypt_duration_seconds": stats.bcrypt_seconds,
+                "serialization_duration_seconds": stats.serialize_seconds,
+            })
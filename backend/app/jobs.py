@@ -0,0 +1,90 @@
+import logging
+import time
+import uuid
+
+from .cache import response_cache
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Progress of long-running admin jobs, kept for an hour after they were last
+# updated. Like the read-your-writes notes of app/replicas.py, jobs go to the
+# response cache backend when it is shared between workers, so any worker can
+# answer /admin/jobs/{id}; otherwise they stay in this process, which is then
+# the only worker (see gunicorn.conf.py).
+JOB_TTL_SECONDS = 3600
+FIELDS = ("id", "kind", "status", "total", "processed", "error", "created_at", "finished_at")
+_jobs = TTLCache(maxsize=1000, ttl=JOB_TTL_SECONDS)
+
+
+class Job:
+    def __init__(self, kind: str, total: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "pending"
+        self.total = total
+        self.processed = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        job = cls.__new__(cls)
+        for name in FIELDS:
+            setattr(job, name, data[name])
+        return job
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in FIELDS}
+
+    async def save(self):
+        backend = response_cache.backend
+        if backend.shared:
+            await backend.set(f"job:{self.id}", self.to_dict(), JOB_TTL_SECONDS)
+        else:
+            _jobs.set(self.id, self)
+
+    async def advance(self, count: int):
+        self.status = "running"
+        self.processed += count
+        await self.save()
+
+    async def finish(self, error: str = None):
+        self.status = "failed" if error else "done"
+        self.error = error
+        self.finished_at = time.time()
+        await self.save()
+
+
+async def create_job(kind: str, total: int) -> Job:
+    job = Job(kind, total)
+    await job.save()
+    return job
+
+
+async def get_job(job_id: str):
+    backend = response_cache.backend
+    if backend.shared:
+        data = await backend.get(f"job:{job_id}")
+        return Job.from_dict(data) if data is not None else None
+    return _jobs.get(job_id)
+
+
+async def run_chunked(job: Job, ids, chunk_size: int, handle_chunk):
+    """Call `await handle_chunk(chunk)` for each slice of `ids`, recording progress.
+
+    Every chunk is its own transaction, so a failure part way through leaves
+    the chunks before it applied; the job reports how far it got.
+    """
+    try:
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            await handle_chunk(chunk)
+            await job.advance(len(chunk))
+    except Exception as error:
+        logger.exception("%s job %s failed after %d of %d", job.kind, job.id, job.processed, job.total)
+        await job.finish(str(error))
+    else:
+        await job.finish()
+    return job
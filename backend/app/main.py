@@ -1,14 +1,49 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .import models
-from .database import engine
-from  .routers import post ,user , auth , vote , admin , comments
+from fastapi.responses import PlainTextResponse
+from .import models , utils , images , trending , warmup
+from .database import engine , async_engine
+from  .routers import post ,user , auth , vote , admin , comments , media , bulk , feed
 from .config import settings
+from .pool_metrics import pool_status
+from .cache import response_cache
+from .serialization import FastJSONResponse
+from .vote_buffer import vote_buffer
+from .replicas import ReadYourWritesMiddleware, replicas
+from .instrumentation import InstrumentationMiddleware, InstrumentedJSONResponse, instrument_engine, route_metrics
 from fastapi.middleware.cors import CORSMiddleware
 
-print(settings.database_password)
-
 # models.Base.metadata.create_all(bind = engine)
-app = FastAPI()
+
+# Nothing above connects to anything, so the app can be imported once in the
+# gunicorn master (preload_app) and forked. Each worker warms up here before
+# taking traffic and drains on the way out (see gunicorn.conf.py).
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.warmup_enabled:
+        await warmup.warm_up(app)
+    decay_task = None
+    if settings.trending_decay_interval_seconds > 0:
+        decay_task = asyncio.create_task(trending.run_decay_task())
+    yield
+    if decay_task is not None:
+        decay_task.cancel()
+    # Votes still waiting in the write-behind buffer
+    await vote_buffer.close()
+    utils.shutdown_hash_pool()
+    images.shutdown_image_pool()
+    if async_engine is not None:
+        await async_engine.dispose()
+    engine.dispose()
+    for replica in replicas:
+        await replica.dispose()
+
+
+app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=InstrumentedJSONResponse if settings.instrumentation_enabled else FastJSONResponse,
+)
 origins = ["*"]
 
 app.add_middleware(
@@ -17,15 +52,61 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified", "Retry-After",
+                    "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "RateLimit-Policy"],
 )
 
+if settings.instrumentation_enabled:
+    instrument_engine(engine)
+    if async_engine is not None:
+        instrument_engine(async_engine.sync_engine)
+    for replica in replicas:
+        instrument_engine(replica.engine)
+        if replica.async_engine is not None:
+            instrument_engine(replica.async_engine.sync_engine)
+    app.add_middleware(InstrumentationMiddleware)
+
+# Reads after a write go to the primary (app/replicas.py)
+if replicas:
+    app.add_middleware(ReadYourWritesMiddleware)
+
 app.include_router(post.router)
+app.include_router(bulk.router)
 # app.include_router(user.router)
 app.include_router(auth.router)
 app.include_router(vote.router)
 app.include_router(admin.router)
 app.include_router(comments.router)
+app.include_router(media.router)
+app.include_router(feed.router)
 
 @app.get("/")
 def root():
     return {"message" : "hello world"}
+
+
+# Connection pool usage: checked-out connections, overflow, checkout wait-time
+# histogram and checkout timeouts
+@app.get("/metrics/pool")
+def pool_metrics():
+    pools = {"sync": pool_status(engine.pool)}
+    if async_engine is not None:
+        pools["async"] = pool_status(async_engine.pool)
+    for index, replica in enumerate(replicas):
+        pools[f"replica{index}"] = pool_status(replica.engine.pool)
+        if replica.async_engine is not None:
+            pools[f"replica{index}_async"] = pool_status(replica.async_engine.pool)
+    return pools
+
+
+
+# Per-route histograms in the Prometheus text format (instrumentation_enabled)
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(route_metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# Response cache hit/miss counters
+@app.get("/metrics/cache")
+def cache_metrics():
+    return response_cache.stats()
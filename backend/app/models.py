@@ -1,6 +1,7 @@
 # models.py
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, Boolean, TIMESTAMP, text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, Boolean, TIMESTAMP, text, Index, JSON, Float
+from sqlalchemy.orm import relationship, deferred, synonym
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from .database import Base
 import enum
 
@@ -16,6 +17,10 @@ class User(Base):
     email = Column(String, unique=True, nullable=False)
     password = Column(String, nullable=False)
     role = Column(String, nullable=False, server_default="viewer")
+    # Bumped to revoke every access token issued so far
+    token_version = Column(Integer, nullable=False, server_default="0")
+    # Rows in follows with this user as followee, maintained by the follow endpoints
+    follower_count = Column(Integer, nullable=False, server_default="0")
     created_at = Column(TIMESTAMP(timezone=True), server_default=text("now()"), nullable=False)
 
     posts = relationship("Post", back_populates="owner", cascade="all, delete-orphan", passive_deletes=True)
@@ -32,10 +37,40 @@ class Post(Base):
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(TIMESTAMP(timezone=True), server_default=text("now()"), nullable=False)
     photo_path = Column(String, nullable=True)
-
-    owner = relationship("User", back_populates="posts")
+    # Resized, metadata-free renditions of the photo by name (thumbnail, medium, ...)
+    photo_variants = Column(JSON, nullable=True)
+    # Number of rows in votes for this post, maintained by the vote endpoint in
+    # the same transaction (rebuild with `python -m app.reconcile_votes`)
+    vote_count = Column(Integer, nullable=False, server_default="0")
+    vote = synonym("vote_count")
+    # Time-decayed activity score for the trending feed, see app/trending.py
+    hot_score = Column(Float, nullable=False, server_default="0")
+    hot_updated_at = Column(TIMESTAMP(timezone=True), server_default=text("now()"), nullable=False)
+    # Weighted title/content tsvector, maintained by the posts_search_vector_update
+    # trigger on Postgres; never loaded unless asked for.
+    search_vector = deferred(Column(TSVECTOR().with_variant(Text(), "sqlite"), nullable=True))
+
+    owner = relationship("User", back_populates="posts", lazy="joined")
     comments = relationship("Comment", back_populates="post", cascade="all, delete-orphan", passive_deletes=True)
 
+    # Keyset pagination of the feed: ORDER BY created_at DESC, id DESC
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),
+        # Trending feed: published posts ORDER BY hot_score DESC, id DESC
+        Index("ix_posts_hot_score_id", "hot_score", "id",
+              postgresql_where=text("published"), sqlite_where=text("published")),
+        # Personal feed, writers read on demand: WHERE owner_id IN (...) ORDER BY created_at DESC.
+        # Also serves the owner_id foreign key (ON DELETE CASCADE from users).
+        Index("ix_posts_owner_id_created_at", "owner_id", "created_at"),
+        # Published-only feeds: WHERE published ORDER BY created_at DESC, id DESC
+        Index("ix_posts_published_created_at_id", "created_at", "id",
+              postgresql_where=text("published"), sqlite_where=text("published")),
+        # /uploads authorization: the post a photo belongs to
+        Index("ix_posts_photo_path", "photo_path",
+              postgresql_where=text("photo_path IS NOT NULL"), sqlite_where=text("photo_path IS NOT NULL")),
+    )
+
 
 class Comment(Base):
     __tablename__ = "comments"
@@ -45,17 +80,66 @@ class Comment(Base):
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(TIMESTAMP(timezone=True), server_default=text("now()"), nullable=False)
+    # Replies: the comment being answered, NULL for top-level comments
+    parent_id = Column(Integer, ForeignKey("comments.id", ondelete="CASCADE"), nullable=True)
+    # Materialized path: the zero-padded ids from the top-level comment down to
+    # this one ("0000000012.0000000045"). A subtree is a range scan on the path
+    # and sorting by it gives depth-first thread order. Byte-wise collation on
+    # Postgres so the range and ordering ignore the locale.
+    path = Column(String().with_variant(String(collation="C"), "postgresql"), nullable=False)
+    depth = Column(Integer, nullable=False, server_default="0")
+    # Number of direct replies, maintained by create_comment
+    reply_count = Column(Integer, nullable=False, server_default="0")
 
     user = relationship("User", back_populates="comments")
     post = relationship("Post", back_populates="comments")
 
+    # Keyset pagination of a post's top-level comments: WHERE post_id = ? AND
+    # parent_id IS NULL ORDER BY created_at, id, without stepping over replies
+    # A post's comments in thread order: WHERE post_id = ? ORDER BY path
+    # The oldest replies of a comment: WHERE parent_id = ? ORDER BY created_at, id
+    # LIMIT breadth. These and ix_comments_user_id serve the foreign keys
+    # (cascades, bulk user deletion); only replies have a parent.
+    __table_args__ = (
+        Index("ix_comments_top_level_post_id_created_at_id", "post_id", "created_at", "id",
+              postgresql_where=text("parent_id IS NULL"), sqlite_where=text("parent_id IS NULL")),
+        Index("ix_comments_post_id_path", "post_id", "path"),
+        Index("ix_comments_user_id", "user_id"),
+        Index("ix_comments_parent_id_created_at_id", "parent_id", "created_at", "id",
+              postgresql_where=text("parent_id IS NOT NULL"), sqlite_where=text("parent_id IS NOT NULL")),
+    )
+
+    PATH_DIGITS = 10
+
+    @classmethod
+    def path_segment(cls, id: int) -> str:
+        return str(id).zfill(cls.PATH_DIGITS)
+
 class Vote(Base):
     __tablename__ = "votes"
 
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
     post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
 
+    # The primary key leads with user_id; counting or cascading by post needs its own index
+    __table_args__ = (
+        Index("ix_votes_post_id", "post_id"),
+    )
+
     user = relationship("User")
     post = relationship("Post")
 
 
+
+
+class Follow(Base):
+    __tablename__ = "follows"
+
+    follower_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    followee_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=text("now()"), nullable=False)
+
+    # Followers of a writer, for fan-out when they post
+    __table_args__ = (
+        Index("ix_follows_followee_id", "followee_id"),
+    )
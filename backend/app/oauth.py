@@ -1,12 +1,18 @@
 from jose import JWTError , jwt
 from datetime import datetime, timedelta
+from typing import Optional
 from .import schemas , models , database
 from fastapi import Depends , status , HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from .config import settings
+from .ttl_cache import TTLCache
 
 
 ouath_scheme  = OAuth2PasswordBearer(tokenUrl='login')
+# Same, for routes anonymous clients may use too
+optional_oauth_scheme = OAuth2PasswordBearer(tokenUrl='login', auto_error=False)
 
 #SECRET_KEY
 #Algorithm
@@ -28,6 +34,13 @@ def create_access_token(data : dict):
 
 
 
+def create_user_token(user: models.User):
+    # Role and token version ride along in the token so that most requests can
+    # be authorized without touching the users table.
+    return create_access_token(data = {"user_id": user.id, "role": user.role, "ver": user.token_version})
+
+
+
 def verify_access_token(token:str , credentials_exception):
     try:
 
@@ -37,24 +50,78 @@ def verify_access_token(token:str , credentials_exception):
 
         if id is None:
             raise credentials_exception
-        token_data = schemas.TokenData(id = str(id))
+        token_data = schemas.TokenData(id = id, role = payload.get("role"), ver = payload.get("ver", 0))
 
     except JWTError:
         raise credentials_exception
     
     return token_data
 
-def get_current_user(token: str  = Depends(ouath_scheme), db: Session = Depends(database.get_db)):
+
+# Detached User rows by id. Entries live for user_cache_ttl_seconds, which is
+# also how long another worker may keep accepting a token revoked elsewhere;
+# revocations made in this process take effect immediately.
+_user_cache = TTLCache(maxsize=4096, ttl=settings.user_cache_ttl_seconds)
+
+
+async def _load_user(user_id: int, db: AsyncSession):
+    user = _user_cache.get(user_id)
+    if user is None:
+        user = await db.scalar(select(models.User).where(models.User.id == user_id))
+        if user is None:
+            return None
+        db.expunge(user)
+        _user_cache.set(user_id, user)
+    return user
+
+
+def evict_user(user_id: int):
+    _user_cache.pop(user_id)
+
+
+async def revoke_tokens(db: AsyncSession, user_id: int):
+    # Invalidate every token issued to the user so far; the caller commits.
+    await db.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(token_version=models.User.token_version + 1)
+    )
+    evict_user(user_id)
+
+
+async def get_token_data(token: str  = Depends(ouath_scheme), db: AsyncSession = Depends(database.get_db)):
+    # Authorize from the token claims. The only lookup is the token version of
+    # the user, which comes from the TTL cache on all but the first request.
     credentials_exception = HTTPException(status_code= status.HTTP_401_UNAUTHORIZED,
                         detail=f"could not validate credentials", headers={"WWW-Authenticate":"Bearer"})
-    
-    token = verify_access_token(token, credentials_exception)
 
-    user = db.query(models.User).filter(models.User.id == token.id).first()
-    return user
+    token_data = verify_access_token(token, credentials_exception)
+
+    user = await _load_user(token_data.id, db)
+    if user is None or token_data.ver != user.token_version:
+        raise credentials_exception
+
+    # Tokens issued before roles were embedded
+    if token_data.role is None:
+        token_data.role = user.role
+    return token_data
+
+
+async def get_optional_token_data(token: Optional[str] = Depends(optional_oauth_scheme),
+                                  db: AsyncSession = Depends(database.get_db)):
+    # None for anonymous requests; an invalid token is still a 401
+    if token is None:
+        return None
+    return await get_token_data(token, db)
+
+
+async def get_current_user(token_data: schemas.TokenData = Depends(get_token_data), db: AsyncSession = Depends(database.get_db)):
+    # For the few routes that need the ORM row: attach the cached copy to this
+    # session without another SELECT.
+    return await db.merge(await _load_user(token_data.id, db), load=False)
 
 def require_role(*roles):
-    def role_checker(user: models.User = Depends(get_current_user)):
+    async def role_checker(user: schemas.TokenData = Depends(get_token_data)):
         if user.role not in roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not permitted")
         return user
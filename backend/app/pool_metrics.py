@@ -0,0 +1,87 @@
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+# Upper bounds (seconds) of the checkout wait-time histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class PoolMetrics:
+    """Checkout wait times and failures of one connection pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bucket_counts = [0] * len(WAIT_BUCKETS)
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        self.checkout_failures = 0
+
+    def observe_wait(self, seconds: float):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_sum += seconds
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if seconds <= bound:
+                    self.bucket_counts[i] += 1
+                    break
+
+    def record_failure(self):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def snapshot(self):
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(WAIT_BUCKETS, self.bucket_counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = self.wait_count
+            return {
+                "checkout_failures": self.checkout_failures,
+                "wait_seconds": {"count": self.wait_count, "sum": round(self.wait_sum, 6), "buckets": buckets},
+            }
+
+
+class _InstrumentedPoolMixin:
+    # _do_get is where a checkout blocks waiting for a free connection (or opens
+    # a new one), so timing it gives the wait each request pays for the pool.
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_failure()
+            raise
+        self.metrics.observe_wait(time.perf_counter() - start)
+        return conn
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_status(pool):
+    status = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status.update(metrics.snapshot())
+    return status
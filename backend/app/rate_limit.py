@@ -0,0 +1,227 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.security.oauth2 import OAuth2PasswordRequestForm
+
+from . import oauth, schemas
+from .config import settings
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # optional, only needed for rate_limit_backend = "redis"
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Rate limits for the endpoints worth abusing: login (a bcrypt verify per
+# attempt), votes and comments.
+#
+# Every policy is a token bucket of `limit` tokens refilled over `period`
+# seconds, kept per key (client IP, user id, login name, or login name and IP). Buckets are
+# stored as a single "theoretical arrival time" (GCRA): every request pushes it one
+# interval (period / limit) further, and a request that would push it more
+# than one period past now is refused. A check is O(1) and a key is one
+# float, in memory or in Redis.
+#
+# Allowed responses carry RateLimit-Limit / -Remaining / -Reset and
+# RateLimit-Policy for the tightest policy of the route; refused ones are a
+# 429 with the same headers and Retry-After.
+#
+# The client IP is request.client.host; behind a proxy run uvicorn with
+# --proxy-headers (and --forwarded-allow-ips) so that it is the real client.
+
+PERIODS = {"s": 1, "second": 1, "m": 60, "minute": 60, "h": 3600, "hour": 3600, "d": 86400, "day": 86400}
+SHARDS = 16
+
+
+def parse_rate(rate: str):
+    # "10/minute" -> (10, 60.0); "" -> None, no limit
+    if not rate:
+        return None
+    count, _, period = rate.partition("/")
+    try:
+        return int(count), float(PERIODS[period.strip().lower()])
+    except (KeyError, ValueError):
+        raise ValueError(f"invalid rate {rate!r}, expected '<count>/<second|minute|hour|day>'")
+
+
+class Decision:
+    __slots__ = ("allowed", "limit", "period", "remaining", "reset", "retry_after")
+
+    def __init__(self, allowed, limit, period, remaining, reset, retry_after=0.0):
+        self.allowed = allowed
+        self.limit = limit
+        self.period = period
+        self.remaining = remaining
+        self.reset = reset  # seconds until the bucket is full again
+        self.retry_after = retry_after
+
+    def headers(self):
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset)),
+            "RateLimit-Policy": f"{self.limit};w={int(self.period)}",
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def _decide(tat, now, limit, period):
+    # (new arrival time to store or None, Decision) for a bucket whose stored
+    # arrival time is `tat`
+    interval = period / limit
+    tat = max(tat, now)
+    allow_at = tat + interval - period
+    if now < allow_at:
+        return None, Decision(False, limit, period, 0, tat - now, allow_at - now)
+    tat += interval
+    return tat, Decision(True, limit, period, int((period - (tat - now)) / interval + 1e-9), tat - now)
+
+
+class MemoryBackend:
+    """Buckets of this process, in SHARDS LRU maps with a lock each.
+
+    At most max_keys buckets are kept; the least recently used are evicted
+    first, which at worst hands a quiet key a full bucket early.
+    """
+
+    def __init__(self, max_keys: int):
+        self._max_per_shard = max(1, max_keys // SHARDS)
+        self._shards = [(threading.Lock(), OrderedDict()) for _ in range(SHARDS)]
+
+    async def hit(self, key, limit, period):
+        lock, buckets = self._shards[hash(key) % SHARDS]
+        now = time.monotonic()
+        with lock:
+            tat, decision = _decide(buckets.get(key, now), now, limit, period)
+            if tat is not None:
+                buckets[key] = tat
+                buckets.move_to_end(key)
+                if len(buckets) > self._max_per_shard:
+                    buckets.popitem(last=False)
+        return decision
+
+    async def clear(self):
+        for lock, buckets in self._shards:
+            with lock:
+                buckets.clear()
+
+
+class RedisBackend:
+    # Shared by every worker; the bucket is updated by a Lua script using the
+    # server's clock, so it is atomic and immune to clock skew between workers.
+    # Works with Redis and API-compatible servers (KeyDB, Dragonfly, Valkey).
+
+    SCRIPT = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local interval = tonumber(ARGV[1])
+    local period = tonumber(ARGV[2])
+    local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+    local allow_at = tat + interval - period
+    if now < allow_at then
+        return {0, tostring(tat - now), tostring(allow_at - now)}
+    end
+    tat = tat + interval
+    redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tat - now) * 1000))
+    return {1, tostring(tat - now), '0'}
+    """
+
+    def __init__(self, url: str, prefix: str = "blog:ratelimit:"):
+        if redis is None:
+            raise RuntimeError("rate_limit_backend 'redis' requires the redis package")
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+        self._prefix = prefix
+
+    async def hit(self, key, limit, period):
+        interval = period / limit
+        allowed, reset, retry_after = await self._script(keys=[self._prefix + key], args=[interval, period])
+        reset, retry_after = float(reset), float(retry_after)
+        if not allowed:
+            return Decision(False, limit, period, 0, reset, retry_after)
+        return Decision(True, limit, period, int((period - reset) / interval + 1e-9), reset)
+
+    async def clear(self):
+        async for key in self._client.scan_iter(match=f"{self._prefix}*"):
+            await self._client.delete(key)
+
+
+class Policy:
+    def __init__(self, name: str, rate: str):
+        self.name = name
+        self.rate = parse_rate(rate)
+
+
+def _create_backend():
+    if settings.rate_limit_backend == "redis":
+        return RedisBackend(settings.rate_limit_redis_url or settings.cache_redis_url)
+    return MemoryBackend(settings.rate_limit_max_keys)
+
+
+backend = _create_backend()
+
+LOGIN_IP = Policy("login:ip", settings.rate_limit_login_ip)
+LOGIN_ACCOUNT = Policy("login:account", settings.rate_limit_login_account)
+LOGIN_USERNAME = Policy("login:username", settings.rate_limit_login_username)
+VOTE_USER = Policy("vote:user", settings.rate_limit_vote_user)
+COMMENT_IP = Policy("comment:ip", settings.rate_limit_comment_ip)
+COMMENT_USER = Policy("comment:user", settings.rate_limit_comment_user)
+
+
+def client_ip(request: Request):
+    return request.client.host if request.client else "unknown"
+
+
+async def enforce(response: Response, *checks):
+    """Take a token from each (policy, key) bucket; 429 when any is empty."""
+    if not settings.rate_limit_enabled:
+        return
+    tightest = None
+    for policy, key in checks:
+        if policy.rate is None:
+            continue
+        try:
+            decision = await backend.hit(f"{policy.name}:{key}", *policy.rate)
+        except Exception:
+            # A rate limiter outage should not take logins down with it
+            logger.exception("rate limit check failed, allowing the request")
+            continue
+        if not decision.allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please retry later",
+                headers=decision.headers(),
+            )
+        if tightest is None or decision.remaining < tightest.remaining:
+            tightest = decision
+    if tightest is not None:
+        response.headers.update(tightest.headers())
+
+
+# Dependencies for the routers. The form and the token data are the ones the
+# endpoints ask for, so they are parsed / loaded once per request.
+
+async def limit_login(request: Request, response: Response, form: OAuth2PasswordRequestForm = Depends()):
+    # The tight account bucket is per client IP too, or anyone could lock a user
+    # out by failing logins under their name. The looser one per login name
+    # alone caps guessing spread over many IPs, at the price of a lockout that
+    # takes that many attempts to cause.
+    ip = client_ip(request)
+    username = form.username.strip().lower()
+    await enforce(response, (LOGIN_IP, ip), (LOGIN_ACCOUNT, f"{ip}:{username}"), (LOGIN_USERNAME, username))
+
+
+async def limit_vote(response: Response, user: schemas.TokenData = Depends(oauth.get_token_data)):
+    await enforce(response, (VOTE_USER, user.id))
+
+
+async def limit_comment(request: Request, response: Response,
+                        user: schemas.TokenData = Depends(oauth.get_token_data)):
+    await enforce(response, (COMMENT_IP, client_ip(request)), (COMMENT_USER, user.id))
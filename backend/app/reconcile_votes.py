@@ -0,0 +1,28 @@
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from app import models
+from app.database import SessionLocal
+
+
+def reconcile_vote_counts(db: Session):
+    # Rebuild posts.vote_count from the votes table, touching only drifted rows
+    actual = (
+        select(func.count(models.Vote.post_id))
+        .where(models.Vote.post_id == models.Post.id)
+        .correlate(models.Post)
+        .scalar_subquery()
+    )
+    result = db.execute(
+        update(models.Post)
+        .where(models.Post.vote_count != actual)
+        .values(vote_count=actual)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+
+if __name__ == "__main__":
+    with SessionLocal() as db:
+        fixed = reconcile_vote_counts(db)
+    print(f"✅ Vote counts reconciled, {fixed} post(s) corrected")
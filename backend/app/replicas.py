@@ -0,0 +1,210 @@
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import Request
+from fastapi.security.utils import get_authorization_scheme_param
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+
+from . import oauth
+from .cache import response_cache
+from .config import settings
+from .database import ASYNC_DRIVERS, AsyncSessionLocal, SessionLocal, ThreadedSession, _engine_options, session_scope
+from .pool_metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+from .ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Read replicas (database_replica_urls).
+#
+# The public read endpoints take their session from get_read_db, which hands
+# out the replicas in turn; writes and everything else stay on the primary
+# (get_db). A replica whose replication lag is above
+# replica_lag_tolerance_seconds, or that cannot be reached, is skipped until
+# its next lag check, and reads fall back to the primary when no replica is
+# left.
+#
+# Read-your-own-writes: ReadYourWritesMiddleware notes the user behind every
+# successful write (from the bearer token), and that user reads from the
+# primary for the next replica_lag_tolerance_seconds, after which every replica
+# still in rotation has the write. The note goes to the response cache backend
+# when it is shared between workers, and stays in this process otherwise.
+#
+# A replica may not have a write yet when the write's invalidation has already
+# happened. Pages read from a replica are therefore cached under the cache
+# version of replica_lag_tolerance_seconds ago, so invalidations within that
+# window still apply to them, and for that long at most. Users reading from
+# the primary bypass the response cache, which may hold such pages.
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Lag in seconds; a standby that has replayed everything it received is
+# caught up, or an idle primary would look like a growing lag
+LAG_QUERIES = {
+    "postgresql": text(
+        "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+        "THEN 0 ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END"
+    ),
+}
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = make_url(url)
+        self.engine = create_engine(self.url, **_engine_options(InstrumentedQueuePool))
+        self.async_engine = (
+            create_async_engine(
+                self.url.set(drivername=ASYNC_DRIVERS.get(self.url.get_backend_name(), self.url.drivername)),
+                **_engine_options(InstrumentedAsyncQueuePool, is_async=True),
+            )
+            if settings.database_async else None
+        )
+        self.lag = 0.0
+        self.checked_at = -math.inf
+
+    def _lag_sync(self, query):
+        with self.engine.connect() as conn:
+            return conn.scalar(query)
+
+    async def measure_lag(self):
+        query = LAG_QUERIES.get(self.engine.dialect.name)
+        if query is None:
+            # No replication to measure (e.g. SQLite files in development)
+            return 0.0
+        try:
+            if self.async_engine is not None:
+                async with self.async_engine.connect() as conn:
+                    lag = await conn.scalar(query)
+            else:
+                lag = await run_in_threadpool(self._lag_sync, query)
+        except Exception:
+            logger.warning("replica %s is unreachable", self.url.render_as_string(), exc_info=True)
+            return math.inf
+        return float(lag or 0)
+
+    async def available(self):
+        now = time.monotonic()
+        if now - self.checked_at >= settings.replica_lag_check_seconds:
+            # Other requests keep using the last measurement meanwhile
+            self.checked_at = now
+            self.lag = await self.measure_lag()
+            if math.isfinite(self.lag) and self.lag > settings.replica_lag_tolerance_seconds:
+                logger.warning("replica %s is %.1fs behind, reading from the primary",
+                               self.url.render_as_string(), self.lag)
+        return self.lag <= settings.replica_lag_tolerance_seconds
+
+    @asynccontextmanager
+    async def session(self):
+        if self.async_engine is not None:
+            async with AsyncSessionLocal(bind=self.async_engine) as db:
+                yield db
+        else:
+            db = ThreadedSession(SessionLocal(bind=self.engine, expire_on_commit=False))
+            try:
+                yield db
+            finally:
+                await db.close()
+
+    async def dispose(self):
+        self.engine.dispose()
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+
+
+replicas = [Replica(url) for url in settings.database_replica_urls]
+_turn = itertools.count()
+
+
+async def pick_replica():
+    if not replicas:
+        return None
+    start = next(_turn)
+    for offset in range(len(replicas)):
+        replica = replicas[(start + offset) % len(replicas)]
+        if await replica.available():
+            return replica
+    return None
+
+
+# User ids that wrote within the last replica_lag_tolerance_seconds, when the
+# response cache backend is not shared
+_recent_writers = TTLCache(maxsize=100_000, ttl=settings.replica_lag_tolerance_seconds)
+
+
+def _token_user_id(authorization):
+    # Only the signature and expiry are checked: a revoked token merely reads
+    # from the primary for a while
+    scheme, token = get_authorization_scheme_param(authorization)
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return oauth.verify_access_token(token, ValueError).id
+    except ValueError:
+        return None
+
+
+async def note_write(user_id: int):
+    backend = response_cache.backend
+    if backend is not None and backend.shared:
+        await backend.set(f"primary:{user_id}", 1, settings.replica_lag_tolerance_seconds)
+    else:
+        _recent_writers.set(user_id, True, settings.replica_lag_tolerance_seconds)
+
+
+async def reads_from_primary(request: Request):
+    user_id = _token_user_id(request.headers.get("authorization"))
+    if user_id is None:
+        return False
+    backend = response_cache.backend
+    if backend is not None and backend.shared:
+        return await backend.get(f"primary:{user_id}") is not None
+    return _recent_writers.get(user_id) is not None
+
+
+async def get_read_db(request: Request):
+    # get_db for endpoints that only read
+    replica = None
+    if await reads_from_primary(request):
+        request.state.cache_bypass = True
+    else:
+        replica = await pick_replica()
+    if replica is None:
+        async with session_scope() as db:
+            yield db
+    else:
+        request.state.cache_lag = settings.replica_lag_tolerance_seconds
+        request.state.cache_ttl = min(settings.replica_lag_tolerance_seconds, settings.cache_ttl_seconds)
+        async with replica.session() as db:
+            yield db
+
+
+class ReadYourWritesMiddleware:
+    # Pure ASGI, so streaming responses pass through untouched
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        user_id = _token_user_id(Headers(scope=scope).get("authorization"))
+        if user_id is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_noting_write(message):
+            # Noted before the response goes out, so the client's next read
+            # already sees it
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                await note_write(user_id)
+            await send(message)
+
+        await self.app(scope, receive, send_noting_write)
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends ,UploadFile, File , HTTPException , status
-from sqlalchemy.orm import Session
+from functools import partial
+
+from fastapi import APIRouter, Depends ,UploadFile, File , HTTPException , status , Request , BackgroundTasks , Response
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 from .. import schemas, models, oauth, database
 from ..oauth import require_role, create_access_token
-from ..database import get_db
+from ..database import get_db, session_scope
+from ..cache import response_cache
+from ..config import settings
+from ..jobs import create_job, get_job, run_chunked
+from ..storage import storage, store_upload, iter_upload_file, check_upload
+from ..images import process_post_photo
 from  app.routers.post import require_admin_or_writer 
 from app import utils as utils
-import shutil
-import os
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
@@ -29,33 +36,34 @@ router = APIRouter(prefix="/admin", tags=["Admin"])
 #     return user
 
 
+# bcrypt runs in the hash process pool rather than on the event loop
 @router.post("/register", response_model=schemas.UserResponse)
-def register_blog_writer(user_data: schemas.UserCreate, db: Session = Depends(database.get_db)):
+async def register_blog_writer(user_data: schemas.UserCreate, db: AsyncSession = Depends(database.get_db)):
     # Only allow 'admin' role if it doesn't exist yet
     if user_data.role == models.Role.admin:
-        existing_admin = db.query(models.User).filter(models.User.role == models.Role.admin).first()
+        existing_admin = await db.scalar(select(models.User.id).where(models.User.role == models.Role.admin))
         if existing_admin:
             raise HTTPException(status_code=403, detail="Admin already exists. Cannot register another admin.")
 
     # Check if the email is already registered
-    existing_user = db.query(models.User).filter(models.User.email == user_data.email).first()
+    existing_user = await db.scalar(select(models.User.id).where(models.User.email == user_data.email))
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Hash password and create user
-    hashed_password = utils.hash(user_data.password)
+    hashed_password = await utils.hash_async(user_data.password)
     new_user = models.User(email=user_data.email, password=hashed_password, role=user_data.role)
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 @router.delete("/user/{user_id}")
-def delete_user(
+async def delete_user(
     user_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(oauth.get_current_user)  # get logged-in user
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenData = Depends(oauth.get_token_data)  # get logged-in user
 ):
     # Only admin can delete
     if current_user.role != models.Role.admin:
@@ -64,52 +72,245 @@ def delete_user(
             detail="Only admin is permitted to delete users"
         )
 
-    # Fetch the user to delete
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
+    # Only the id is needed: posts, comments and votes go with the ON DELETE
+    # CASCADE foreign keys instead of being loaded into the session
+    exists = await db.scalar(select(models.User.id).where(models.User.id == user_id))
+    if not exists:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
 
-    db.delete(user)
-    db.commit()
+    await _delete_users(db, [user_id])
 
     return {"message": f"User with id {user_id} deleted successfully"}
 
 
-# Upload post photo (Admin & Blog Writer)
-@router.post("/posts/{id}/upload-photo")
-def upload_post_photo(
-    id: int,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(require_admin_or_writer)
+# Change a user's role (Admin only); tokens carrying the old role stop working
+@router.patch("/user/{user_id}/role", response_model=schemas.UserResponse)
+async def change_user_role(
+    user_id: int,
+    role_data: schemas.RoleUpdate,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenData = Depends(oauth.require_role(models.Role.admin))
+):
+    user = await db.get(models.User, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    user.role = role_data.role
+    await oauth.revoke_tokens(db, user_id)
+    await db.commit()
+    await db.refresh(user)
+    # The role is part of the owner/author embedded in cached pages
+    await response_cache.invalidate("posts", "comments")
+    return user
+
+
+async def _delete_users(db: AsyncSession, ids):
+    # The users' votes cascade away with them, so take them off the counters of
+    # the posts they were cast on first (posts of the users themselves are deleted anyway)
+    removed_votes = (
+        select(func.count())
+        .select_from(models.Vote)
+        .where(models.Vote.post_id == models.Post.id, models.Vote.user_id.in_(ids))
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(models.Post)
+        .where(
+            models.Post.id.in_(select(models.Vote.post_id).where(models.Vote.user_id.in_(ids))),
+            models.Post.owner_id.not_in(ids),
+        )
+        .values(vote_count=models.Post.vote_count - removed_votes)
+        .execution_options(synchronize_session=False)
+    )
+    # Likewise for replies they posted under other people's comments
+    reply = aliased(models.Comment)
+    removed_replies = (
+        select(func.count())
+        .select_from(reply)
+        .where(reply.parent_id == models.Comment.id, reply.user_id.in_(ids))
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(models.Comment)
+        .where(
+            models.Comment.id.in_(select(reply.parent_id).where(reply.user_id.in_(ids))),
+            models.Comment.user_id.not_in(ids),
+        )
+        .values(reply_count=models.Comment.reply_count - removed_replies)
+        .execution_options(synchronize_session=False)
+    )
+    # And for the writers they followed
+    removed_follows = (
+        select(func.count())
+        .select_from(models.Follow)
+        .where(models.Follow.followee_id == models.User.id, models.Follow.follower_id.in_(ids))
+        .scalar_subquery()
+    )
+    await db.execute(
+        update(models.User)
+        .where(
+            models.User.id.in_(select(models.Follow.followee_id).where(models.Follow.follower_id.in_(ids))),
+            models.User.id.not_in(ids),
+        )
+        .values(follower_count=models.User.follower_count - removed_follows)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        delete(models.User).where(models.User.id.in_(ids)).execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    for user_id in ids:
+        oauth.evict_user(user_id)
+    await response_cache.invalidate("posts", "comments")
+
+
+async def _change_roles(db: AsyncSession, ids, role: models.Role):
+    # Same as change_user_role, one UPDATE for the whole chunk
+    await db.execute(
+        update(models.User)
+        .where(models.User.id.in_(ids))
+        .values(role=role, token_version=models.User.token_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    for user_id in ids:
+        oauth.evict_user(user_id)
+    await response_cache.invalidate("posts", "comments")
+
+
+def _select_user_ids(selection: schemas.BulkUserSelection, current_user: schemas.TokenData):
+    # Admins never select themselves, so a broad filter can't lock them out
+    query = select(models.User.id).where(models.User.id != current_user.id).order_by(models.User.id)
+    if selection.ids is not None:
+        query = query.where(models.User.id.in_(selection.ids))
+    if selection.role is not None:
+        query = query.where(models.User.role == selection.role)
+    if selection.created_before is not None:
+        query = query.where(models.User.created_at < selection.created_before)
+    return query
+
+
+async def _run_in_background(job, ids, handle_chunk):
+    async with session_scope() as db:
+        await run_chunked(job, ids, settings.bulk_batch_size, partial(handle_chunk, db))
+
+
+async def _start_bulk_job(kind, ids, handle_chunk, db, background_tasks: BackgroundTasks, response: Response):
+    # Up to bulk_batch_size users are handled before responding; larger
+    # selections run in chunks after a 202, with progress at /admin/jobs/{id}
+    job = await create_job(kind, len(ids))
+    if len(ids) <= settings.bulk_batch_size:
+        await run_chunked(job, ids, settings.bulk_batch_size, partial(handle_chunk, db))
+        if job.status == "failed":
+            response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    else:
+        background_tasks.add_task(_run_in_background, job, ids, handle_chunk)
+        response.status_code = status.HTTP_202_ACCEPTED
+        response.headers["Location"] = f"/admin/jobs/{job.id}"
+    return job
+
+
+# Delete every user matching the selection along with their posts, comments and votes (Admin only)
+@router.post("/users/bulk-delete", response_model=schemas.JobStatus)
+async def bulk_delete_users(
+    selection: schemas.BulkUserSelection,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenData = Depends(oauth.require_role(models.Role.admin))
+):
+    ids = list(await db.scalars(_select_user_ids(selection, current_user)))
+    return await _start_bulk_job("delete_users", ids, _delete_users, db, background_tasks, response)
+
+
+# Change the role of every user matching the selection (Admin only)
+@router.post("/users/bulk-role", response_model=schemas.JobStatus)
+async def bulk_change_roles(
+    role_data: schemas.BulkRoleUpdate,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenData = Depends(oauth.require_role(models.Role.admin))
+):
+    ids = list(await db.scalars(_select_user_ids(role_data, current_user)))
+    handle_chunk = partial(_change_roles, role=role_data.new_role)
+    return await _start_bulk_job("change_roles", ids, handle_chunk, db, background_tasks, response)
+
+
+@router.get("/jobs/{job_id}", response_model=schemas.JobStatus)
+async def get_job_status(
+    job_id: str,
+    current_user: schemas.TokenData = Depends(oauth.require_role(models.Role.admin))
 ):
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+async def _get_own_post(db: AsyncSession, id: int, current_user: schemas.TokenData):
     # Check if post exists
-    post = db.query(models.Post).filter(models.Post.id == id).first()
+    post = await db.get(models.Post, id)
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
 
     # Blog Writer can upload only for their own posts
     if current_user.role == models.Role.blog_writer and post.owner_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to upload photo for this post")
+    return post
 
-    # Create a folder if it doesn't exist
-    upload_dir = "uploads/posts"
-    os.makedirs(upload_dir, exist_ok=True)
 
-    # Save file to disk
-    file_path = os.path.join(upload_dir, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+async def _set_post_photo(db: AsyncSession, post: models.Post, key: str, background_tasks: BackgroundTasks):
+    # Save path to database; variants of the previous photo no longer apply
+    post.photo_path = storage.url(key)
+    post.photo_variants = None
+    await db.commit()
+    await response_cache.invalidate(f"post:{post.id}")
 
-    # Save path to database
-    post.photo_path = file_path
-    db.commit()
-    db.refresh(post)
+    # Thumbnails and WebP renditions are built after the response is sent
+    background_tasks.add_task(process_post_photo, post.id, key)
 
     return {
         "detail": "Photo uploaded successfully",
         "file_path": post.photo_path
-    }
\ No newline at end of file
+    }
+
+
+# Upload post photo (Admin & Blog Writer)
+# Files are stored under the SHA-256 of their content, so re-uploading the same
+# image reuses the stored copy and different images can never overwrite each other.
+@router.post("/posts/{id}/upload-photo")
+async def upload_post_photo(
+    id: int,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.TokenData = Depends(require_admin_or_writer)
+):
+    post = await _get_own_post(db, id, current_user)
+    key = await store_upload(iter_upload_file(file), file.content_type)
+    return await _set_post_photo(db, post, key, background_tasks)
+
+
+# Streaming variant: the request body is the image itself (Content-Type image/*).
+# Nothing is spooled before the handler runs, so oversized uploads are refused
+# from Content-Length or as soon as the limit is crossed.
+@router.put("/posts/{id}/photo")
+async def put_post_photo(
+    id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    current_user: schemas.TokenData = Depends(require_admin_or_writer)
+):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    check_upload(content_type, request.headers.get("content-length"))
+    post = await _get_own_post(db, id, current_user)
+    key = await store_upload(request.stream(), content_type)
+    return await _set_post_photo(db, post, key, background_tasks)
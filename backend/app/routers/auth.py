@@ -1,24 +1,35 @@
 from fastapi import APIRouter , Depends , status , HTTPException , Response
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..import database , schemas , models , utils , oauth
+from ..rate_limit import limit_login
 
 router = APIRouter(tags = ['Authentication'])
 
-@router.post("/login", response_model= schemas.Token)
-def login(user_credentials : OAuth2PasswordRequestForm=Depends() ,db : Session = Depends(database.get_db)):
-  user = db.query(models.User).filter(models.User.email == user_credentials.username).first()
+# bcrypt runs in the hash process pool, so the event loop is never blocked.
+# Attempts are rate limited per client IP, per login name and IP, and per login
+# name before that.
+@router.post("/login", response_model= schemas.Token, dependencies=[Depends(limit_login)])
+async def login(user_credentials : OAuth2PasswordRequestForm=Depends() ,db : AsyncSession = Depends(database.get_db)):
+  user = await db.scalar(select(models.User).where(models.User.email == user_credentials.username))
 
   if not user:
     raise HTTPException(status_code = status.HTTP_403_FORBIDDEN , detail=" invalid credentials " )
   
-  if not utils.verify(user_credentials.password , user.password):
+  verified , new_hash = await utils.verify_and_update_async(user_credentials.password , user.password)
+  if not verified:
      raise HTTPException(status_code = status.HTTP_403_FORBIDDEN , 
                          detail=" invalid credentials " )
+
+  # Transparently upgrade hashes made with outdated settings
+  if new_hash:
+    user.password = new_hash
+    await db.commit()
   
-  access_token = oauth.create_access_token(data = {"user_id" : user.id})
+  access_token = oauth.create_user_token(user)
   
   return {"access_token" :access_token ,"token_type" : "bearer"} 
   
 
-      
\ No newline at end of file
+      
@@ -0,0 +1,128 @@
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models, schemas
+from ..cache import response_cache
+from ..config import settings
+from ..database import get_db, session_scope
+from .post import require_admin, require_admin_or_writer
+
+router = APIRouter(prefix="/posts", tags=["Bulk"])
+
+EXPORT_COLUMNS = (
+    models.Post.id, models.Post.title, models.Post.content, models.Post.published,
+    models.Post.owner_id, models.Post.created_at, models.Post.photo_path, models.Post.vote_count,
+)
+
+
+async def _ndjson_lines(request: Request):
+    # Split the streamed body into lines without holding more than one chunk
+    # plus one line, which may be at most bulk_max_line_bytes long
+    buffer = b""
+    number = 0
+
+    def check(line):
+        if len(line) > settings.bulk_max_line_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Line {number + 1} is longer than {settings.bulk_max_line_bytes} bytes",
+            )
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            check(line)
+            number += 1
+            yield line
+        # An unterminated line is refused as soon as it is too long
+        check(buffer)
+    if buffer:
+        yield buffer
+
+
+async def _insert_batch(db: AsyncSession, batch, report):
+    # One multi-row INSERT per batch. If the database rejects it (e.g. an unknown
+    # owner_id), retry row by row so only the offending rows are reported.
+    rows = [row for _, row in batch]
+    try:
+        await db.execute(insert(models.Post), rows)
+        await db.commit()
+        report.inserted += len(rows)
+        return
+    except DBAPIError:
+        await db.rollback()
+
+    for line_number, row in batch:
+        try:
+            await db.execute(insert(models.Post), [row])
+            await db.commit()
+            report.inserted += 1
+        except DBAPIError as error:
+            await db.rollback()
+            report.add_error(line_number, str(error.orig))
+
+
+# Import posts from an NDJSON body, one PostImport object per line.
+# Rows are validated as they stream in and written in batches of
+# bulk_batch_size, so memory stays flat however large the upload; invalid rows
+# are reported by line number and skipped. A line over bulk_max_line_bytes
+# ends the import with a 413; batches written before it stay imported.
+@router.post("/import", response_model=schemas.BulkImportReport)
+async def import_posts(request: Request, db: AsyncSession = Depends(get_db),
+                       current_user: schemas.TokenData = Depends(require_admin_or_writer)):
+    report = schemas.BulkImportReport()
+    batch = []
+    line_number = 0
+
+    async for line in _ndjson_lines(request):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            post = schemas.PostImport.model_validate_json(line)
+        except ValidationError as error:
+            report.add_error(line_number, error.errors(include_url=False, include_input=False))
+            continue
+
+        row = post.model_dump(exclude_none=True)
+        if "owner_id" in row and current_user.role != models.Role.admin and row["owner_id"] != current_user.id:
+            report.add_error(line_number, "Only admin can import posts for other users")
+            continue
+        row.setdefault("owner_id", current_user.id)
+        batch.append((line_number, row))
+
+        if len(batch) >= settings.bulk_batch_size:
+            await _insert_batch(db, batch, report)
+            batch = []
+
+    if batch:
+        await _insert_batch(db, batch, report)
+
+    if report.inserted:
+        await response_cache.invalidate("posts")
+    return report
+
+
+async def _export_lines():
+    # Own session: the request's is closed before a streaming body is sent
+    async with session_scope() as db:
+        query = select(*EXPORT_COLUMNS).order_by(models.Post.id)
+        result = await db.stream(query.execution_options(yield_per=settings.bulk_batch_size))
+        async for rows in result.partitions(settings.bulk_batch_size):
+            yield "".join(
+                json.dumps({**row._asdict(), "created_at": row.created_at.isoformat()}) + "\n"
+                for row in rows
+            )
+
+
+# Export every post as NDJSON through a server-side cursor (Admin only)
+@router.get("/export")
+async def export_posts(current_user: schemas.TokenData = Depends(require_admin)):
+    return StreamingResponse(_export_lines(), media_type="application/x-ndjson")
@@ -1,17 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from sqlalchemy import select, update, tuple_, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 from .. import models, schemas, oauth, database
+from ..pagination import decode_cursor, next_cursor
+from ..cache import response_cache
+from ..config import settings
+from ..trending import bump_score
+from ..instrumentation import timed
+from ..serialization import dumps, comment_dict, comment_columns
+from ..replicas import get_read_db
+from ..rate_limit import limit_comment
 
 router = APIRouter(
     prefix="/comments",
     tags=["Comments"]
 )
 
-# Create comment (only Viewer can comment)
-@router.post("/", response_model=schemas.CommentResponse)
-def create_comment(comment: schemas.CommentCreate,post_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(oauth.get_current_user)
+# Create comment (only Viewer can comment), rate limited per IP and per user
+@router.post("/", response_model=schemas.CommentResponse, dependencies=[Depends(limit_comment)])
+async def create_comment(comment: schemas.CommentCreate,post_id: int,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenData = Depends(oauth.get_token_data)
 ):
     # only viewer allowed
     if current_user.role != models.Role.viewer:
@@ -20,28 +30,175 @@ def create_comment(comment: schemas.CommentCreate,post_id: int,
             detail="Only viewers can comment"
         )
 
-    # check if post exists
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if not post:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Post not found"
-        )
+    if comment.parent_id is None:
+        # check if post exists
+        post = await db.scalar(select(models.Post.id).where(models.Post.id == post_id))
+        if post is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Post not found"
+            )
+        prefix, depth = "", 0
+    else:
+        # Count the reply on the parent and read its position in one statement;
+        # no row means there is no such comment on this post
+        parent = (await db.execute(
+            update(models.Comment)
+            .where(models.Comment.id == comment.parent_id, models.Comment.post_id == post_id)
+            .values(reply_count=models.Comment.reply_count + 1)
+            .returning(models.Comment.path, models.Comment.depth)
+        )).first()
+        if parent is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Parent comment not found"
+            )
+        prefix, depth = parent.path + ".", parent.depth + 1
 
     new_comment = models.Comment(
         content=comment.text,
         post_id=post_id,
-        user_id=current_user.id
+        user_id=current_user.id,
+        parent_id=comment.parent_id,
+        path=prefix,
+        depth=depth,
     )
     db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
+    # The path ends with the comment's own id, known once the row is inserted
+    await db.flush()
+    new_comment.path = prefix + models.Comment.path_segment(new_comment.id)
+    await bump_score(db, post_id, settings.trending_comment_weight)
+    await db.commit()
+    await db.refresh(new_comment, ["user"])
+    await response_cache.invalidate(f"comments:{post_id}")
 
     return new_comment
 
 
-# Optional: Get comments for a post
+def _threads(db: AsyncSession, roots, depth: int, breadth: int):
+    # The comments of `roots` (a subquery of id, depth) and their
+    # replies down to `depth` levels below them, at most the `breadth` oldest
+    # replies per comment. Built a level at a time from the roots, reading only
+    # the replies it keeps (a range of ix_comments_parent_id_created_at_id per
+    # kept comment), breadth-first. The outer query reads the CTE as is, so
+    # both Postgres and SQLite stop the recursion once comment_max_rows rows
+    # are out: the work is capped like the result, and a page holds the top
+    # of every thread before any deeper reply. Authors are joined inside the
+    # CTE for that reason too.
+    comments = models.Comment.__table__
+
+    def with_author(source):
+        return select(*comment_columns(source), source.c.post_id, source.c.path, source.c.created_at)
+
+    threads = (
+        with_author(comments).add_columns(roots.c.depth.label("root_depth"))
+        .select_from(comments)
+        .join(roots, comments.c.id == roots.c.id)
+        .join(models.User, models.User.id == comments.c.user_id)
+        .cte("threads", recursive=True)
+    )
+    oldest_replies = (
+        select(*comments.c)
+        .where(comments.c.parent_id == threads.c.id)
+        .order_by(comments.c.created_at, comments.c.id)
+        .limit(breadth)
+    )
+    if db.bind.dialect.name == "postgresql":
+        replies = oldest_replies.lateral()
+        level = with_author(replies).add_columns(threads.c.root_depth).select_from(threads).join(replies, true())
+    else:
+        # No LATERAL on SQLite: the ids of the oldest replies come from a
+        # correlated subquery and the rows are fetched by primary key
+        replies = comments.alias()
+        level = with_author(replies).add_columns(threads.c.root_depth).select_from(threads).join(
+            replies, replies.c.id.in_(oldest_replies.with_only_columns(comments.c.id))
+        )
+    level = level.join(models.User, models.User.id == replies.c.user_id)
+    threads = threads.union_all(level.where(threads.c.depth < threads.c.root_depth + depth))
+
+    # No ORDER BY: sorting would need every row of the CTE first
+    return select(threads).limit(settings.comment_max_rows)
+
+
+def _top_level(post_id: int, limit: int, cursor: Optional[str] = None):
+    # The roots of a page of threads: the post's oldest top-level comments
+    # after the cursor (ix_comments_top_level_post_id_created_at_id)
+    roots = (
+        select(models.Comment.id, models.Comment.depth)
+        .where(models.Comment.post_id == post_id, models.Comment.parent_id.is_(None))
+        .order_by(models.Comment.created_at, models.Comment.id)
+    )
+    if cursor:
+        roots = roots.where(tuple_(models.Comment.created_at, models.Comment.id) > decode_cursor(cursor))
+    return roots.limit(limit).subquery()
+
+
+def _prune(comments):
+    # Put the rows in breadth-first order, drop replies whose parent was cut by
+    # the row cap, then put the rest in thread order
+    if not comments:
+        return comments
+    comments = sorted(comments, key=lambda comment: (comment.depth, comment.path))
+    top = comments[0].depth
+    kept = set()
+    threads = []
+    for comment in comments:
+        if comment.depth == top or comment.parent_id in kept:
+            kept.add(comment.id)
+            threads.append(comment)
+    return sorted(threads, key=lambda comment: comment.path)
+
+
+async def _cached_threads(request: Request, version, comments, post_id: int, cursor: Optional[str] = None):
+    with timed("serialize_seconds"):
+        body = dumps([comment_dict(comment) for comment in comments])
+    entry = await response_cache.store(
+        request,
+        version,
+        body,
+        # "comments" covers changes made through users, e.g. account deletion
+        tags=["comments", f"comments:{post_id}"],
+        headers={"X-Next-Cursor": cursor} if cursor else None,
+    )
+    return response_cache.respond(request, entry)
+
+
+# Get comments for a post: a page of top-level comments, oldest first, each
+# followed by its replies in thread order, `depth` levels deep with at most
+# `breadth` replies per comment (see reply_count for the full number).
+# The X-Next-Cursor response header holds the cursor for the following page.
+# Pages are cached until a comment is added to the post.
 @router.get("/post/{post_id}", response_model=list[schemas.CommentResponse])
-def get_comments(post_id: int, db: Session = Depends(database.get_db)):
-    comments = db.query(models.Comment).filter(models.Comment.post_id == post_id).all()
-    return comments
+async def get_comments(post_id: int, request: Request, db: AsyncSession = Depends(get_read_db),
+                       limit: int = Query(50, ge=1, le=100), cursor: Optional[str] = None,
+                       depth: int = Query(3, ge=0, le=settings.comment_max_depth),
+                       breadth: int = Query(10, ge=1, le=settings.comment_max_breadth)):
+    cached, version = await response_cache.lookup(request)
+    if cached:
+        return response_cache.respond(request, cached)
+
+    comments = _prune((await db.execute(_threads(db, _top_level(post_id, limit, cursor), depth, breadth))).all())
+
+    top_level = [comment for comment in comments if comment.parent_id is None]
+    return await _cached_threads(request, version, comments, post_id, next_cursor(top_level, limit))
+
+
+# Get one comment and its replies in thread order, with the same caps
+@router.get("/{comment_id}/thread", response_model=list[schemas.CommentResponse])
+async def get_thread(comment_id: int, request: Request, db: AsyncSession = Depends(get_read_db),
+                     depth: int = Query(3, ge=0, le=settings.comment_max_depth),
+                     breadth: int = Query(10, ge=1, le=settings.comment_max_breadth)):
+    cached, version = await response_cache.lookup(request)
+    if cached:
+        return response_cache.respond(request, cached)
+
+    root = (
+        select(models.Comment.id, models.Comment.depth)
+        .where(models.Comment.id == comment_id)
+        .subquery()
+    )
+    comments = _prune((await db.execute(_threads(db, root, depth, breadth))).all())
+    if not comments:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Comment not found")
+
+    return await _cached_threads(request, version, comments, comments[0].post_id)
@@ -0,0 +1,140 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import select, update, delete, or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from .. import models, schemas, oauth, database
+from ..config import settings
+from ..pagination import decode_cursor, next_cursor
+from ..timeline import timelines, is_fanned_out
+from ..instrumentation import timed
+from ..serialization import dumps, post_dict, select_posts
+
+router = APIRouter(tags=["Feed"])
+
+
+async def _bump_follower_count(db: AsyncSession, user_id: int, delta: int):
+    return await db.scalar(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(follower_count=models.User.follower_count + delta)
+        .returning(models.User.follower_count)
+    )
+
+
+# Follow a blog writer (or admin); their new posts show up in /feed
+@router.post("/users/{user_id}/follow", status_code=status.HTTP_201_CREATED)
+async def follow(user_id: int, db: AsyncSession = Depends(database.get_db),
+                 current_user: schemas.TokenData = Depends(oauth.get_token_data)):
+    if user_id == current_user.id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Users cannot follow themselves")
+
+    role = await db.scalar(select(models.User.role).where(models.User.id == user_id))
+    if role is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User with id {user_id} does not exist")
+    if role == models.Role.viewer:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only writers can be followed")
+
+    inserted = await db.scalar(
+        database.dialect_insert(db)(models.Follow)
+        .values(follower_id=current_user.id, followee_id=user_id)
+        .on_conflict_do_nothing()
+        .returning(models.Follow.followee_id)
+    )
+    if inserted is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Already following user {user_id}")
+    followers = await _bump_follower_count(db, user_id, 1)
+    await db.commit()
+
+    # Seed the timeline with the writer's latest posts, unless they are read on demand anyway
+    if is_fanned_out(followers):
+        recent = (await db.scalars(
+            select(models.Post.id)
+            .where(models.Post.owner_id == user_id)
+            .order_by(models.Post.created_at.desc())
+            .limit(settings.timeline_max_length)
+        )).all()
+        if recent:
+            await timelines.add([current_user.id], recent)
+
+    return {"message": f"Following user {user_id}", "followers": followers}
+
+
+@router.delete("/users/{user_id}/follow")
+async def unfollow(user_id: int, db: AsyncSession = Depends(database.get_db),
+                   current_user: schemas.TokenData = Depends(oauth.get_token_data)):
+    deleted = await db.scalar(
+        delete(models.Follow)
+        .where(models.Follow.follower_id == current_user.id, models.Follow.followee_id == user_id)
+        .returning(models.Follow.followee_id)
+    )
+    if deleted is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Not following user {user_id}")
+    followers = await _bump_follower_count(db, user_id, -1)
+    await db.commit()
+    # Their posts stay in the timeline but the feed query skips them from now on
+    return {"message": f"Unfollowed user {user_id}", "followers": followers}
+
+
+async def _followed_posts(db: AsyncSession, source, followees, limit: int, cursor):
+    query = (
+        select_posts()
+        .where(source, models.Post.owner_id.in_(followees), models.Post.published)
+        .order_by(models.Post.created_at.desc(), models.Post.id.desc())
+    )
+    if cursor:
+        query = query.where(tuple_(models.Post.created_at, models.Post.id) < cursor)
+    return (await db.execute(query.limit(limit))).all()
+
+
+# Published posts of the writers the current user follows, newest first.
+#
+# The page is read from the user's timeline: the next `limit` post ids after
+# the cursor, fetched by primary key together with the posts of followed
+# writers with too many followers to fan out, in one query. When some of those
+# ids no longer qualify (drafts, unfollowed writers) and the page comes up
+# short, the next ids are taken in a wider window. Only when there is no
+# timeline, or the page runs past its oldest id, are the posts read by author
+# for every followed writer. Pass X-Next-Cursor back as `cursor` for the next
+# page.
+@router.get("/feed", response_model=List[schemas.Post])
+async def feed(db: AsyncSession = Depends(database.get_db),
+               current_user: schemas.TokenData = Depends(oauth.get_token_data),
+               limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = None):
+    cursor = decode_cursor(cursor) if cursor else None
+    followees = select(models.Follow.followee_id).where(models.Follow.follower_id == current_user.id)
+    read_on_demand = select(models.User.id).where(
+        models.User.id.in_(followees),
+        models.User.follower_count > settings.fanout_max_followers,
+    )
+
+    # Timelines are ordered by post id, which follows creation order
+    post_ids = await timelines.get(current_user.id)
+    if cursor:
+        post_ids = [post_id for post_id in post_ids if post_id < cursor[1]]
+
+    posts = None
+    window = limit
+    while post_ids:
+        candidates = post_ids[:window]
+        posts = await _followed_posts(
+            db, or_(models.Post.id.in_(candidates), models.Post.owner_id.in_(read_on_demand)),
+            followees, limit, cursor,
+        )
+        # Done once the page is full down to a post no older than the window:
+        # every id past the window is older still
+        if len(posts) == limit and posts[-1].id >= candidates[-1]:
+            break
+        if len(candidates) == len(post_ids):
+            posts = None
+            break
+        window *= 2
+
+    if posts is None:
+        # No timeline, or the page reaches past its oldest post
+        posts = await _followed_posts(db, models.Post.owner_id.in_(followees), followees, limit, cursor)
+
+    cursor = next_cursor(posts, limit)
+    with timed("serialize_seconds"):
+        body = dumps([post_dict(post) for post in posts])
+    return Response(content=body, media_type="application/json",
+                    headers={"X-Next-Cursor": cursor} if cursor else None)
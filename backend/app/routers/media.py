@@ -0,0 +1,100 @@
+import os
+import re
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse
+from sqlalchemy import Text, cast, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from .. import database, models, oauth, schemas
+from ..config import settings
+from ..storage import IMAGE_EXTENSIONS, content_key, storage
+
+router = APIRouter(prefix="/uploads", tags=["Media"])
+
+# Stored photos are named after the SHA-256 of their bytes (see app.storage), so
+# their content can never change and the hash itself is a strong ETag.
+CONTENT_ADDRESSED = re.compile(r"^([0-9a-f]{64})\.[a-z0-9]+$")
+CONTENT_HASH = re.compile(r"^[0-9a-f]{64}$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Photos of drafts, shown to their owner only
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+# posts/variants/<photo name>/..., see app.storage.variants_prefix
+VARIANT_KEY = re.compile(r"^posts/variants/([^/]+)/")
+
+
+def _resolve(file_path: str):
+    root = os.path.realpath(settings.upload_dir)
+    path = os.path.realpath(os.path.join(root, file_path))
+    # Nothing outside the upload root, and never the staging area
+    if os.path.commonpath([root, path]) != root or path.startswith(os.path.join(root, ".tmp") + os.sep):
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def _belongs_to_post(key: str):
+    # Posts whose photo, or one of its variants, is the file stored at `key`
+    match = VARIANT_KEY.match(key)
+    if match and CONTENT_HASH.match(match.group(1)):
+        photos = [storage.url(content_key("posts", match.group(1), content_type)) for content_type in IMAGE_EXTENSIONS]
+        return models.Post.photo_path.in_(photos)
+    if key.startswith("posts/variants/"):
+        # Variants of photos that are not content addressed, or built before
+        # variants were filed under their photo: matched in photo_variants,
+        # which scans the posts that have a photo
+        return cast(models.Post.photo_variants, Text).contains(f'"{storage.url(key)}"')
+    return models.Post.photo_path == storage.url(key)
+
+
+async def _visibility(db: AsyncSession, key: str, user: Optional[schemas.TokenData]):
+    # True when a published post shows the file, False when only a draft the
+    # requester may see does, None when the requester may not see it at all
+    query = select(models.Post.published).where(_belongs_to_post(key))
+    if user is None:
+        query = query.where(models.Post.published)
+    elif user.role != models.Role.admin:
+        query = query.where(or_(models.Post.published, models.Post.owner_id == user.id))
+    return await db.scalar(query.order_by(models.Post.published.desc()).limit(1))
+
+
+# Serve uploaded photos. photo_path values ("uploads/posts/…") are URL paths
+# under this route. A file is served when a published post shows it, or to the
+# owner of a draft that does (and to admins); anything else is a 404, so the
+# name of a draft's photo gives nothing away. With media_accel set, the
+# response only names the file and the front proxy (nginx X-Accel-Redirect,
+# Apache/lighttpd X-Sendfile) sends the bytes itself; otherwise FileResponse
+# streams it, answering Range requests and using the ASGI pathsend extension
+# where the server offers it.
+@router.api_route("/{file_path:path}", methods=["GET", "HEAD"])
+async def get_upload(file_path: str, request: Request, db: AsyncSession = Depends(database.get_db),
+                     current_user: Optional[schemas.TokenData] = Depends(oauth.get_optional_token_data)):
+    not_found = HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    path = await run_in_threadpool(_resolve, file_path)
+    if path is None:
+        raise not_found
+    key = os.path.relpath(path, os.path.realpath(settings.upload_dir)).replace(os.sep, "/")
+    public = await _visibility(db, key, current_user)
+    if public is None:
+        raise not_found
+
+    headers = {}
+    match = CONTENT_ADDRESSED.match(os.path.basename(path))
+    if match:
+        headers["ETag"] = f'"{match.group(1)}"'
+        headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if public else PRIVATE_CACHE_CONTROL
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    else:
+        # Files uploaded before content addressing may be overwritten in place
+        headers["Cache-Control"] = "no-cache" if public else PRIVATE_CACHE_CONTROL
+
+    if settings.media_accel == "nginx":
+        headers["X-Accel-Redirect"] = f"{settings.media_accel_prefix.rstrip('/')}/{key}"
+        return Response(headers=headers)
+    if settings.media_accel == "sendfile":
+        headers["X-Sendfile"] = path
+        return Response(headers=headers)
+
+    return FileResponse(path, headers=headers)
@@ -1,13 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query, BackgroundTasks
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, tuple_, update, delete
 from .. import models, schemas, oauth
+from ..pagination import decode_cursor, next_cursor
+from ..search import search_filter, search_rank, search_snippet
+from ..trending import trending_query
+from ..timeline import fan_out_post
+from ..instrumentation import timed
+from ..serialization import dumps, post_dict, select_posts
 from ..database import get_db
+from ..replicas import get_read_db
+from ..cache import response_cache
 from typing import List, Optional
 
 router = APIRouter(tags=['posts'])
 
 # Dependency: Require Admin
-def require_admin(user: models.User = Depends(oauth.get_current_user)):
+async def require_admin(user: schemas.TokenData = Depends(oauth.get_token_data)):
     if user.role != models.Role.admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -16,7 +25,7 @@ def require_admin(user: models.User = Depends(oauth.get_current_user)):
     return user
 
 # Dependency: Require Admin or Blog Writer
-def require_admin_or_writer(user: models.User = Depends(oauth.get_current_user)):
+async def require_admin_or_writer(user: schemas.TokenData = Depends(oauth.get_token_data)):
     if user.role not in [models.Role.admin, models.Role.blog_writer]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -25,56 +34,139 @@ def require_admin_or_writer(user: models.User = Depends(oauth.get_current_user))
     return user
 
 
-# Get all posts
+# Get published posts, newest first, from a read replica when there is one
+# Owner is joined and vote counts live on the row, so a page of any size is
+# fetched with a single SELECT of plain columns, encoded straight to JSON
+# (see app/serialization.py). Pass the X-Next-Cursor header of a
+# page back as `cursor` to get the next one; `skip` is still honoured for older
+# clients but gets slower the deeper it goes.
+# Pages are served from the response cache until a write touches the feed or
+# one of the posts on the page.
 @router.get("/posts", response_model=List[schemas.Post])
-def get_posts(db: Session = Depends(get_db), limit: int = 10, skip: int = 0, search: Optional[str] = ""):
-    posts = db.query(models.Post).filter(models.Post.title.contains(search)).limit(limit).offset(skip).all()
+async def get_posts(request: Request, db: AsyncSession = Depends(get_read_db), limit: int = 10, skip: int = 0,
+                    search: Optional[str] = "", cursor: Optional[str] = None):
+    cached, version = await response_cache.lookup(request)
+    if cached:
+        return response_cache.respond(request, cached)
+
+    # Published posts only, the predicate of ix_posts_published_created_at_id
+    query = (
+        select_posts()
+        .where(models.Post.published)
+        .order_by(models.Post.created_at.desc(), models.Post.id.desc())
+    )
+    if search:
+        query = query.where(search_filter(db, search))
+    if cursor:
+        query = query.where(tuple_(models.Post.created_at, models.Post.id) < decode_cursor(cursor))
+    else:
+        query = query.offset(skip)
+    posts = (await db.execute(query.limit(limit))).all()
+
+    cursor = next_cursor(posts, limit)
+    with timed("serialize_seconds"):
+        body = dumps([post_dict(post) for post in posts])
+    entry = await response_cache.store(
+        request,
+        version,
+        body,
+        tags=["posts", *(f"post:{post.id}" for post in posts)],
+        headers={"X-Next-Cursor": cursor} if cursor else None,
+    )
+    return response_cache.respond(request, entry)
+
+
+# Full-text search over title and content, best matches first
+@router.get("/posts/search", response_model=List[schemas.PostSearchResult])
+async def search_posts(q: str = Query(..., min_length=1), db: AsyncSession = Depends(get_read_db),
+                       limit: int = Query(10, ge=1, le=100), skip: int = 0):
+    rank = search_rank(db, q).label("rank")
+    query = (
+        select(models.Post, rank, search_snippet(db, q))
+        .where(search_filter(db, q), models.Post.published)
+        .order_by(rank.desc(), models.Post.id.desc())
+        .limit(limit)
+        .offset(skip)
+    )
+    rows = (await db.execute(query)).all()
+
+    posts = []
+    for post, post_rank, snippet in rows:
+        post.rank = post_rank
+        post.snippet = snippet
+        posts.append(post)
     return posts
 
 
+# Hottest published posts: votes and comments weighted and decayed over time.
+# Scores are kept up to date by the writers and a background task (see
+# app/trending.py), so this is a read of the top of an index.
+@router.get("/posts/trending", response_model=List[schemas.PostTrending])
+async def trending_posts(request: Request, db: AsyncSession = Depends(get_read_db),
+                         limit: int = Query(20, ge=1, le=100)):
+    cached, version = await response_cache.lookup(request)
+    if cached:
+        return response_cache.respond(request, cached)
+
+    posts = (await db.execute(trending_query(limit))).all()
+    with timed("serialize_seconds"):
+        body = dumps([{**post_dict(post), "hot_score": post[-1]} for post in posts])
+    entry = await response_cache.store(
+        request,
+        version,
+        body,
+        tags=["posts", "trending", *(f"post:{post.id}" for post in posts)],
+    )
+    return response_cache.respond(request, entry)
+
+
 # Create post (Admin & Blog Writer)
 @router.post("/posts", response_model=schemas.Post)
-def create_post(post: schemas.PostCreate, 
-                db: Session = Depends(get_db),
-                current_user: models.User = Depends(require_admin_or_writer)):
+async def create_post(post: schemas.PostCreate, 
+                      background_tasks: BackgroundTasks,
+                      db: AsyncSession = Depends(get_db),
+                      current_user: schemas.TokenData = Depends(require_admin_or_writer)):
     new_post = models.Post(owner_id=current_user.id, **post.dict())
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
+    await db.commit()
+    await db.refresh(new_post)
+    await response_cache.invalidate("posts")
+    # Onto the followers' timelines after the response is sent
+    background_tasks.add_task(fan_out_post, new_post.id, current_user.id)
     return new_post
 
 
 # Update post (Admin & Blog Writer)
 @router.put("/posts/{id}")
-def update_post(id: int, 
-                updated_post: schemas.PostCreate, 
-                db: Session = Depends(get_db),
-                current_user: models.User = Depends(require_admin_or_writer)):
-    post_query = db.query(models.Post).filter(models.Post.id == id)
-    post = post_query.first()
-
-    if not post:
+async def update_post(id: int, 
+                      updated_post: schemas.PostCreate, 
+                      db: AsyncSession = Depends(get_db),
+                      current_user: schemas.TokenData = Depends(require_admin_or_writer)):
+    owner_id = await db.scalar(select(models.Post.owner_id).where(models.Post.id == id))
+
+    if owner_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Post with id {id} not found")
 
     # If Blog Writer, allow update only for own posts
-    if current_user.role == models.Role.blog_writer and post.owner_id != current_user.id:
+    if current_user.role == models.Role.blog_writer and owner_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to update this post")
 
-    post_query.update(updated_post.dict(), synchronize_session=False)
-    db.commit()
+    await db.execute(update(models.Post).where(models.Post.id == id).values(**updated_post.dict()))
+    await db.commit()
+    # Title or published may move the post in or out of any feed page
+    await response_cache.invalidate("posts", f"post:{id}")
     return {"detail": "Post successfully updated"}
 
 
 # Delete post (Admin only)
 @router.delete("/posts/{id}")
-def delete_post(id: int, db: Session = Depends(get_db),
-                current_user: models.User = Depends(require_admin)):
-    post_query = db.query(models.Post).filter(models.Post.id == id)
-    post = post_query.first()
+async def delete_post(id: int, db: AsyncSession = Depends(get_db),
+                      current_user: schemas.TokenData = Depends(require_admin)):
+    result = await db.execute(delete(models.Post).where(models.Post.id == id))
 
-    if not post:
+    if result.rowcount == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Post with id {id} not found")
 
-    post_query.delete(synchronize_session=False)
-    db.commit()
+    await db.commit()
+    await response_cache.invalidate("posts", f"post:{id}", f"comments:{id}")
     return {"detail": "Post successfully deleted"}
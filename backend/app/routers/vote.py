@@ -1,26 +1,70 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import schemas, database, models, oauth
+from ..cache import response_cache
+from ..config import settings
+from ..trending import bump_score
+from ..rate_limit import limit_vote
+from ..vote_buffer import vote_buffer, ADDED, EXISTS, MISSING, REMOVED
 
 router = APIRouter(
     prefix="/vote",
     tags=["Vote"]
 )
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
-def vote(
-    vote: schemas.vote,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(oauth.get_current_user)
-):
-    # Check if the post exists
-    post = db.query(models.Post).filter(models.Post.id == vote.post_id).first()
-    if not post:
+
+async def _bump_vote_count(db: AsyncSession, post_id: int, delta: int):
+    return await db.scalar(
+        update(models.Post)
+        .where(models.Post.id == post_id)
+        .values(vote_count=models.Post.vote_count + delta)
+        .returning(models.Post.vote_count)
+    )
+
+
+async def _buffered_vote(vote: schemas.vote, user_id: int, response: Response):
+    # Written in a batch with other votes by app/vote_buffer.py
+    if settings.vote_buffer_durability == "none":
+        await vote_buffer.submit(user_id, vote.post_id, vote.dir, wait=False)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"message": "Vote accepted"}
+
+    # A later vote by the same user on the same post in the batch wins, and
+    # its outcome is the answer to both
+    outcome, votes = await vote_buffer.submit(user_id, vote.post_id, vote.dir)
+    if outcome == ADDED:
+        return {"message": "Successfully added vote", "votes": votes}
+    if outcome == REMOVED:
+        return {"message": "Successfully deleted vote", "votes": votes}
+    if outcome == EXISTS:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"User {user_id} has already voted on post {vote.post_id}"
+        )
+    if outcome == MISSING:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Post with id {vote.post_id} does not exist"
         )
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Vote does not exist"
+    )
 
+
+# Each direction is a single INSERT ... ON CONFLICT DO NOTHING RETURNING or
+# DELETE ... RETURNING, followed by the posts.vote_count update in the same
+# transaction, so concurrent votes can neither double count nor get lost.
+# With vote_buffer_enabled the vote goes through the write-behind buffer.
+@router.post("/", status_code=status.HTTP_201_CREATED, dependencies=[Depends(limit_vote)])
+async def vote(
+    vote: schemas.vote,
+    response: Response,
+    db: AsyncSession = Depends(database.get_db),
+    current_user: schemas.TokenData = Depends(oauth.get_token_data)
+):
     # Check if user has permission (only viewers can like)
     if current_user.role != models.Role.viewer:
         raise HTTPException(
@@ -28,32 +72,62 @@ def vote(
             detail="Only viewers are authorized to like posts"
         )
 
-    # Query for existing vote
-    vote_query = db.query(models.Vote).filter(
-        models.Vote.post_id == vote.post_id,
-        models.Vote.user_id == current_user.id
-    )
-    found_vote = vote_query.first()
+    if settings.vote_buffer_enabled:
+        # Hand the connection back before waiting for the batch: loading the
+        # user may have begun a transaction, and the flusher needs a connection
+        # (and on SQLite the write lock) of its own
+        await db.close()
+        return await _buffered_vote(vote, current_user.id, response)
 
     # Add a vote
     if vote.dir == 1:
-        if found_vote:
+        insert_vote = (
+            database.dialect_insert(db)(models.Vote)
+            .values(post_id=vote.post_id, user_id=current_user.id)
+            .on_conflict_do_nothing()
+            .returning(models.Vote.post_id)
+        )
+        post_missing = HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Post with id {vote.post_id} does not exist"
+        )
+        try:
+            inserted = await db.scalar(insert_vote)
+        except IntegrityError:
+            # votes.post_id foreign key
+            await db.rollback()
+            raise post_missing
+        if inserted is None:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail=f"User {current_user.id} has already voted on post {vote.post_id}"
             )
-        new_vote = models.Vote(post_id=vote.post_id, user_id=current_user.id)
-        db.add(new_vote)
-        db.commit()
-        return {"message": "Successfully added vote"}
+        votes = await _bump_vote_count(db, vote.post_id, 1)
+        if votes is None:
+            # Backends that do not enforce the foreign key
+            await db.rollback()
+            raise post_missing
+        await bump_score(db, vote.post_id, settings.trending_vote_weight)
+        await db.commit()
+        await response_cache.invalidate(f"post:{vote.post_id}")
+        return {"message": "Successfully added vote", "votes": votes}
 
     # Remove a vote
     else:
-        if not found_vote:
+        deleted = await db.scalar(
+            delete(models.Vote)
+            .where(models.Vote.post_id == vote.post_id, models.Vote.user_id == current_user.id)
+            .returning(models.Vote.post_id)
+        )
+        if deleted is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Vote does not exist"
             )
-        vote_query.delete(synchronize_session=False)
-        db.commit()
-        return {"message": "Successfully deleted vote"}
+        votes = await _bump_vote_count(db, vote.post_id, -1)
+        # Takes back the full weight, though the vote had decayed since; the
+        # score does not go below 0
+        await bump_score(db, vote.post_id, -settings.trending_vote_weight)
+        await db.commit()
+        await response_cache.invalidate(f"post:{vote.post_id}")
+        return {"message": "Successfully deleted vote", "votes": votes}
@@ -1,7 +1,7 @@
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, model_validator
 from datetime import datetime
-from typing import Optional
+from typing import Any, List, Optional
 from pydantic.types import conint
 from .models import Role
 
@@ -43,13 +43,45 @@ class Token(BaseModel):
     token_type: str
 
 class TokenData(BaseModel):
-    id: Optional[str] = None
+    id: int
+    role: Optional[Role] = None
+    ver: int = 0
+
+class RoleUpdate(BaseModel):
+    role: Role
+
+class BulkUserSelection(BaseModel):
+    # Users matching every given criterion; at least one is required
+    ids: Optional[List[int]] = None
+    role: Optional[Role] = None
+    created_before: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def check_not_empty(self):
+        if self.ids is None and self.role is None and self.created_before is None:
+            raise ValueError("Select users by ids, role or created_before")
+        return self
+
+class BulkRoleUpdate(BulkUserSelection):
+    new_role: Role
+
+class JobStatus(BaseModel):
+    id: str
+    kind: str
+    status: str
+    total: int
+    processed: int
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
 
 # -------------------
 # Post Schemas
 # -------------------
 
 class Post(BaseModel):
+    id: int
     title: str
     content: str
     published: bool = True
@@ -58,10 +90,18 @@ class Post(BaseModel):
     owner: UserOut
     vote: Optional[int] = 0
     photo_path: Optional[str] = None 
+    photo_variants: Optional[dict[str, str]] = None
 
     class Config:
        from_attributes = True
 
+class PostSearchResult(Post):
+    rank: float
+    snippet: str
+
+class PostTrending(Post):
+    hot_score: float
+
 class postBase(BaseModel):
     title: str
     content: str
@@ -70,6 +110,28 @@ class postBase(BaseModel):
 class PostCreate(postBase):
     pass
 
+class PostImport(postBase):
+    # Set when migrating an archive; default to now / the importing user
+    created_at: Optional[datetime] = None
+    owner_id: Optional[int] = None
+
+# Errors beyond this many are counted but not listed in the import report
+MAX_REPORTED_ERRORS = 1000
+
+class BulkImportError(BaseModel):
+    line: int
+    error: Any
+
+class BulkImportReport(BaseModel):
+    inserted: int = 0
+    failed: int = 0
+    errors: List[BulkImportError] = []
+
+    def add_error(self, line: int, error):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(BulkImportError(line=line, error=error))
+
 class PostResponse(BaseModel):
     title: str
     content: str
@@ -93,11 +155,15 @@ class vote(BaseModel):
 
 class CommentCreate(BaseModel):
     text: str   # was 'content'
+    parent_id: Optional[int] = None   # reply to this comment
 
 class CommentResponse(BaseModel):
     id: int
     content: str   # was 'content'
     user: UserOut   # was 'user'
+    parent_id: Optional[int] = None
+    depth: int = 0
+    reply_count: int = 0
 
     class Config:
         from_attributes = True
@@ -0,0 +1,41 @@
+from sqlalchemy import case, func, literal, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models
+
+# Full-text search over posts.
+#
+# On Postgres posts.search_vector holds a weighted tsvector (title = A,
+# content = B) kept current by a trigger and served by a GIN index. Other
+# backends (SQLite in tests and local runs) have no tsvector support, so they
+# fall back to case-insensitive LIKE over title and content with a crude rank.
+
+SEARCH_CONFIG = "english"
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=30, MinWords=10"
+FALLBACK_SNIPPET_LENGTH = 200
+
+
+def _is_postgres(db: AsyncSession) -> bool:
+    return db.bind.dialect.name == "postgresql"
+
+
+def _ts_query(term: str):
+    return func.websearch_to_tsquery(SEARCH_CONFIG, term)
+
+
+def search_filter(db: AsyncSession, term: str):
+    if _is_postgres(db):
+        return models.Post.search_vector.op("@@")(_ts_query(term))
+    pattern = f"%{term}%"
+    return or_(models.Post.title.ilike(pattern), models.Post.content.ilike(pattern))
+
+
+def search_rank(db: AsyncSession, term: str):
+    if _is_postgres(db):
+        return func.ts_rank_cd(models.Post.search_vector, _ts_query(term))
+    return case((models.Post.title.ilike(f"%{term}%"), literal(1.0)), else_=literal(0.5))
+
+
+def search_snippet(db: AsyncSession, term: str):
+    if _is_postgres(db):
+        return func.ts_headline(SEARCH_CONFIG, models.Post.content, _ts_query(term), HEADLINE_OPTIONS)
+    return func.substr(models.Post.content, 1, FALLBACK_SNIPPET_LENGTH)
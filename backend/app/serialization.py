@@ -0,0 +1,92 @@
+import orjson
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
+
+from . import models
+
+# Fast path for the list endpoints.
+#
+# Instead of loading ORM objects and validating them through the response
+# schemas, the list queries select plain columns and the rows are turned into
+# dicts shaped exactly like schemas.Post / schemas.CommentResponse (same keys,
+# same order) and encoded with orjson. The rows come straight from our own
+# tables, so the validation would only re-check what the database guarantees.
+# Routes keep their response_model, so the OpenAPI schema is unchanged; they
+# return a ready-made Response, which FastAPI passes through as is.
+#
+# The builders unpack rows by position (attribute access on a Row costs more
+# than the JSON encoding), so the column lists and the builders below have to
+# stay in step with each other and with the schemas.
+
+POST_COLUMNS = (
+    models.Post.id,
+    models.Post.title,
+    models.Post.content,
+    models.Post.published,
+    models.Post.created_at,
+    models.Post.owner_id,
+    models.User.email.label("owner_email"),
+    models.User.role.label("owner_role"),
+    models.Post.vote_count,
+    models.Post.photo_path,
+    models.Post.photo_variants,
+)
+
+
+def dumps(content) -> bytes:
+    # UTC as "Z", like pydantic
+    return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+def select_posts(*extra_columns):
+    return select(*POST_COLUMNS, *extra_columns).join(models.User, models.User.id == models.Post.owner_id)
+
+
+def comment_columns(source):
+    # `source` is the comments table or a subquery over it; extra columns go after these
+    return (
+        source.c.id,
+        source.c.content,
+        source.c.user_id,
+        models.User.email.label("user_email"),
+        models.User.role.label("user_role"),
+        source.c.parent_id,
+        source.c.depth,
+        source.c.reply_count,
+    )
+
+
+def post_dict(row):
+    # schemas.Post, from a select_posts() row
+    id, title, content, published, created_at, owner_id, owner_email, owner_role, \
+        vote_count, photo_path, photo_variants = row[:11]
+    return {
+        "id": id,
+        "title": title,
+        "content": content,
+        "published": published,
+        "created_at": created_at,
+        "owner_id": owner_id,
+        "owner": {"id": owner_id, "email": owner_email, "role": owner_role},
+        "vote": vote_count,
+        "photo_path": photo_path,
+        "photo_variants": photo_variants,
+    }
+
+
+def comment_dict(row):
+    # schemas.CommentResponse, from a comment_columns() row
+    id, content, user_id, user_email, user_role, parent_id, depth, reply_count = row[:8]
+    return {
+        "id": id,
+        "content": content,
+        "user": {"id": user_id, "email": user_email, "role": user_role},
+        "parent_id": parent_id,
+        "depth": depth,
+        "reply_count": reply_count,
+    }
+
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
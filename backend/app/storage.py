@@ -0,0 +1,240 @@
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+
+import anyio
+from fastapi import HTTPException, status
+from PIL import Image, UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # optional, only needed for storage_backend = "s3"
+    boto3 = None
+
+
+CHUNK_SIZE = 64 * 1024
+
+# Accepted upload types and the extension they are stored under
+IMAGE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+
+
+class StorageBackend(ABC):
+    """Where finished uploads live, addressed by key ("posts/ab/abcd….jpg").
+
+    Uploads are always staged in a local temporary file first; `save` takes
+    ownership of that file.
+    """
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def save(self, tmp_path: str, key: str, content_type: str):
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        """Remove the object at `key`; a missing object is not an error."""
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        ...
+
+    @abstractmethod
+    def local_copy(self, key: str):
+        """Async context manager yielding a local file path holding the object."""
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    async def exists(self, key):
+        return await run_in_threadpool(os.path.exists, self.path(key))
+
+    async def save(self, tmp_path, key, content_type):
+        def move():
+            os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+            # Same filesystem as the staging directory, so this is an atomic rename
+            os.replace(tmp_path, self.path(key))
+        await run_in_threadpool(move)
+
+    async def delete(self, key):
+        try:
+            await run_in_threadpool(os.remove, self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key):
+        # Served by the /uploads media route, wherever upload_dir is on disk
+        return f"uploads/{key}"
+
+    @asynccontextmanager
+    async def local_copy(self, key):
+        yield self.path(key)
+
+
+class S3Storage(StorageBackend):
+    # Any S3-compatible service; point s3_endpoint_url at MinIO or a moto server
+    # to run against a local stand-in.
+
+    def __init__(self, bucket: str, endpoint_url: str = None, region: str = None, public_url: str = None):
+        if boto3 is None:
+            raise RuntimeError("storage_backend 's3' requires the boto3 package")
+        self.bucket = bucket
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        base = public_url or f"{endpoint_url or 'https://s3.amazonaws.com'}/{bucket}"
+        self.public_url = base.rstrip("/")
+
+    async def exists(self, key):
+        def head():
+            try:
+                self.client.head_object(Bucket=self.bucket, Key=key)
+                return True
+            except ClientError as error:
+                if error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                    return False
+                raise
+        return await run_in_threadpool(head)
+
+    async def save(self, tmp_path, key, content_type):
+        def upload():
+            try:
+                # Multipart for large files; the object only appears once complete
+                self.client.upload_file(tmp_path, self.bucket, key, ExtraArgs={"ContentType": content_type})
+            finally:
+                os.unlink(tmp_path)
+        await run_in_threadpool(upload)
+
+    async def delete(self, key):
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+    def url(self, key):
+        return f"{self.public_url}/{key}"
+
+    @asynccontextmanager
+    async def local_copy(self, key):
+        tmp_path = await staging_file()
+        try:
+            await run_in_threadpool(self.client.download_file, self.bucket, key, tmp_path)
+            yield tmp_path
+        finally:
+            await run_in_threadpool(os.unlink, tmp_path)
+
+
+def _create_storage():
+    if settings.storage_backend == "s3":
+        return S3Storage(settings.s3_bucket, settings.s3_endpoint_url, settings.s3_region, settings.s3_public_url)
+    return LocalStorage(settings.upload_dir)
+
+
+storage = _create_storage()
+
+
+def check_upload(content_type: str, content_length: str = None):
+    # Cheap checks to run before any of the body is read
+    if content_type not in IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail=f"Unsupported image type, expected one of {', '.join(IMAGE_EXTENSIONS)}")
+    if content_length is not None and content_length.isdigit() and int(content_length) > settings.upload_max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"File larger than {settings.upload_max_bytes} bytes")
+
+
+def sniff_content_type(path: str):
+    # The type of the image at `path`, read from its header by Pillow. The
+    # client's Content-Type only decides whether an upload is attempted; what
+    # is stored, and the type it is stored and served as, is what the bytes are.
+    try:
+        with Image.open(path) as image:
+            content_type = image.get_format_mimetype()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        content_type = None
+    if content_type not in IMAGE_EXTENSIONS:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail=f"File is not an image of type {', '.join(IMAGE_EXTENSIONS)}")
+    return content_type
+
+
+async def staging_dir():
+    # Temporary files live on the same filesystem as LocalStorage
+    path = os.path.join(settings.upload_dir, ".tmp")
+    await run_in_threadpool(os.makedirs, path, exist_ok=True)
+    return path
+
+
+async def staging_file():
+    fd, tmp_path = await run_in_threadpool(tempfile.mkstemp, dir=await staging_dir())
+    os.close(fd)
+    return tmp_path
+
+
+def content_key(prefix: str, content_hash: str, content_type: str):
+    return f"{prefix}/{content_hash[:2]}/{content_hash}{IMAGE_EXTENSIONS[content_type]}"
+
+
+def variants_prefix(key: str):
+    # Variants of the photo at `key` are filed under the photo's name, so the
+    # photo, and the post it belongs to, can be found from a variant's key
+    return f"posts/variants/{os.path.splitext(os.path.basename(key))[0]}"
+
+
+async def store_file(tmp_path: str, content_hash: str, content_type: str, prefix: str):
+    # Publish a staged file under its content hash, unless it is already stored
+    key = content_key(prefix, content_hash, content_type)
+    if not await storage.exists(key):
+        await storage.save(tmp_path, key, content_type)
+    return key
+
+
+async def store_upload(chunks, content_type: str, prefix: str = "posts"):
+    """Stream `chunks` into storage under the SHA-256 of their content.
+
+    The data is hashed and size-checked while it is written to a staging file,
+    so nothing is buffered in memory and oversized uploads stop at the limit.
+    Files that are not an accepted image are refused, whatever `content_type`
+    claims. Identical files map to the same key and are stored once. Returns
+    the key.
+    """
+    check_upload(content_type)
+    tmp_path = await staging_file()
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(tmp_path, "wb") as out:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > settings.upload_max_bytes:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                        detail=f"File larger than {settings.upload_max_bytes} bytes")
+                digest.update(chunk)
+                await out.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty file")
+
+        content_type = await run_in_threadpool(sniff_content_type, tmp_path)
+        return await store_file(tmp_path, digest.hexdigest(), content_type, prefix)
+    finally:
+        if await anyio.Path(tmp_path).exists():
+            await anyio.Path(tmp_path).unlink()
+
+
+async def iter_upload_file(file, chunk_size: int = CHUNK_SIZE):
+    while chunk := await file.read(chunk_size):
+        yield chunk
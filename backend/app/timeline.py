@@ -0,0 +1,114 @@
+import bisect
+import logging
+import threading
+
+from sqlalchemy import select
+
+from . import models
+from .config import settings
+from .database import session_scope
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # optional, only needed for timeline_backend = "redis"
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Home timelines for /feed.
+#
+# When a writer with at most fanout_max_followers followers creates a post, its
+# id is pushed onto the timeline of every follower (fan-out on write). A
+# timeline holds the newest timeline_max_length post ids of the people a user
+# follows. Writers with more followers are not fanned out; their posts are
+# read from the posts table when a feed is built (fan-out on read). Timelines
+# only ever narrow down which posts to fetch: the feed query still checks that
+# the author is followed and the post exists and is published.
+
+FANOUT_CHUNK = 1000
+
+
+class MemoryTimelines:
+    # Per process, so for a single worker (see gunicorn.conf.py); lost on
+    # restart, after which /feed reads past the new timelines by author.
+
+    def __init__(self, max_length: int):
+        self.max_length = max_length
+        self._timelines = {}
+        self._lock = threading.Lock()
+
+    async def add(self, user_ids, post_ids):
+        with self._lock:
+            for user_id in user_ids:
+                # ascending ids, newest last
+                timeline = self._timelines.setdefault(user_id, [])
+                for post_id in post_ids:
+                    index = bisect.bisect_left(timeline, post_id)
+                    if index == len(timeline) or timeline[index] != post_id:
+                        timeline.insert(index, post_id)
+                del timeline[:-self.max_length]
+
+    async def get(self, user_id):
+        with self._lock:
+            return self._timelines.get(user_id, [])[::-1]
+
+    async def clear(self):
+        with self._lock:
+            self._timelines.clear()
+
+
+class RedisTimelines:
+    # A sorted set per user scored by post id, so backfilled older posts land
+    # in order; works with Redis and API-compatible servers
+
+    def __init__(self, url: str, max_length: int, prefix: str = "blog:timeline:"):
+        if redis is None:
+            raise RuntimeError("timeline_backend 'redis' requires the redis package")
+        self._client = redis.from_url(url)
+        self.max_length = max_length
+        self._prefix = prefix
+
+    async def add(self, user_ids, post_ids):
+        members = {str(post_id): post_id for post_id in post_ids}
+        async with self._client.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                key = f"{self._prefix}{user_id}"
+                pipe.zadd(key, members)
+                pipe.zremrangebyrank(key, 0, -self.max_length - 1)
+            await pipe.execute()
+
+    async def get(self, user_id):
+        return [int(post_id) for post_id in await self._client.zrevrange(f"{self._prefix}{user_id}", 0, -1)]
+
+    async def clear(self):
+        async for key in self._client.scan_iter(match=f"{self._prefix}*"):
+            await self._client.delete(key)
+
+
+def _create_timelines():
+    if settings.timeline_backend == "redis":
+        return RedisTimelines(settings.timeline_redis_url or settings.cache_redis_url, settings.timeline_max_length)
+    return MemoryTimelines(settings.timeline_max_length)
+
+
+timelines = _create_timelines()
+
+
+def is_fanned_out(follower_count: int) -> bool:
+    return follower_count <= settings.fanout_max_followers
+
+
+async def fan_out_post(post_id: int, owner_id: int):
+    # Runs as a background task after create_post has responded
+    try:
+        async with session_scope() as db:
+            follower_count = await db.scalar(select(models.User.follower_count).where(models.User.id == owner_id))
+            if follower_count is None or not is_fanned_out(follower_count):
+                return
+            followers = (await db.scalars(
+                select(models.Follow.follower_id).where(models.Follow.followee_id == owner_id)
+            )).all()
+        for start in range(0, len(followers), FANOUT_CHUNK):
+            await timelines.add(followers[start:start + FANOUT_CHUNK], [post_id])
+    except Exception:
+        logger.exception("fan-out of post %s failed", post_id)
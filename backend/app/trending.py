@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import math
+import os
+import tempfile
+
+from sqlalchemy import case, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .cache import response_cache
+from .config import settings
+from .database import session_scope
+from .serialization import select_posts
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, where every worker runs the decay task
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Trending ("hot") ranking of posts.
+#
+# posts.hot_score is an exponentially decaying sum of activity: every vote adds
+# trending_vote_weight, every comment trending_comment_weight, and the total
+# halves every trending_half_life_hours. hot_updated_at is the time the score
+# was last brought up to date. Writers decay the stored score to now and add
+# their weight in one UPDATE; a background task decays every live score every
+# trending_decay_interval_seconds, so the indexed column can be read in order
+# as is. Between two runs of the task scores are at most that stale.
+
+# Scores below this are rounded down to 0 and no longer touched by the task
+SCORE_FLOOR = 0.01
+# Postgres raises on exp() underflow, so anything decayed further is just 0
+MAX_EXPONENT = 700
+
+
+def _decay_rate():
+    return math.log(2) / (settings.trending_half_life_hours * 3600)
+
+
+def _seconds_since(db: AsyncSession, column):
+    if db.bind.dialect.name == "postgresql":
+        return func.extract("epoch", func.now() - column)
+    return (func.julianday("now") - func.julianday(column)) * 86400
+
+
+def _decayed_score(db: AsyncSession):
+    exponent = _decay_rate() * _seconds_since(db, models.Post.hot_updated_at)
+    return case((exponent > MAX_EXPONENT, 0.0), else_=models.Post.hot_score * func.exp(-exponent))
+
+
+def _at_least_zero(db: AsyncSession, value):
+    if db.bind.dialect.name == "postgresql":
+        return func.greatest(value, 0.0)
+    return func.max(value, 0.0)
+
+
+def bumped_score(db: AsyncSession, weight):
+    # Values for an UPDATE of posts that decays the stored score to now and
+    # adds `weight` (a number or a bind parameter). An unvote takes back the
+    # full weight of a vote that has decayed since, so the result is floored
+    # at 0 rather than left negative.
+    return {"hot_score": _at_least_zero(db, _decayed_score(db) + weight), "hot_updated_at": func.now()}
+
+
+async def bump_score(db: AsyncSession, post_id: int, weight: float):
+    # Part of the caller's transaction; the caller commits
+    await db.execute(
+        update(models.Post)
+        .where(models.Post.id == post_id)
+        .values(**bumped_score(db, weight))
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def decay_scores(db: AsyncSession):
+    decayed = _decayed_score(db)
+    result = await db.execute(
+        update(models.Post)
+        # Negative scores left by earlier unvotes are zeroed too
+        .where(models.Post.hot_score != 0)
+        .values(hot_score=case((decayed < SCORE_FLOOR, 0.0), else_=decayed), hot_updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+def trending_query(limit: int):
+    # Walks ix_posts_hot_score_id from the top; cost depends on `limit`, not on
+    # the number of posts
+    return (
+        select_posts(models.Post.hot_score)
+        .where(models.Post.published, models.Post.hot_score > 0)
+        .order_by(models.Post.hot_score.desc(), models.Post.id.desc())
+        .limit(limit)
+    )
+
+
+def _decay_lock(path: str):
+    # The open lock file when this process got it, else None. The OS releases
+    # it when the process exits, so another worker takes over the task.
+    lock_file = open(path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+async def run_decay_task():
+    # Started by the app lifespan of every worker, but only the one holding the
+    # lock file decays; the others retry every interval in case it exits. Each
+    # run only decays by the time elapsed since the last one, so runs on
+    # several hosts are harmless.
+    path = settings.trending_decay_lock_file or os.path.join(tempfile.gettempdir(), "blog-trending-decay.lock")
+    lock_file = None
+    try:
+        while True:
+            await asyncio.sleep(settings.trending_decay_interval_seconds)
+            if fcntl is not None and lock_file is None:
+                lock_file = _decay_lock(path)
+                if lock_file is None:
+                    continue
+            try:
+                async with session_scope() as db:
+                    count = await decay_scores(db)
+                await response_cache.invalidate("trending")
+                logger.debug("decayed %d trending scores", count)
+            except Exception:
+                logger.exception("trending score decay failed")
+    finally:
+        if lock_file is not None:
+            lock_file.close()
@@ -1,6 +1,15 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
+from .config import settings
+from .instrumentation import timed
 
-pwd_context = CryptContext(schemes=["bcrypt"] , deprecated = "auto")
+# Hashes below BCRYPT_ROUNDS count as outdated; without min_rounds passlib
+# would accept them as they are and never upgrade them
+BCRYPT_ROUNDS = 12
+pwd_context = CryptContext(schemes=["bcrypt"] , deprecated = "auto",
+                           bcrypt__rounds = BCRYPT_ROUNDS, bcrypt__min_rounds = BCRYPT_ROUNDS)
 
 def hash(password : str):
   return pwd_context.hash(password)
@@ -9,3 +18,53 @@ def hash(password : str):
 def verify(plain_password , hashed_password):
   return pwd_context.verify(plain_password , hashed_password)
 
+
+def verify_and_update(plain_password , hashed_password):
+  # (matches, new hash or None); a new hash is returned when the stored one
+  # uses deprecated settings, e.g. a lower bcrypt cost than pwd_context's.
+  return pwd_context.verify_and_update(plain_password , hashed_password)
+
+
+# bcrypt is CPU bound and holds the GIL for its whole run, so the async APIs
+# below hand it to a dedicated, size-capped process pool instead of the shared
+# threadpool. At most hash_queue_limit calls may be running or waiting; past
+# that, callers get a 503 with Retry-After rather than queueing forever.
+
+_hash_pool = None
+_hash_inflight = 0
+
+
+def _get_hash_pool():
+  global _hash_pool
+  if _hash_pool is None:
+    _hash_pool = ProcessPoolExecutor(max_workers=settings.hash_workers)
+  return _hash_pool
+
+
+def shutdown_hash_pool():
+  global _hash_pool
+  if _hash_pool is not None:
+    _hash_pool.shutdown(wait=True, cancel_futures=True)
+    _hash_pool = None
+
+
+async def _run_in_hash_pool(fn, *args):
+  global _hash_inflight
+  if _hash_inflight >= settings.hash_queue_limit:
+    raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail="Server busy, please retry",
+                        headers={"Retry-After": str(settings.hash_retry_after_seconds)})
+  _hash_inflight += 1
+  try:
+    with timed("bcrypt_seconds"):
+      return await asyncio.get_running_loop().run_in_executor(_get_hash_pool(), fn, *args)
+  finally:
+    _hash_inflight -= 1
+
+
+async def hash_async(password : str):
+  return await _run_in_hash_pool(hash, password)
+
+
+async def verify_and_update_async(plain_password , hashed_password):
+  return await _run_in_hash_pool(verify_and_update, plain_password, hashed_password)
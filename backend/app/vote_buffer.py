@@ -0,0 +1,214 @@
+import asyncio
+import logging
+
+from sqlalchemy import bindparam, delete, select, tuple_, update
+
+from . import models
+from .cache import response_cache
+from .config import settings
+from .database import dialect_insert, session_scope
+from .trending import bumped_score
+
+logger = logging.getLogger(__name__)
+
+# Write-behind votes (vote_buffer_enabled).
+#
+# Votes are collected in process, keyed on (user, post) so that the last vote
+# a user sent for a post wins, and written every vote_buffer_interval_ms, or as
+# soon as vote_buffer_max_items are waiting, in one transaction: a multi-row
+# INSERT ... ON CONFLICT DO NOTHING for the upvotes, a multi-row DELETE for the
+# removals, and one UPDATE per post carrying the summed vote_count and trending
+# deltas. A burst of votes on one post then costs a commit per batch instead of
+# a commit per vote.
+#
+# With vote_buffer_durability "commit" a request waits for the commit of the
+# batch holding its vote (group commit) and gets the answer it would have got
+# without the buffer. With "none" it is answered as soon as the vote is
+# buffered; votes still buffered when the process dies are lost. Either way
+# the buffer is flushed when the app shuts down.
+
+ADDED, EXISTS, MISSING, REMOVED, ABSENT = "added", "exists", "missing", "removed", "absent"
+
+# Rows per INSERT / DELETE statement, to stay clear of bind parameter limits
+CHUNK_SIZE = 1000
+RETRY_SECONDS = 1
+
+
+class PendingVote:
+    __slots__ = ("dir", "waiters")
+
+    def __init__(self, direction: int):
+        self.dir = direction
+        self.waiters = []
+
+
+class VoteBuffer:
+    def __init__(self):
+        self._pending = {}  # (user_id, post_id) -> PendingVote
+        self._loop = None
+        self._task = None
+        self._closed = False
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        # Started by the first vote, on the loop serving requests
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._loop is not loop:
+            self._loop = loop
+            self._waiting = asyncio.Event()  # set by the first vote after a flush
+            self._full = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._closed = False
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, user_id: int, post_id: int, direction: int, wait: bool = True):
+        """Buffer a vote; with `wait`, return (outcome, post's vote_count) once written."""
+        self.start()
+        key = (user_id, post_id)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = PendingVote(direction)
+        pending.dir = direction
+        self._waiting.set()
+        if len(self._pending) >= settings.vote_buffer_max_items:
+            self._full.set()
+        if not wait:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        pending.waiters.append(future)
+        return await future
+
+    async def _run(self):
+        interval = settings.vote_buffer_interval_ms / 1000
+        while True:
+            await self._waiting.wait()
+            if not self._closed:
+                # Give the batch time to fill, unless it already has
+                try:
+                    await asyncio.wait_for(self._full.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._waiting.clear()
+            self._full.clear()
+            if self._closed:
+                return
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("writing buffered votes failed, retrying in %ss", RETRY_SECONDS)
+                await asyncio.sleep(RETRY_SECONDS)
+
+    async def close(self):
+        # Stop the flusher between batches, then write whatever is left
+        if self._task is not None:
+            self._closed = True
+            # Wakes the flusher up whether it waits for votes or for the batch
+            # to fill
+            self._waiting.set()
+            self._full.set()
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("dropping %d buffered votes on shutdown", len(self._pending))
+
+    async def flush(self):
+        async with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            try:
+                outcomes, counts = await _write(batch)
+            except Exception as error:
+                # Waiting requests get the error; the rest go back for a retry,
+                # behind any newer vote for the same (user, post)
+                for key, pending in batch.items():
+                    if pending.waiters:
+                        for future in pending.waiters:
+                            if not future.done():
+                                future.set_exception(error)
+                    else:
+                        self._pending.setdefault(key, pending)
+                if self._pending and self._task is not None:
+                    self._waiting.set()
+                raise
+            for key, pending in batch.items():
+                for future in pending.waiters:
+                    if not future.done():
+                        future.set_result((outcomes[key], counts.get(key[1])))
+            return len(batch)
+
+
+async def _write(batch):
+    adds = sorted(key for key, pending in batch.items() if pending.dir == 1)
+    removes = sorted(key for key, pending in batch.items() if pending.dir != 1)
+    inserted, deleted, deltas = set(), set(), {}
+
+    async with session_scope() as db:
+        existing = set()
+        if adds:
+            # FOR KEY SHARE keeps the posts from being deleted before the insert
+            existing = set(await db.scalars(
+                select(models.Post.id)
+                .where(models.Post.id.in_(sorted({post_id for _, post_id in adds})))
+                .order_by(models.Post.id)
+                .with_for_update(key_share=True)
+            ))
+            rows = [{"user_id": user_id, "post_id": post_id} for user_id, post_id in adds if post_id in existing]
+            for start in range(0, len(rows), CHUNK_SIZE):
+                result = await db.execute(
+                    dialect_insert(db)(models.Vote)
+                    .values(rows[start:start + CHUNK_SIZE])
+                    .on_conflict_do_nothing()
+                    .returning(models.Vote.user_id, models.Vote.post_id)
+                )
+                inserted.update(tuple(row) for row in result)
+        for start in range(0, len(removes), CHUNK_SIZE):
+            result = await db.execute(
+                delete(models.Vote)
+                .where(tuple_(models.Vote.user_id, models.Vote.post_id).in_(removes[start:start + CHUNK_SIZE]))
+                .returning(models.Vote.user_id, models.Vote.post_id)
+            )
+            deleted.update(tuple(row) for row in result)
+
+        for _, post_id in inserted:
+            deltas[post_id] = deltas.get(post_id, 0) + 1
+        for _, post_id in deleted:
+            deltas[post_id] = deltas.get(post_id, 0) - 1
+        changed = sorted(post_id for post_id, delta in deltas.items() if delta)
+        if changed:
+            # One statement executed for every post, in id order like the locks
+            posts = models.Post.__table__
+            await db.execute(
+                update(posts)
+                .where(posts.c.id == bindparam("b_id"))
+                .values(vote_count=posts.c.vote_count + bindparam("b_delta"),
+                        **bumped_score(db, bindparam("b_weight"))),
+                [{"b_id": post_id, "b_delta": deltas[post_id],
+                  "b_weight": deltas[post_id] * settings.trending_vote_weight} for post_id in changed],
+            )
+
+        counts = {}
+        awaited = sorted({post_id for (_, post_id), pending in batch.items() if pending.waiters})
+        if awaited:
+            counts = dict((await db.execute(
+                select(models.Post.id, models.Post.vote_count).where(models.Post.id.in_(awaited))
+            )).all())
+        await db.commit()
+
+    if changed:
+        await response_cache.invalidate(*(f"post:{post_id}" for post_id in changed))
+
+    outcomes = {}
+    for key in adds:
+        outcomes[key] = ADDED if key in inserted else EXISTS if key[1] in existing else MISSING
+    for key in removes:
+        outcomes[key] = REMOVED if key in deleted else ABSENT
+    return outcomes, counts
+
+
+vote_buffer = VoteBuffer()
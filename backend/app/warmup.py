@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+
+import httpx
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+from .database import async_engine, engine
+from .replicas import replicas
+
+logger = logging.getLogger(__name__)
+
+# Work done by the lifespan before a worker takes traffic (warmup_enabled):
+# the connection pools the worker will use are filled up to db_pool_size, and
+# warmup_paths are fetched in process, which fills the response cache and the
+# database's buffer cache for the busiest pages. Failures are logged and the
+# worker starts anyway; a cold pool is slower, not broken.
+
+
+def _fill_sync_pool(target, count):
+    connections = []
+    try:
+        for _ in range(count):
+            conn = target.connect()
+            connections.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        # Back into the pool, which keeps up to pool_size of them open
+        for conn in connections:
+            conn.close()
+
+
+async def _fill_async_pool(target, count):
+    async def ping(conn):
+        await conn.execute(text("SELECT 1"))
+
+    connections = await asyncio.gather(*(target.connect() for _ in range(count)), return_exceptions=True)
+    opened = [conn for conn in connections if not isinstance(conn, BaseException)]
+    try:
+        await asyncio.gather(*(ping(conn) for conn in opened))
+    finally:
+        for conn in opened:
+            await conn.close()
+    errors = [conn for conn in connections if isinstance(conn, BaseException)]
+    if errors:
+        raise errors[0]
+
+
+async def warm_pools():
+    if settings.db_pgbouncer:
+        # NullPool: nothing is kept between checkouts
+        return
+    count = settings.db_pool_size
+    if settings.database_async:
+        targets = [async_engine] + [replica.async_engine for replica in replicas]
+        await asyncio.gather(*(_fill_async_pool(target, count) for target in targets))
+    else:
+        targets = [engine] + [replica.engine for replica in replicas]
+        await asyncio.gather(*(run_in_threadpool(_fill_sync_pool, target, count) for target in targets))
+
+
+async def warm_caches(app):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://warmup") as client:
+        for path in settings.warmup_paths:
+            response = await client.get(path)
+            if response.status_code >= 400:
+                logger.warning("warmup GET %s returned %d", path, response.status_code)
+
+
+async def warm_up(app):
+    started = time.perf_counter()
+    try:
+        await warm_pools()
+    except Exception:
+        logger.warning("could not fill the connection pools, starting anyway", exc_info=True)
+    try:
+        await warm_caches(app)
+    except Exception:
+        logger.warning("could not warm the response cache, starting anyway", exc_info=True)
+    logger.info("warmed up in %.3fs", time.perf_counter() - started)
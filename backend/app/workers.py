@@ -0,0 +1,34 @@
+import importlib
+
+try:
+    from uvicorn_worker import UvicornWorker as _UvicornWorker
+except ImportError:  # older setups, where the worker still ships with uvicorn
+    from uvicorn.workers import UvicornWorker as _UvicornWorker
+
+from .config import settings
+
+
+def _installed(module: str):
+    try:
+        importlib.import_module(module)
+        return True
+    except ImportError:
+        return False
+
+
+def event_loop():
+    if settings.server_loop != "auto":
+        return settings.server_loop
+    return "uvloop" if _installed("uvloop") else "asyncio"
+
+
+def http_parser():
+    if settings.server_http != "auto":
+        return settings.server_http
+    return "httptools" if _installed("httptools") else "h11"
+
+
+class UvicornWorker(_UvicornWorker):
+    # Picked once in the gunicorn master, so every worker runs the same stack.
+    # Lifespan "on": a worker whose startup fails exits instead of serving.
+    CONFIG_KWARGS = {"loop": event_loop(), "http": http_parser(), "lifespan": "on"}
@@ -0,0 +1,190 @@
+"""Flag sequential scans over large tables in the queries the routers run.
+
+Replays a request to each route against a database seeded by bench.seed, in
+process, and records every statement the app sends. Each one is then run
+through EXPLAIN (FORMAT JSON), along with the lookup Postgres makes on the
+referencing table for every ON DELETE CASCADE foreign key. Every Seq Scan over
+a table with at least --min-rows rows is reported, and the exit status is 1
+when there is any, so CI can run it after migrating and seeding a scratch
+database:
+
+    DATABASE_URL=postgresql://.../scratch alembic upgrade head
+    DATABASE_URL=postgresql://.../scratch python -m bench.seed --manifest bench-data.json
+    DATABASE_URL=postgresql://.../scratch python -m bench.explain --manifest bench-data.json
+
+Statements are only planned, never executed by EXPLAIN, but the write routes
+do run: a post, a comment and a reply are left behind.
+
+tests/test_explain.py runs the same check in the test suite when
+TEST_DATABASE_URL points at Postgres.
+"""
+import argparse
+import json
+import random
+import sys
+
+from fastapi.testclient import TestClient
+from sqlalchemy import bindparam, event, literal_column, select, text
+
+from app import models
+from app.cache import response_cache
+from app.config import settings
+from app.database import engine
+from app.main import app
+
+PLANNED = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+
+class StatementLog:
+    """Distinct statements sent on `engine`, each with the route that sent it."""
+
+    def __init__(self):
+        self.route = None
+        self.statements = {}
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            parameters = parameters[0] if parameters else None
+        if statement.lstrip().upper().startswith(PLANNED):
+            self.statements.setdefault(statement, (self.route, parameters))
+
+
+def replay_routes(client, manifest, log, rng):
+    def call(route, method, url, **kw):
+        log.route = route
+        response = client.request(method, url, **kw)
+        if response.status_code >= 400:
+            print(f"{route}: {response.status_code} {response.text}", file=sys.stderr)
+        return response
+
+    def login(email):
+        response = call("POST /login", "POST", "/login",
+                        data={"username": email, "password": manifest["password"]})
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    writer_id, writer_email = rng.choice(manifest["writers"])
+    viewer_id, viewer_email = rng.choice(manifest["viewers"])
+    writer, viewer = login(writer_email), login(viewer_email)
+    post_id = manifest["first_post"] + rng.randrange(manifest["posts"])
+    word = rng.choice(manifest["words"])
+
+    page = call("GET /posts", "GET", "/posts?limit=20")
+    cursor = page.headers.get("X-Next-Cursor")
+    if cursor:
+        call("GET /posts (cursor)", "GET", "/posts", params={"limit": 20, "cursor": cursor})
+    call("GET /posts (skip)", "GET", "/posts?limit=20&skip=1000")
+    call("GET /posts (search)", "GET", "/posts", params={"search": word})
+    call("GET /posts/search", "GET", "/posts/search", params={"q": word})
+    call("GET /posts/trending", "GET", "/posts/trending")
+    call("GET /feed", "GET", "/feed", headers=viewer)
+    call("GET /comments/post/{id}", "GET", f"/comments/post/{post_id}")
+
+    comment = call("POST /comments", "POST", "/comments/", headers=viewer,
+                   params={"post_id": post_id}, json={"text": "explain"}).json()
+    call("POST /comments (reply)", "POST", "/comments/", headers=viewer,
+         params={"post_id": post_id}, json={"text": "explain", "parent_id": comment.get("id")})
+    call("GET /comments/{id}/thread", "GET", f"/comments/{comment.get('id')}/thread")
+
+    call("POST /vote", "POST", "/vote/", headers=viewer, json={"post_id": post_id, "dir": 1})
+    call("POST /vote (remove)", "POST", "/vote/", headers=viewer, json={"post_id": post_id, "dir": 0})
+
+    call("POST /users/{id}/follow", "POST", f"/users/{writer_id}/follow", headers=viewer)
+    call("DELETE /users/{id}/follow", "DELETE", f"/users/{writer_id}/follow", headers=viewer)
+
+    created = call("POST /posts", "POST", "/posts", headers=writer,
+                   json={"title": "explain", "content": "explain", "published": False}).json()
+    call("PUT /posts/{id}", "PUT", f"/posts/{created.get('id')}", headers=writer,
+         json={"title": "explain", "content": "explain", "published": False})
+
+
+def cascade_lookups():
+    # What the foreign key triggers run when a referenced row is deleted
+    for table in models.Base.metadata.sorted_tables:
+        for fk in table.foreign_keys:
+            if fk.ondelete and fk.ondelete.upper() == "CASCADE":
+                query = select(literal_column("1")).select_from(table).where(fk.parent == bindparam("id", 1))
+                yield f"ON DELETE CASCADE {fk.target_fullname} -> {table.name}.{fk.parent.name}", query
+
+
+def table_rows(conn):
+    rows = conn.execute(text(
+        "SELECT c.relname, c.reltuples FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relkind = 'r' AND n.nspname = current_schema()"
+    ))
+    return {name: int(tuples) for name, tuples in rows}
+
+
+def seq_scans(plan):
+    if plan["Node Type"] == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", ()):
+        yield from seq_scans(child)
+
+
+def explain(conn, statement, parameters):
+    row = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters or {}).scalar()
+    plan = row if isinstance(row, list) else json.loads(row)
+    return plan[0]["Plan"]
+
+
+def record_statements(manifest, seed=0):
+    # (route, statement, parameters) for every distinct statement the routes
+    # send, then the cascade lookups. Reads go through the synchronous engine
+    # and to the database: the caller turns off database_async and the
+    # response cache.
+    log = StatementLog()
+    event.listen(engine, "before_cursor_execute", log)
+    try:
+        replay_routes(TestClient(app), manifest, log, random.Random(seed))
+    finally:
+        event.remove(engine, "before_cursor_execute", log)
+
+    checks = [(route, statement, parameters) for statement, (route, parameters) in log.statements.items()]
+    for label, query in cascade_lookups():
+        compiled = query.compile(engine)
+        checks.append((label, str(compiled), compiled.params))
+    return checks
+
+
+def find_seq_scans(conn, checks, min_rows, verbose=False):
+    rows = table_rows(conn)
+    findings = []
+    for route, statement, parameters in checks:
+        plan = explain(conn, statement, parameters)
+        if verbose:
+            print(f"-- {route}\n{statement}\n{json.dumps(plan, indent=2)}\n", file=sys.stderr)
+        for table in seq_scans(plan):
+            if rows.get(table, 0) >= min_rows:
+                findings.append({"route": route, "table": table, "rows": rows.get(table, 0),
+                                 "statement": " ".join(statement.split())})
+    return findings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--manifest", default="bench-data.json", help="written by bench.seed")
+    parser.add_argument("--min-rows", type=int, default=10000,
+                        help="smaller tables may be scanned (planner estimate from pg_class)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="print every statement and its plan")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        parser.error("needs a Postgres database; plans from other databases say nothing about production")
+    with open(args.manifest) as source:
+        manifest = json.load(source)
+
+    settings.database_async = False
+    response_cache.backend = None
+    checks = record_statements(manifest, args.seed)
+    with engine.connect() as conn:
+        findings = find_seq_scans(conn, checks, args.min_rows, args.verbose)
+
+    json.dump({"statements": len(checks), "min_rows": args.min_rows, "seq_scans": findings}, sys.stdout, indent=2)
+    print()
+    sys.exit(1 if findings else 0)
+
+
+if __name__ == "__main__":
+    main()
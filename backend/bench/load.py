@@ -0,0 +1,87 @@
+"""Read/write latency benchmark for comparing the sync and async database modes.
+
+Start the server once with DATABASE_ASYNC=false and once with
+DATABASE_ASYNC=true, run this against each, and compare the reports:
+
+    DATABASE_ASYNC=true RATE_LIMIT_ENABLED=false uvicorn app.main:app --port 5000
+    python -m bench.load --url http://localhost:5000 --concurrency 200 \\
+        --duration 30 --token <viewer access token> --post-id 1
+
+Without --token only the public read endpoints are exercised.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from .common import latency_summary
+
+
+def build_requests(post_id, token):
+    requests = [
+        ("GET /posts", "GET", "/posts", {"params": {"limit": 20}}),
+        ("GET /comments/post/{id}", "GET", f"/comments/post/{post_id}", {}),
+    ]
+    if token:
+        auth = {"headers": {"Authorization": f"Bearer {token}"}}
+        # Toggle the same vote on and off; 409/404 answers still measure the path
+        requests.append(("POST /vote", "POST", "/vote/", {"json": {"post_id": post_id, "dir": 1}, **auth}))
+        requests.append(("POST /vote", "POST", "/vote/", {"json": {"post_id": post_id, "dir": 0}, **auth}))
+    return requests
+
+
+async def run(url, concurrency, duration, post_id, token):
+    requests = build_requests(post_id, token)
+    latencies = {name: [] for name, *_ in requests}
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                name, method, path, kwargs = random.choice(requests)
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    if response.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies[name].append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    total = sum(len(samples) for samples in latencies.values())
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests": total,
+        "errors": errors,
+        "requests_per_second": round(total / elapsed, 2),
+        "latency_ms": {name: latency_summary(samples) for name, samples in latencies.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--post-id", type=int, default=1)
+    parser.add_argument("--token", help="access token of a viewer, enables the vote requests")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.url, args.concurrency, args.duration, args.post_id, args.token))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
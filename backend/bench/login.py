@@ -0,0 +1,62 @@
+"""Login throughput benchmark.
+
+Fires concurrent POST /login requests at a running server and reports logins
+per second plus latency percentiles. Run it against a build from before and
+after a change to compare them, e.g.:
+
+    python -m bench.login --url http://localhost:5000 --email admin@example.com \\
+        --password admin123 --concurrency 50 --requests 1000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from .common import latency_summary
+
+
+async def run(url, email, password, concurrency, total):
+    latencies = []
+    statuses = {}
+    remaining = iter(range(total))
+
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        async def worker():
+            for _ in remaining:
+                start = time.perf_counter()
+                response = await client.post("/login", data={"username": email, "password": password})
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ok = statuses.get(200, 0)
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "logins_per_second": round(ok / elapsed, 2),
+        "statuses": statuses,
+        "latency_ms": latency_summary(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.url, args.email, args.password, args.concurrency, args.requests))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
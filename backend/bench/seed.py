@@ -0,0 +1,204 @@
+"""Seed a scratch database with benchmark users, posts, comments and votes.
+
+Rows are generated in Python with explicit ids and loaded with COPY on
+Postgres (multi-row INSERTs elsewhere); the denormalized counters and trending
+scores are computed up front, so the data looks as if it went through the API.
+The run is reproducible for a given --seed. A manifest describing the data is
+written for bench.suite:
+
+    DATABASE_URL=postgresql://.../scratch python -m bench.seed \\
+        --users 1000 --writers 100 --posts 10000 --comments 50000 \\
+        --votes 100000 --follows 5000 --manifest bench-data.json
+
+Every seeded user has the password given by --password.
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, text
+
+from app import models, utils
+from app.config import settings
+from app.database import engine
+
+CHUNK = 10000
+WORDS = (
+    "python fastapi postgres index cache latency async query feed vote comment "
+    "search ranking stream upload image thread timeline benchmark pool worker "
+    "database migration replica cursor keyset profile metric trace deploy"
+).split()
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def copy_rows(conn, table, columns, rows):
+    # COPY ... FROM STDIN on Postgres, executemany INSERTs elsewhere
+    rows = iter(rows)
+    while True:
+        chunk = [row for _, row in zip(range(CHUNK), rows)]
+        if not chunk:
+            return
+        if conn.dialect.name == "postgresql":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(chunk)
+            buffer.seek(0)
+            cursor = conn.connection.cursor()
+            cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        else:
+            conn.execute(table.insert(), [dict(zip(columns, row)) for row in chunk])
+
+
+def next_id(conn, model):
+    return (conn.scalar(select(func.max(model.id))) or 0) + 1
+
+
+def seed(args):
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    span = args.days * 86400
+    rate = math.log(2) / (settings.trending_half_life_hours * 3600)
+    password_hash = utils.hash(args.password)
+
+    with engine.begin() as conn:
+        first_user = next_id(conn, models.User)
+        first_post = next_id(conn, models.Post)
+        first_comment = next_id(conn, models.Comment)
+
+        writers = list(range(first_user, first_user + args.writers))
+        viewers = list(range(first_user + args.writers, first_user + args.users))
+        emails = {user_id: f"{args.prefix}-{user_id}@example.com" for user_id in writers + viewers}
+
+        # Followers first: follower_count goes on the user rows
+        follows = set()
+        target = min(args.follows, len(viewers) * len(writers))
+        while len(follows) < target:
+            follows.add((rng.choice(viewers), rng.choice(writers)))
+        follower_count = {}
+        for _, followee in follows:
+            follower_count[followee] = follower_count.get(followee, 0) + 1
+
+        copy_rows(conn, models.User.__table__,
+                  ("id", "email", "password", "role", "follower_count", "token_version", "created_at"),
+                  ((user_id, emails[user_id], password_hash,
+                    models.Role.blog_writer.value if user_id < viewers[0] else models.Role.viewer.value,
+                    follower_count.get(user_id, 0), 0, now - timedelta(seconds=span))
+                   for user_id in writers + viewers))
+        copy_rows(conn, models.Follow.__table__, ("follower_id", "followee_id", "created_at"),
+                  ((follower, followee, now) for follower, followee in follows))
+
+        # Posts: post n belongs to writers[n % len(writers)]
+        post_ids = list(range(first_post, first_post + args.posts))
+        post_created = {post_id: now - timedelta(seconds=rng.uniform(0, span)) for post_id in post_ids}
+
+        votes = set()
+        target = min(args.votes, len(viewers) * len(post_ids))
+        while len(votes) < target:
+            votes.add((rng.choice(viewers), rng.choice(post_ids)))
+        vote_count = {}
+        for _, post_id in votes:
+            vote_count[post_id] = vote_count.get(post_id, 0) + 1
+
+        # Comments: a third are replies to an earlier comment on the same post
+        comments = []
+        by_post = {}
+        reply_count = {}
+        for comment_id in range(first_comment, first_comment + args.comments):
+            post_id = rng.choice(post_ids)
+            siblings = by_post.setdefault(post_id, [])
+            parent = rng.choice(siblings) if siblings and rng.random() < 0.33 else None
+            created = post_created[post_id] + timedelta(seconds=rng.uniform(0, (now - post_created[post_id]).total_seconds()))
+            segment = models.Comment.path_segment(comment_id)
+            if parent is None:
+                path, depth, parent_id = segment, 0, None
+            else:
+                path, depth, parent_id = f"{parent[1]}.{segment}", parent[2] + 1, parent[0]
+                reply_count[parent_id] = reply_count.get(parent_id, 0) + 1
+            siblings.append((comment_id, path, depth))
+            comments.append((comment_id, sentence(rng, 12), rng.choice(viewers), post_id, created, parent_id, path, depth))
+        comment_count = {}
+        for comment in comments:
+            comment_count[comment[3]] = comment_count.get(comment[3], 0) + 1
+
+        def hot_score(post_id):
+            # As if all activity arrived when the post was created
+            activity = (vote_count.get(post_id, 0) * settings.trending_vote_weight
+                        + comment_count.get(post_id, 0) * settings.trending_comment_weight)
+            return activity * math.exp(-min(rate * (now - post_created[post_id]).total_seconds(), 700))
+
+        copy_rows(conn, models.Post.__table__,
+                  ("id", "title", "content", "published", "owner_id", "created_at",
+                   "vote_count", "hot_score", "hot_updated_at"),
+                  ((post_id, sentence(rng, 6), sentence(rng, 80), rng.random() > 0.05,
+                    writers[(post_id - first_post) % len(writers)], post_created[post_id],
+                    vote_count.get(post_id, 0), hot_score(post_id), now)
+                   for post_id in post_ids))
+        copy_rows(conn, models.Comment.__table__,
+                  ("id", "content", "user_id", "post_id", "created_at", "parent_id", "path", "depth", "reply_count"),
+                  (comment + (reply_count.get(comment[0], 0),) for comment in comments))
+        copy_rows(conn, models.Vote.__table__, ("user_id", "post_id"), votes)
+
+        if conn.dialect.name == "postgresql":
+            # Explicit ids leave the sequences behind
+            for table in ("users", "posts", "comments"):
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"))
+
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("ANALYZE users, posts, comments, votes, follows"))
+
+    return {
+        "password": args.password,
+        "writers": [[user_id, emails[user_id]] for user_id in writers],
+        "viewers": [[user_id, emails[user_id]] for user_id in viewers],
+        "first_post": first_post,
+        "posts": args.posts,
+        "first_comment": first_comment,
+        "comments": args.comments,
+        "votes": len(votes),
+        "follows": len(follows),
+        "words": WORDS,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000, help="total users, writers included")
+    parser.add_argument("--writers", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--comments", type=int, default=50000)
+    parser.add_argument("--votes", type=int, default=100000)
+    parser.add_argument("--follows", type=int, default=5000)
+    parser.add_argument("--days", type=float, default=30, help="spread of creation times")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--prefix", default="bench", help="email prefix of the seeded users")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--manifest", default="bench-data.json", help="where to write the manifest for bench.suite")
+    args = parser.parse_args()
+    if not 0 < args.writers < args.users:
+        parser.error("--writers must be between 1 and --users - 1")
+
+    started = time.perf_counter()
+    manifest = seed(args)
+    with open(args.manifest, "w") as out:
+        json.dump(manifest, out)
+    print(json.dumps({
+        "seconds": round(time.perf_counter() - started, 2),
+        "users": args.users,
+        "posts": args.posts,
+        "comments": args.comments,
+        "votes": manifest["votes"],
+        "follows": manifest["follows"],
+        "manifest": args.manifest,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
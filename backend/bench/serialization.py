@@ -0,0 +1,109 @@
+"""Serialization cost per page of the list endpoints.
+
+Builds pages of posts and comments in an in-memory SQLite database and times
+turning one page into its JSON body three ways:
+
+  fastapi   ORM objects validated through the response schema, dumped to
+            Python and encoded with json.dumps (FastAPI's default path)
+  pydantic  ORM objects validated and encoded with TypeAdapter.dump_json
+  rows      plain column rows shaped into dicts and encoded with orjson, as
+            the endpoints do now (see app/serialization.py)
+
+Query time is not included.
+
+    python -m bench.serialization --sizes 10,50,100 --repeat 200
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session, joinedload
+
+from app import models, schemas
+from app.serialization import comment_columns, comment_dict, dumps, post_dict, select_posts
+
+
+def build_pages(size):
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    now = datetime.now(timezone.utc)
+    with Session(engine) as db:
+        db.add(models.User(id=1, email="writer@example.com", password="x", role="blog_writer", created_at=now))
+        db.add(models.User(id=2, email="viewer@example.com", password="x", role="viewer", created_at=now))
+        for i in range(1, size + 1):
+            db.add(models.Post(
+                id=i, title=f"Post number {i}", content="Lorem ipsum dolor sit amet. " * 20, published=True,
+                owner_id=1, created_at=now - timedelta(minutes=i), hot_updated_at=now, vote_count=i,
+                photo_path=f"uploads/posts/{i:02x}/photo.jpg",
+                photo_variants={"thumbnail": "uploads/t.jpg", "medium": "uploads/m.jpg"},
+            ))
+            db.add(models.Comment(
+                id=i, content="A comment of moderate length. " * 4, user_id=2, post_id=1,
+                created_at=now - timedelta(minutes=i), path=models.Comment.path_segment(i),
+            ))
+        db.commit()
+
+    with Session(engine) as db:
+        return {
+            "posts": (
+                schemas.Post,
+                db.scalars(select(models.Post).order_by(models.Post.id)).unique().all(),
+                db.execute(select_posts().order_by(models.Post.id)).all(),
+                post_dict,
+            ),
+            "comments": (
+                schemas.CommentResponse,
+                db.scalars(
+                    select(models.Comment).options(joinedload(models.Comment.user)).order_by(models.Comment.id)
+                ).all(),
+                db.execute(
+                    select(*comment_columns(models.Comment.__table__))
+                    .join(models.User, models.User.id == models.Comment.user_id)
+                    .order_by(models.Comment.id)
+                ).all(),
+                comment_dict,
+            ),
+        }
+
+
+def measure(schema, objects, rows, to_dict, repeat):
+    adapter = TypeAdapter(List[schema])
+
+    def fastapi():
+        content = adapter.dump_python(adapter.validate_python(objects, from_attributes=True), mode="json")
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+    def pydantic():
+        return adapter.dump_json(adapter.validate_python(objects, from_attributes=True))
+
+    def fast_rows():
+        return dumps([to_dict(row) for row in rows])
+
+    assert json.loads(pydantic()) == json.loads(fast_rows()), "row builder out of step with the schema"
+    timings = {}
+    for name, fn in (("fastapi", fastapi), ("pydantic", pydantic), ("rows", fast_rows)):
+        best = min(timeit.repeat(fn, number=repeat, repeat=5)) / repeat
+        timings[f"{name}_us"] = round(best * 1e6, 1)
+    timings["speedup_vs_fastapi"] = round(timings["fastapi_us"] / timings["rows_us"], 1)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,50,100", help="comma-separated page sizes")
+    parser.add_argument("--repeat", type=int, default=200, help="serializations per timing run")
+    args = parser.parse_args()
+
+    results = {}
+    for size in (int(size) for size in args.sizes.split(",")):
+        pages = build_pages(size)
+        results[size] = {name: measure(*page, args.repeat) for name, page in pages.items()}
+    print(json.dumps({"repeat": args.repeat, "per_page": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Startup and shutdown times of the server, with and without the warmup.
+
+Starts the server with each of --servers in turn ("uvicorn": a single process,
+"gunicorn": gunicorn.conf.py with --workers workers), with the lifespan warmup
+on and off, and measures:
+
+- import: seconds to import app.main in a fresh interpreter
+- ready: seconds from launch until GET / answers
+- first_request / second_request: latency of the first two GET /posts, i.e.
+  what the first users pay for cold pools and caches
+- shutdown: seconds from SIGTERM until the server has exited
+
+    DATABASE_URL=postgresql://.../scratch CACHE_BACKEND=redis TIMELINE_BACKEND=redis \\
+        RATE_LIMIT_BACKEND=redis python -m bench.startup \\
+        --servers uvicorn,gunicorn --workers 4 --runs 5
+
+gunicorn refuses more than one worker with "memory" backends (see
+gunicorn.conf.py).
+
+Servers that are not installed are reported as unavailable.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+from app.config import settings
+
+from .common import latency_summary
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_seconds():
+    code = "import time; s = time.perf_counter(); import app.main; print(time.perf_counter() - s)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, check=True,
+                            capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def server_command(server, port, workers):
+    if server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "app.main:app", "-c", "gunicorn.conf.py",
+                "--bind", f"127.0.0.1:{port}", "--workers", str(workers)]
+    return [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+            "--loop", settings.server_loop, "--http", settings.server_http]
+
+
+def run_once(server, port, workers, warmup, timeout):
+    env = {**os.environ, "WARMUP_ENABLED": str(warmup).lower()}
+    started = time.perf_counter()
+    process = subprocess.Popen(server_command(server, port, workers), cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{server} exited with status {process.returncode} during startup")
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"{server} not ready after {timeout}s")
+                try:
+                    if client.get("/").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+            ready = time.perf_counter() - started
+
+            requests = []
+            for _ in range(2):
+                request_started = time.perf_counter()
+                client.get("/posts").raise_for_status()
+                requests.append(time.perf_counter() - request_started)
+    finally:
+        stopping = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        shutdown = time.perf_counter() - stopping
+    return {"ready": ready, "first_request": requests[0], "second_request": requests[1], "shutdown": shutdown}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", default="uvicorn,gunicorn")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=5057)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    report = {
+        "import": latency_summary([import_seconds() for _ in range(args.runs)]),
+        "server_loop": settings.server_loop,
+        "server_http": settings.server_http,
+        "servers": [],
+    }
+    for server in args.servers.split(","):
+        if importlib.util.find_spec(server) is None:
+            report["servers"].append({"server": server, "unavailable": True})
+            continue
+        for warmup in (False, True):
+            runs = [run_once(server, args.port, args.workers, warmup, args.timeout) for _ in range(args.runs)]
+            report["servers"].append({
+                "server": server,
+                "workers": args.workers if server == "gunicorn" else 1,
+                "warmup": warmup,
+                **{measure: latency_summary([run[measure] for run in runs]) for measure in runs[0]},
+            })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""Mixed-workload benchmark of the whole API with baseline comparison.
+
+Drives a running server with a weighted mix of feed reads, comment threads,
+search, votes, comments, logins and photo uploads, using the users and posts
+written by bench.seed, at one or more concurrency levels. Reports throughput,
+status counts and p50/p95/p99 latency per route as JSON, and optionally
+compares the run against an earlier report:
+
+    python -m bench.seed --manifest bench-data.json
+    RATE_LIMIT_ENABLED=false uvicorn app.main:app --port 5000
+    python -m bench.suite --url http://localhost:5000 --manifest bench-data.json \\
+        --concurrency 10,50,100 --duration 30 --output report.json \\
+        --baseline baseline.json
+
+The server runs without rate limits, which would otherwise cap logins, votes
+and comments from a single client address.
+
+With --baseline, the exit status is 1 when any route's p95 latency grew, or
+throughput shrank, by more than --tolerance percent, so the suite can gate a
+deploy. Use --write-baseline to store the run as the new baseline.
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from .common import latency_summary
+
+try:
+    from PIL import Image
+except ImportError:  # optional; uploads then reuse one tiny image
+    Image = None
+
+DEFAULT_MIX = "feed=30,trending=10,thread=15,personal=5,search=10,vote=12,comment=8,login=5,upload=5"
+
+# 1x1 PNG, for uploads when Pillow is missing
+TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360606060000000050001a5f645400000000049454e44ae426082"
+)
+
+
+def random_image(rng):
+    # A new image every time, so uploads are not deduplicated by content hash
+    if Image is None:
+        return TINY_PNG, "image/png"
+    buffer = io.BytesIO()
+    color = tuple(rng.randrange(256) for _ in range(3))
+    Image.new("RGB", (640, 480), color).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue(), "image/jpeg"
+
+
+class Workload:
+    def __init__(self, manifest, sessions, seed):
+        self.manifest = manifest
+        self.rng = random.Random(seed)
+        self.sessions = sessions
+        self.viewer_tokens = []
+        self.writer_tokens = []  # (writer index, token)
+
+    def post_id(self):
+        return self.manifest["first_post"] + self.rng.randrange(self.manifest["posts"])
+
+    def own_post_id(self, writer_index):
+        # bench.seed gives post n to writer n % writers
+        writers = len(self.manifest["writers"])
+        count = (self.manifest["posts"] - writer_index + writers - 1) // writers
+        return self.manifest["first_post"] + writer_index + writers * self.rng.randrange(max(count, 1))
+
+    async def login(self, client, email):
+        response = await client.post("/login", data={"username": email, "password": self.manifest["password"]})
+        response.raise_for_status()
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def prepare(self, client):
+        viewers = self.rng.sample(self.manifest["viewers"], min(self.sessions, len(self.manifest["viewers"])))
+        writers = self.rng.sample(range(len(self.manifest["writers"])), min(max(1, self.sessions // 5), len(self.manifest["writers"])))
+        self.viewer_tokens = [await self.login(client, email) for _, email in viewers]
+        self.writer_tokens = [(index, await self.login(client, self.manifest["writers"][index][1])) for index in writers]
+
+    # Each scenario returns (route, request kwargs for client.request)
+
+    def feed(self):
+        return "GET /posts", ("GET", "/posts", {"params": {"limit": 20}})
+
+    def trending(self):
+        return "GET /posts/trending", ("GET", "/posts/trending", {})
+
+    def thread(self):
+        return "GET /comments/post/{id}", ("GET", f"/comments/post/{self.post_id()}", {})
+
+    def personal(self):
+        return "GET /feed", ("GET", "/feed", {"headers": self.rng.choice(self.viewer_tokens)})
+
+    def search(self):
+        return "GET /posts/search", ("GET", "/posts/search", {"params": {"q": self.rng.choice(self.manifest["words"])}})
+
+    def vote(self):
+        body = {"post_id": self.post_id(), "dir": self.rng.choice((0, 1))}
+        return "POST /vote", ("POST", "/vote/", {"json": body, "headers": self.rng.choice(self.viewer_tokens)})
+
+    def comment(self):
+        return "POST /comments", ("POST", "/comments/", {
+            "params": {"post_id": self.post_id()},
+            "json": {"text": "benchmark comment"},
+            "headers": self.rng.choice(self.viewer_tokens),
+        })
+
+    def login_scenario(self):
+        _, email = self.rng.choice(self.manifest["viewers"])
+        return "POST /login", ("POST", "/login", {"data": {"username": email, "password": self.manifest["password"]}})
+
+    def upload(self):
+        writer_index, headers = self.rng.choice(self.writer_tokens)
+        content, content_type = random_image(self.rng)
+        return "PUT /admin/posts/{id}/photo", ("PUT", f"/admin/posts/{self.own_post_id(writer_index)}/photo", {
+            "content": content,
+            "headers": {**headers, "Content-Type": content_type},
+        })
+
+    def scenarios(self, mix):
+        by_name = {
+            "feed": self.feed, "trending": self.trending, "thread": self.thread, "personal": self.personal,
+            "search": self.search, "vote": self.vote, "comment": self.comment, "login": self.login_scenario,
+            "upload": self.upload,
+        }
+        unknown = set(mix) - set(by_name)
+        if unknown:
+            raise SystemExit(f"unknown scenarios in --mix: {', '.join(sorted(unknown))}")
+        return [by_name[name] for name in mix], list(mix.values())
+
+
+async def run_level(client, workload, mix, concurrency, duration, warmup):
+    scenarios, weights = workload.scenarios(mix)
+    samples, statuses = {}, {}
+    errors = 0
+    measuring = False
+    deadline = time.perf_counter() + warmup + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            route, (method, path, kwargs) = workload.rng.choices(scenarios, weights)[0]()
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = "error"
+            elapsed = time.perf_counter() - start
+            if not measuring:
+                continue
+            samples.setdefault(route, []).append(elapsed)
+            route_statuses = statuses.setdefault(route, {})
+            route_statuses[str(status)] = route_statuses.get(str(status), 0) + 1
+            if status == "error" or status >= 500:
+                errors += 1
+
+    tasks = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    await asyncio.sleep(warmup)
+    measuring = True
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(route_samples) for route_samples in samples.values())
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests": total,
+        "errors": errors,
+        "requests_per_second": round(total / elapsed, 2),
+        "routes": {
+            route: {
+                "requests": len(route_samples),
+                "requests_per_second": round(len(route_samples) / elapsed, 2),
+                "statuses": statuses[route],
+                "latency_ms": latency_summary(route_samples),
+            }
+            for route, route_samples in sorted(samples.items())
+        },
+    }
+
+
+async def run(args, manifest, mix):
+    levels = [int(level) for level in args.concurrency.split(",")]
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        workload = Workload(manifest, args.sessions, args.seed)
+        await workload.prepare(client)
+        results = []
+        for concurrency in levels:
+            result = await run_level(client, workload, mix, concurrency, args.duration, args.warmup)
+            print(json.dumps({"concurrency": concurrency, "requests_per_second": result["requests_per_second"],
+                              "errors": result["errors"]}), file=sys.stderr, flush=True)
+            results.append(result)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """Per level and route: p95 and throughput against the baseline.
+
+    A route regresses when its p95 grew by more than `tolerance` percent (and
+    by at least a millisecond, to ignore noise on very fast routes) or its
+    throughput fell by more than `tolerance` percent.
+    """
+    baseline_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    changes, regressions = [], []
+    for level in report["levels"]:
+        before_level = baseline_levels.get(level["concurrency"])
+        if before_level is None:
+            continue
+        for route, after in level["routes"].items():
+            before = before_level["routes"].get(route)
+            if before is None or not before["latency_ms"].get("count"):
+                continue
+            p95_before, p95_after = before["latency_ms"]["p95"], after["latency_ms"]["p95"]
+            rps_before, rps_after = before["requests_per_second"], after["requests_per_second"]
+            change = {
+                "concurrency": level["concurrency"],
+                "route": route,
+                "p95_ms": [p95_before, p95_after],
+                "p95_change_pct": round((p95_after - p95_before) / p95_before * 100, 1) if p95_before else None,
+                "rps": [rps_before, rps_after],
+                "rps_change_pct": round((rps_after - rps_before) / rps_before * 100, 1) if rps_before else None,
+            }
+            slower = p95_after > p95_before * (1 + tolerance / 100) and p95_after - p95_before >= 1
+            fewer = rps_after < rps_before * (1 - tolerance / 100)
+            changes.append(change)
+            if slower or fewer:
+                regressions.append(change)
+    return {"tolerance_pct": tolerance, "baseline_revision": baseline.get("revision"),
+            "changes": changes, "regressions": regressions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--manifest", default="bench-data.json", help="written by bench.seed")
+    parser.add_argument("--concurrency", default="10,50", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before each level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight,... out of " + DEFAULT_MIX)
+    parser.add_argument("--sessions", type=int, default=50, help="viewers to log in up front")
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--output", help="write the report here as well as to stdout")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=10, help="allowed regression in percent")
+    parser.add_argument("--write-baseline", help="also save the report to this path")
+    args = parser.parse_args()
+
+    with open(args.manifest) as manifest_file:
+        manifest = json.load(manifest_file)
+    mix = {}
+    for item in args.mix.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+
+    levels = asyncio.run(run(args, manifest, mix))
+    report = {
+        "revision": git_revision(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "url": args.url,
+        "mix": mix,
+        "duration": args.duration,
+        "levels": levels,
+    }
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report["comparison"] = compare(report, json.load(baseline_file), args.tolerance)
+        status = 1 if report["comparison"]["regressions"] else 0
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    for path in (args.output, args.write_baseline):
+        if path:
+            with open(path, "w") as out:
+                out.write(output)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
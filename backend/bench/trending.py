@@ -0,0 +1,148 @@
+"""Trending feed latency as the number of posts and votes grows.
+
+Grows the configured database to each size in turn and times the trending
+query (a read of the top of ix_posts_hot_score_id) at every step, next to the
+same ranking computed from the votes and comments tables at read time:
+
+    DATABASE_URL=postgresql://.../scratch python -m bench.trending \\
+        --sizes 1000,10000,100000 --votes-per-post 5
+
+The trending column should stay flat while the computed one grows with the
+table. Run it against a scratch database: seeded rows are not removed.
+"""
+import argparse
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+from app.database import engine
+from app.trending import _seconds_since, trending_query
+
+from .common import latency_summary
+
+BATCH = 5000
+
+
+def create_voters(count):
+    # Throwaway accounts to cast the seeded votes
+    suffix = int(time.time())
+    rows = [{"email": f"bench-{suffix}-{i}@example.com", "password": "x", "role": "viewer"} for i in range(count)]
+    with engine.begin() as conn:
+        return list(conn.execute(insert(models.User).returning(models.User.id), rows).scalars())
+
+
+def seed(count, voters, votes_per_post, days):
+    """Add `count` published posts with up to 2x `votes_per_post` votes each.
+
+    Scores are set the way the app would have left them after the votes, as
+    if each post's votes arrived when it was created.
+    """
+    now = datetime.now(timezone.utc)
+    rate = math.log(2) / (settings.trending_half_life_hours * 3600)
+    added_votes = 0
+    for start in range(0, count, BATCH):
+        posts, vote_counts = [], []
+        for _ in range(min(BATCH, count - start)):
+            age = random.uniform(0, days * 86400)
+            votes = random.randint(0, min(len(voters), 2 * votes_per_post))
+            vote_counts.append(votes)
+            posts.append({
+                "title": "bench", "content": "bench", "published": True, "owner_id": voters[0],
+                "created_at": now - timedelta(seconds=age), "vote_count": votes,
+                "hot_score": votes * settings.trending_vote_weight * math.exp(-min(rate * age, 700)),
+                "hot_updated_at": now,
+            })
+        with engine.begin() as conn:
+            ids = conn.execute(insert(models.Post).returning(models.Post.id, sort_by_parameter_order=True), posts).scalars()
+            votes = [
+                {"post_id": post_id, "user_id": user_id}
+                for post_id, n in zip(ids, vote_counts)
+                for user_id in random.sample(voters, n)
+            ]
+            if votes:
+                conn.execute(insert(models.Vote), votes)
+        added_votes += len(votes)
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE posts, votes, comments"))
+    return added_votes
+
+
+def computed_query(db, limit):
+    # The same ranking derived at read time, for comparison
+    votes = (
+        select(func.count()).select_from(models.Vote)
+        .where(models.Vote.post_id == models.Post.id).scalar_subquery()
+    )
+    comments = (
+        select(func.count()).select_from(models.Comment)
+        .where(models.Comment.post_id == models.Post.id).scalar_subquery()
+    )
+    rate = math.log(2) / (settings.trending_half_life_hours * 3600)
+    age = func.min(_seconds_since(db, models.Post.created_at) * rate, 700) if db.bind.dialect.name == "sqlite" \
+        else func.least(_seconds_since(db, models.Post.created_at) * rate, 700)
+    score = (votes * settings.trending_vote_weight + comments * settings.trending_comment_weight) * func.exp(-age)
+    return (
+        select(models.Post)
+        .where(models.Post.published)
+        .order_by(score.desc(), models.Post.id.desc())
+        .limit(limit)
+    )
+
+
+def time_query(build, repeat, limit):
+    samples = []
+    with Session(engine) as db:
+        query = build(db, limit)
+        db.execute(query).all()  # warm up
+        for _ in range(repeat):
+            start = time.perf_counter()
+            db.execute(query).all()
+            samples.append(time.perf_counter() - start)
+            db.expunge_all()
+    return latency_summary(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated post counts to grow the table to")
+    parser.add_argument("--votes-per-post", type=int, default=5)
+    parser.add_argument("--days", type=float, default=7, help="spread of post creation times")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--no-compare", action="store_true", help="skip the read-time computed ranking")
+    args = parser.parse_args()
+
+    voters = create_voters(max(1, 2 * args.votes_per_post))
+    with engine.connect() as conn:
+        posts = conn.scalar(select(func.count()).select_from(models.Post))
+        votes = conn.scalar(select(func.count()).select_from(models.Vote))
+
+    results = []
+    for size in sorted(int(size) for size in args.sizes.split(",")):
+        if size > posts:
+            votes += seed(size - posts, voters, args.votes_per_post, args.days)
+            posts = size
+        step = {
+            "posts": posts,
+            "votes": votes,
+            "trending_ms": time_query(lambda db, limit: trending_query(limit), args.repeat, args.limit),
+        }
+        if not args.no_compare:
+            step["computed_ms"] = time_query(computed_query, args.repeat, args.limit)
+        results.append(step)
+        print(json.dumps(step), flush=True)
+
+    print(json.dumps({"limit": args.limit, "repeat": args.repeat, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
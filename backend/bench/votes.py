@@ -0,0 +1,162 @@
+"""Commits per second of per-request votes against the write-behind buffer.
+
+Runs the app in process and has --concurrency viewers toggle their votes on a
+few hot posts for --duration seconds, once per mode: "direct" (a transaction
+per vote, the default path) and the two vote_buffer_durability settings,
+"commit" and "none". Reports requests and commits per second, status counts
+and latency for each mode, and whether posts.vote_count still matches the
+votes table once the run is over:
+
+    DATABASE_URL=postgresql://.../scratch python -m bench.seed --manifest bench-data.json
+    DATABASE_URL=postgresql://.../scratch python -m bench.votes --manifest bench-data.json \\
+        --concurrency 200 --duration 10 --hot-posts 3
+
+Votes are left in the database; run it against a scratch database.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+import httpx
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app import models, oauth
+from app.config import settings
+from app.database import async_engine, engine
+from app.main import app
+from app.vote_buffer import vote_buffer
+
+from .common import latency_summary
+
+MODES = ("direct", "commit", "none")
+
+
+class CommitCounter:
+    def __init__(self):
+        self.count = 0
+        self.engines = [engine] + ([async_engine.sync_engine] if async_engine is not None else [])
+
+    def __call__(self, conn):
+        self.count += 1
+
+    def __enter__(self):
+        for target in self.engines:
+            event.listen(target, "commit", self)
+        return self
+
+    def __exit__(self, *exc):
+        for target in self.engines:
+            event.remove(target, "commit", self)
+
+
+def viewer_tokens(manifest, count):
+    ids = [user_id for user_id, _ in manifest["viewers"][:count]]
+    with Session(engine) as db:
+        users = db.scalars(select(models.User).where(models.User.id.in_(ids))).all()
+    return [{"Authorization": f"Bearer {oauth.create_user_token(user)}"} for user in users]
+
+
+def drift(post_ids):
+    # Posts whose stored vote_count disagrees with the votes table
+    actual = (
+        select(func.count()).select_from(models.Vote)
+        .where(models.Vote.post_id == models.Post.id)
+        .scalar_subquery()
+    )
+    with Session(engine) as db:
+        return db.scalar(
+            select(func.count()).select_from(models.Post)
+            .where(models.Post.id.in_(post_ids), models.Post.vote_count != actual)
+        )
+
+
+async def run_mode(mode, tokens, post_ids, concurrency, duration, seed):
+    settings.vote_buffer_enabled = mode != "direct"
+    if mode != "direct":
+        settings.vote_buffer_durability = mode
+    latencies, statuses = [], Counter()
+
+    async def viewer(client, index):
+        rng = random.Random(seed + index)
+        headers = tokens[index % len(tokens)]
+        direction = 1
+        while time.perf_counter() < deadline:
+            body = {"post_id": rng.choice(post_ids), "dir": direction}
+            started = time.perf_counter()
+            response = await client.post("/vote/", json=body, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+            direction = 1 - direction
+
+    with CommitCounter() as commits:
+        # Server errors count as 500s instead of ending the run
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            started = time.perf_counter()
+            deadline = started + duration
+            await asyncio.gather(*(viewer(client, index) for index in range(concurrency)))
+            # Buffered votes count once they are written
+            await vote_buffer.close()
+            elapsed = time.perf_counter() - started
+
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "commits": commits.count,
+        "commits_per_second": round(commits.count / elapsed, 1),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "latency_ms": latency_summary(latencies),
+        "vote_count_drift": drift(post_ids),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--manifest", default="bench-data.json", help="written by bench.seed")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--hot-posts", type=int, default=3, help="posts the votes are spread over")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with open(args.manifest) as source:
+        manifest = json.load(source)
+    modes = [mode for mode in args.modes.split(",") if mode]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"unknown mode {mode!r}, expected one of {', '.join(MODES)}")
+
+    # Measuring the write path, not the per-user vote limit
+    settings.rate_limit_enabled = False
+    tokens = viewer_tokens(manifest, args.concurrency)
+    post_ids = [manifest["first_post"] + index for index in range(args.hot_posts)]
+
+    async def run_modes():
+        # One event loop for all of them, as the async engine's pool is bound to it
+        try:
+            return [await run_mode(mode, tokens, post_ids, args.concurrency, args.duration, args.seed)
+                    for mode in modes]
+        finally:
+            if async_engine is not None:
+                await async_engine.dispose()
+
+    reports = asyncio.run(run_modes())
+    print(json.dumps({
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "hot_posts": post_ids,
+        "database_async": settings.database_async,
+        "vote_buffer_interval_ms": settings.vote_buffer_interval_ms,
+        "vote_buffer_max_items": settings.vote_buffer_max_items,
+        "modes": reports,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Production server: gunicorn managing uvicorn workers.
+
+    gunicorn app.main:app -c gunicorn.conf.py
+
+One worker per CPU available to the process (WEB_CONCURRENCY overrides it),
+each an asyncio event loop on uvloop and httptools when installed (see
+app/workers.py). The app is imported once in the master and forked, so a
+broken import fails the deploy before any worker starts, and the workers share
+its memory. Each worker fills its database pools and response cache in the
+lifespan before taking traffic, and on SIGTERM finishes in-flight requests
+within graceful_timeout, flushes buffered votes and closes its connections.
+
+Every worker has its own pools (up to db_pool_size + db_max_overflow
+connections each, per database) and its own bcrypt and image process pools;
+size hash_workers and image_workers with the worker count in mind.
+
+The "memory" cache, timeline and rate limit backends only see their own
+process: with several workers, pages would go stale, feeds would miss posts
+and limits would multiply by the worker count. gunicorn refuses to start with
+more than one worker while any of them is in use; set them to "redis", or
+WEB_CONCURRENCY=1 to run a single worker. The trending decay task runs in one
+worker at a time (see app/trending.py).
+"""
+import multiprocessing
+import os
+
+from app.config import settings
+
+
+def _cpu_count():
+    # CPUs this process may run on (container limits, taskset), not the host's
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return multiprocessing.cpu_count()
+
+
+def _per_process_backends():
+    backends = {
+        "cache_backend": settings.cache_backend,
+        "timeline_backend": settings.timeline_backend,
+        "rate_limit_backend": settings.rate_limit_backend if settings.rate_limit_enabled else None,
+    }
+    return [name for name, backend in backends.items() if backend == "memory"]
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT') or os.environ.get('port') or 5000}"
+workers = int(os.environ.get("WEB_CONCURRENCY") or _cpu_count())
+worker_class = "app.workers.UvicornWorker"
+preload_app = True
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+# Proxies whose X-Forwarded-For is trusted, so the rate limits see the client
+forwarded_allow_ips = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    per_process = _per_process_backends()
+    if server.cfg.workers > 1 and per_process:
+        # gunicorn prints the error and exits with status 1
+        raise RuntimeError(
+            f"{server.cfg.workers} workers with {', '.join(per_process)} = \"memory\": every worker would keep "
+            "its own cache, timelines and rate limits, so writes would not be seen by the others (stale pages, "
+            "feeds missing posts, limits multiplied by the worker count). Use \"redis\" for these backends "
+            "or set WEB_CONCURRENCY=1."
+        )
+
+
+def post_fork(server, worker):
+    # The engines were created in the master by preload_app. Nothing connected
+    # there, but make sure no pooled connection is ever shared across the fork.
+    from app.database import async_engine, engine
+    from app.replicas import replicas
+
+    engine.dispose(close=False)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=False)
+    for replica in replicas:
+        replica.engine.dispose(close=False)
+        if replica.async_engine is not None:
+            replica.async_engine.sync_engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    worker.log.info("worker %s: %s event loop, %s HTTP parser",
+                    worker.pid, worker.config.loop, worker.config.http)
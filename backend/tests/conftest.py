@@ -0,0 +1,120 @@
+import datetime
+import os
+import tempfile
+
+# Settings are read at import time, so the environment has to be in place
+# before anything imports app. Both engines are created (database_async) and
+# the session_mode fixture picks the one requests use.
+_tmp = tempfile.mkdtemp(prefix="blog-tests-")
+os.environ.update({
+    "database_hostname": "localhost",
+    "database_port": "5432",
+    "database_password": "",
+    "database_name": "postgres",
+    "database_username": "postgres",
+    "secret_key": "test",
+    "algorithm": "HS256",
+    "access_token_expire_minutes": "30",
+    "database_url": os.environ.get("TEST_DATABASE_URL", f"sqlite:///{_tmp}/test.db"),
+    "database_async": "true",
+    "upload_dir": os.path.join(_tmp, "uploads"),
+    "rate_limit_enabled": "false",
+    "warmup_enabled": "false",
+    "trending_decay_interval_seconds": "0",
+    "db_pool_timeout": "120",
+})
+
+import anyio.to_thread
+import httpx
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import cache, database, models, oauth
+from app.config import settings
+from app.main import app
+
+ENGINES = [database.engine, database.async_engine.sync_engine]
+
+
+def _sqlite_connect(dbapi_connection, connection_record):
+    # now() for the server defaults, enforced foreign keys, and transactions
+    # begun by hand (see _sqlite_begin)
+    dbapi_connection.create_function("now", 0, lambda: datetime.datetime.utcnow().isoformat(" "))
+    dbapi_connection.execute("PRAGMA foreign_keys=ON")
+    dbapi_connection.execute("PRAGMA busy_timeout=60000")
+    dbapi_connection.isolation_level = None
+
+
+def _sqlite_begin(conn):
+    # Take the write lock up front: a deferred transaction that reads before
+    # it writes fails with "database is locked" instead of waiting its turn
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+if database.engine.dialect.name == "sqlite":
+    for _engine in ENGINES:
+        event.listen(_engine, "connect", _sqlite_connect)
+        event.listen(_engine, "begin", _sqlite_begin)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def tables(monkeypatch):
+    # A fresh schema and empty caches for every test
+    monkeypatch.setattr(cache.response_cache, "backend", cache._create_backend())
+    oauth._user_cache.clear()
+    models.Base.metadata.create_all(database.engine)
+    yield
+    models.Base.metadata.drop_all(database.engine)
+
+
+@pytest.fixture(params=["sync", "async"])
+def session_mode(request, monkeypatch):
+    monkeypatch.setattr(settings, "database_async", request.param == "async")
+    return request.param
+
+
+@pytest.fixture
+async def client(session_mode):
+    # In sync mode every request waiting for the SQLite write lock (or for a
+    # pooled connection) blocks a threadpool thread; with the default 40 the
+    # request holding the lock can be left without a thread to finish on
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens, threads = 1000, limiter.total_tokens
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+    # The async pool belongs to this test's event loop
+    await database.async_engine.dispose()
+    limiter.total_tokens = threads
+
+
+@pytest.fixture
+def db():
+    with Session(database.engine) as session:
+        yield session
+
+
+class StatementCounter:
+    # Collects the SQL sent through either engine
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@pytest.fixture
+def statements():
+    counter = StatementCounter()
+    for engine in ENGINES:
+        event.listen(engine, "before_cursor_execute", counter)
+    yield counter.statements
+    for engine in ENGINES:
+        event.remove(engine, "before_cursor_execute", counter)
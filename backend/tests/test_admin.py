@@ -0,0 +1,156 @@
+import pytest
+from sqlalchemy import func, select
+
+from app import jobs, models, oauth
+from app.cache import MemoryBackend, response_cache
+from app.config import settings
+
+
+def seed(db, extra_viewers=0):
+    admin = models.User(email="admin@example.com", password="x", role="admin")
+    writer = models.User(email="writer@example.com", password="x", role="blog_writer")
+    leaving = models.User(email="leaving@example.com", password="x", role="blog_writer")
+    viewers = [models.User(email=f"viewer{i}@example.com", password="x", role="viewer")
+               for i in range(extra_viewers)]
+    db.add_all([admin, writer, leaving, *viewers])
+    db.flush()
+
+    kept = models.Post(title="kept", content="c", owner_id=writer.id, published=True, vote_count=1)
+    gone = models.Post(title="gone", content="c", owner_id=leaving.id, published=True)
+    db.add_all([kept, gone])
+    db.flush()
+    question = models.Comment(content="q", user_id=writer.id, post_id=kept.id, path="", depth=0, reply_count=2)
+    db.add(question)
+    db.flush()
+    question.path = models.Comment.path_segment(question.id)
+    db.add_all([
+        models.Comment(content="a", user_id=leaving.id, post_id=kept.id, parent_id=question.id,
+                       path=f"{question.path}.", depth=1),
+        models.Comment(content="b", user_id=writer.id, post_id=kept.id, parent_id=question.id,
+                       path=f"{question.path}.", depth=1),
+        models.Comment(content="on gone", user_id=writer.id, post_id=gone.id, path="", depth=0),
+        models.Vote(user_id=leaving.id, post_id=kept.id),
+        models.Follow(follower_id=leaving.id, followee_id=writer.id),
+    ])
+    writer.follower_count = 1
+    db.flush()
+
+    tokens = {user.email: {"Authorization": f"Bearer {oauth.create_user_token(user)}"}
+              for user in (admin, writer, leaving, *viewers)}
+    ids = {"writer": writer.id, "leaving": leaving.id, "kept": kept.id, "gone": gone.id,
+           "question": question.id, "viewers": [viewer.id for viewer in viewers]}
+    db.commit()
+    return tokens, ids
+
+
+def count(db, model, *where):
+    try:
+        return db.scalar(select(func.count()).select_from(model).where(*where))
+    finally:
+        db.rollback()
+
+
+def column(db, column, id_column, id):
+    try:
+        return db.scalar(select(column).where(id_column == id))
+    finally:
+        db.rollback()
+
+
+@pytest.mark.anyio
+async def test_bulk_delete_cascades_and_adjusts_counters(client, db):
+    tokens, ids = seed(db)
+
+    response = await client.post("/admin/users/bulk-delete", json={"ids": [ids["leaving"]]},
+                                 headers=tokens["admin@example.com"])
+    assert response.status_code == 200
+    assert response.json()["status"] == "done" and response.json()["processed"] == 1
+
+    # Their posts with everything under them, their comments, votes and follows
+    assert count(db, models.User, models.User.id == ids["leaving"]) == 0
+    assert count(db, models.Post, models.Post.id == ids["gone"]) == 0
+    assert count(db, models.Comment, models.Comment.post_id == ids["gone"]) == 0
+    assert count(db, models.Comment, models.Comment.user_id == ids["leaving"]) == 0
+    assert count(db, models.Vote, models.Vote.user_id == ids["leaving"]) == 0
+    assert count(db, models.Follow, models.Follow.follower_id == ids["leaving"]) == 0
+
+    # And the counters of what stays no longer include them
+    assert column(db, models.Post.vote_count, models.Post.id, ids["kept"]) == 0
+    assert column(db, models.Comment.reply_count, models.Comment.id, ids["question"]) == 1
+    assert column(db, models.User.follower_count, models.User.id, ids["writer"]) == 0
+
+    # A deleted user's token stops working
+    response = await client.post("/posts", json={"title": "t", "content": "c"}, headers=tokens["leaving@example.com"])
+    assert response.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_large_bulk_jobs_run_in_chunks(client, db, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_batch_size", 2)
+    tokens, ids = seed(db, extra_viewers=5)
+
+    response = await client.post("/admin/users/bulk-role", json={"role": "viewer", "new_role": "blog_writer"},
+                                 headers=tokens["admin@example.com"])
+    assert response.status_code == 202
+    assert response.json()["total"] == 5
+    # The background task has run once the ASGI call returns
+    response = await client.get(response.headers["location"], headers=tokens["admin@example.com"])
+    assert response.status_code == 200
+    assert response.json()["status"] == "done"
+    assert response.json()["processed"] == 5
+    assert count(db, models.User, models.User.role == "blog_writer") == 7
+
+
+@pytest.mark.anyio
+async def test_failed_chunk_reports_how_far_the_job_got():
+    job = await jobs.create_job("test", 5)
+
+    async def handle_chunk(chunk):
+        if 4 in chunk:
+            raise RuntimeError("boom")
+
+    await jobs.run_chunked(job, [0, 1, 2, 3, 4], 2, handle_chunk)
+    stored = await jobs.get_job(job.id)
+    assert (stored.status, stored.processed, stored.error) == ("failed", 4, "boom")
+
+
+@pytest.mark.anyio
+async def test_jobs_are_kept_in_a_shared_cache_backend(monkeypatch):
+    backend = MemoryBackend(settings.cache_max_entries, settings.cache_ttl_seconds)
+    backend.shared = True
+    monkeypatch.setattr(response_cache, "backend", backend)
+
+    async def handle_chunk(chunk):
+        pass
+
+    job = await jobs.create_job("test", 3)
+    await jobs.run_chunked(job, [1, 2, 3], 2, handle_chunk)
+    # Read back from the backend, as another worker would
+    assert jobs._jobs.get(job.id) is None
+    stored = await jobs.get_job(job.id)
+    assert (stored.status, stored.processed, stored.total) == ("done", 3, 3)
+
+
+@pytest.mark.anyio
+async def test_role_changes_revoke_tokens(client, db):
+    tokens, ids = seed(db, extra_viewers=2)
+    admin = tokens["admin@example.com"]
+
+    response = await client.patch(f"/admin/user/{ids['writer']}/role", json={"role": "viewer"}, headers=admin)
+    assert response.status_code == 200
+    assert (await client.get("/feed", headers=tokens["writer@example.com"])).status_code == 401
+
+    for email in ("viewer0@example.com", "viewer1@example.com"):
+        assert (await client.get("/feed", headers=tokens[email])).status_code == 200
+    response = await client.post("/admin/users/bulk-role", json={"ids": ids["viewers"], "new_role": "blog_writer"},
+                                 headers=admin)
+    assert response.status_code == 200
+    for email in ("viewer0@example.com", "viewer1@example.com"):
+        assert (await client.get("/feed", headers=tokens[email])).status_code == 401
+
+    # New tokens carry the new role
+    viewer = db.get(models.User, ids["viewers"][0])
+    fresh = {"Authorization": f"Bearer {oauth.create_user_token(viewer)}"}
+    db.rollback()
+    response = await client.post("/posts", json={"title": "t", "content": "c"}, headers=fresh)
+    assert response.status_code == 200
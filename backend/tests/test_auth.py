@@ -0,0 +1,69 @@
+import pytest
+from jose import jwt
+
+from app import models, oauth
+
+
+def seed(db):
+    writer = models.User(email="writer@example.com", password="x", role="blog_writer")
+    db.add(writer)
+    db.flush()
+    token = oauth.create_user_token(writer)
+    legacy = oauth.create_access_token(data={"user_id": writer.id})
+    db.commit()
+    return token, legacy
+
+
+def user_lookups(statements):
+    # The users row loaded to check the token version
+    return [statement for statement in statements
+            if statement.startswith("SELECT users.id, users.email") and "WHERE users.id =" in statement]
+
+
+def create_post(client, token):
+    return client.post("/posts", json={"title": "t", "content": "c"}, headers={"Authorization": f"Bearer {token}"})
+
+
+@pytest.mark.anyio
+async def test_tokens_carry_the_role_and_token_version(client, db):
+    token, _ = seed(db)
+    claims = jwt.decode(token, oauth.SECRET_KEY, algorithms=oauth.ALGORITHM)
+    assert (claims["role"], claims["ver"]) == ("blog_writer", 0)
+
+
+@pytest.mark.anyio
+async def test_requests_are_authorized_without_a_users_query(client, db, statements):
+    token, _ = seed(db)
+
+    statements.clear()
+    assert (await create_post(client, token)).status_code == 200
+    assert len(user_lookups(statements)) == 1
+
+    # The token version comes from the user cache from then on
+    statements.clear()
+    assert (await create_post(client, token)).status_code == 200
+    assert user_lookups(statements) == []
+
+
+@pytest.mark.anyio
+async def test_tokens_without_a_role_claim_take_the_role_from_the_user(client, db):
+    _, legacy = seed(db)
+    assert (await create_post(client, legacy)).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_revoked_and_forged_tokens_are_refused(client, db):
+    token, _ = seed(db)
+    assert (await create_post(client, token)).status_code == 200
+
+    claims = jwt.decode(token, oauth.SECRET_KEY, algorithms=oauth.ALGORITHM)
+    forged = jwt.encode({**claims, "role": "admin"}, "not the secret", algorithm=oauth.ALGORITHM)
+    assert (await create_post(client, forged)).status_code == 401
+
+    # Revoked while cached: refused at once in this process
+    user_id = claims["user_id"]
+    db.execute(models.User.__table__.update().where(models.User.id == user_id)
+               .values(token_version=models.User.token_version + 1))
+    db.commit()
+    oauth.evict_user(user_id)
+    assert (await create_post(client, token)).status_code == 401
@@ -0,0 +1,83 @@
+import argparse
+
+import httpx
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from app import images, models, utils
+from app.main import app
+from bench import seed as bench_seed
+from bench.suite import DEFAULT_MIX, Workload, compare, run_level
+
+ARGS = dict(users=12, writers=3, posts=20, comments=60, votes=40, follows=10, days=3,
+            password="bench-password", prefix="bench", seed=1)
+
+
+def count(db, query):
+    try:
+        return db.scalar(query)
+    finally:
+        db.rollback()
+
+
+def test_seed_writes_consistent_data(db):
+    manifest = bench_seed.seed(argparse.Namespace(**ARGS))
+    assert (len(manifest["writers"]), len(manifest["viewers"])) == (3, 9)
+
+    assert count(db, select(func.count()).select_from(models.Post)) == 20
+    assert count(db, select(func.count()).select_from(models.Comment)) == 60
+    assert count(db, select(func.count()).select_from(models.Vote)) == manifest["votes"] == 40
+    assert count(db, select(func.count()).select_from(models.Follow)) == manifest["follows"] == 10
+    # The counters agree with the rows, as if written through the API
+    votes = select(func.count()).where(models.Vote.post_id == models.Post.id).scalar_subquery()
+    assert count(db, select(func.count()).select_from(models.Post).where(models.Post.vote_count != votes)) == 0
+    reply = aliased(models.Comment)
+    replies = select(func.count()).select_from(reply).where(reply.parent_id == models.Comment.id).scalar_subquery()
+    assert count(db, select(func.count()).select_from(models.Comment)
+                 .where(models.Comment.reply_count != replies)) == 0
+    followers = select(func.count()).where(models.Follow.followee_id == models.User.id).scalar_subquery()
+    assert count(db, select(func.count()).select_from(models.User)
+                 .where(models.User.follower_count != followers)) == 0
+
+    # A second run adds its rows after the existing ones
+    again = bench_seed.seed(argparse.Namespace(**{**ARGS, "prefix": "again"}))
+    assert again["votes"] == manifest["votes"] and again["first_post"] == manifest["first_post"] + 20
+
+
+@pytest.mark.anyio
+async def test_suite_drives_every_scenario(client, db, monkeypatch):
+    manifest = bench_seed.seed(argparse.Namespace(**ARGS))
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in DEFAULT_MIX.split(","))}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as bench:
+            workload = Workload(manifest, sessions=2, seed=1)
+            await workload.prepare(bench)
+            level = await run_level(bench, workload, mix, concurrency=2, duration=1.5, warmup=0.1)
+    finally:
+        utils.shutdown_hash_pool()
+        images.shutdown_image_pool()
+
+    assert level["concurrency"] == 2 and level["requests"] > 0
+    assert level["errors"] == 0
+    for route in level["routes"].values():
+        assert set(route["latency_ms"]) == {"count", "mean", "p50", "p95", "p99"}
+        assert all(int(status) < 500 for status in route["statuses"])
+
+
+def report(p95, rps):
+    return {"revision": "abc", "levels": [{"concurrency": 10, "routes": {
+        "GET /posts": {"requests_per_second": rps, "latency_ms": {"count": 100, "p95": p95}},
+    }}]}
+
+
+def test_compare_flags_slower_and_lower_throughput_routes():
+    baseline = report(p95=20.0, rps=100.0)
+
+    assert compare(report(21.0, 95.0), baseline, tolerance=10)["regressions"] == []
+    [slower] = compare(report(25.0, 100.0), baseline, tolerance=10)["regressions"]
+    assert slower["p95_change_pct"] == 25.0
+    [fewer] = compare(report(20.0, 80.0), baseline, tolerance=10)["regressions"]
+    assert fewer["rps_change_pct"] == -20.0
+    # Under a millisecond is noise, whatever the percentage
+    assert compare(report(0.9, 100.0), report(0.5, 100.0), tolerance=10)["regressions"] == []
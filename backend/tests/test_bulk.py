@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from app import models, oauth
+from app.config import settings
+
+
+def writer_headers(db):
+    writer = models.User(email="writer@example.com", password="x", role="blog_writer")
+    db.add(writer)
+    db.flush()
+    headers = {"Authorization": f"Bearer {oauth.create_user_token(writer)}"}
+    db.commit()
+    return headers
+
+
+def chunks(*parts):
+    async def stream():
+        for part in parts:
+            yield part
+    return stream()
+
+
+@pytest.mark.anyio
+async def test_import_refuses_a_line_over_the_limit(client, db, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_max_line_bytes", 200)
+    headers = writer_headers(db)
+    good = json.dumps({"title": "t", "content": "c"}).encode() + b"\n"
+
+    response = await client.post("/posts/import", content=good * 3, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 3
+
+    # An unterminated line is refused while it streams in, not once it ends
+    response = await client.post("/posts/import", content=chunks(good, b'{"title": "' + b"x" * 150, b"x" * 150),
+                                 headers=headers)
+    assert response.status_code == 413
+    assert "Line 2" in response.json()["detail"]
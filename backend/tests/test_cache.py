@@ -0,0 +1,54 @@
+import anyio
+import pytest
+from starlette.requests import Request
+
+from app.cache import MemoryBackend, response_cache
+
+
+def request(path="/posts", query=b"limit=10"):
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query, "headers": []})
+
+
+@pytest.mark.anyio
+async def test_write_during_query_invalidates_the_stored_page():
+    cached, version = await response_cache.lookup(request())
+    assert cached is None
+    # A vote on a post of the page commits while the page is being queried
+    await response_cache.invalidate("post:7")
+    await response_cache.store(request(), version, b"[]", tags=["posts", "post:7"])
+
+    cached, _ = await response_cache.lookup(request())
+    assert cached is None
+
+
+@pytest.mark.anyio
+async def test_page_stays_cached_until_one_of_its_tags_changes():
+    _, version = await response_cache.lookup(request())
+    await response_cache.store(request(), version, b"[]", tags=["posts", "post:7"])
+
+    await response_cache.invalidate("post:8")
+    cached, _ = await response_cache.lookup(request())
+    assert cached is not None
+
+    await response_cache.invalidate("post:7")
+    cached, _ = await response_cache.lookup(request())
+    assert cached is None
+
+
+@pytest.mark.anyio
+async def test_pages_built_from_lagging_data_miss_invalidations_within_the_lag(monkeypatch):
+    monkeypatch.setattr(response_cache, "backend", MemoryBackend(100, 30, lag_window=0.2))
+    await response_cache.invalidate("posts")
+    # Read from a replica which may not have the write behind that invalidation
+    lagging = request()
+    lagging.state.cache_lag = 0.2
+    _, version = await response_cache.lookup(lagging)
+    await response_cache.store(lagging, version, b"[]", tags=["posts"])
+    cached, _ = await response_cache.lookup(request())
+    assert cached is None
+
+    await anyio.sleep(0.3)
+    _, version = await response_cache.lookup(lagging)
+    await response_cache.store(lagging, version, b"[]", tags=["posts"])
+    cached, _ = await response_cache.lookup(request())
+    assert cached is not None
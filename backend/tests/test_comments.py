@@ -0,0 +1,131 @@
+import pytest
+from sqlalchemy import select
+
+from app import database, models, oauth
+from app.config import settings
+from app.routers import comments as comments_router
+
+
+def seed(db):
+    writer = models.User(email="writer@example.com", password="x", role="blog_writer")
+    viewer = models.User(email="viewer@example.com", password="x", role="viewer")
+    db.add_all([writer, viewer])
+    db.flush()
+    post = models.Post(title="t", content="c", owner_id=writer.id, published=True)
+    db.add(post)
+    db.flush()
+    headers = {"Authorization": f"Bearer {oauth.create_user_token(viewer)}"}
+    post_id = post.id
+    db.commit()
+    return headers, post_id
+
+
+def expected_threads(children, top, depth, breadth):
+    # The caps applied by hand: each kept comment's oldest `breadth` replies,
+    # `depth` levels down
+    kept, level = list(top), list(top)
+    for _ in range(depth):
+        level = [reply for comment in level for reply in children.get(comment, [])[:breadth]]
+        kept += level
+    return sorted(kept)
+
+
+@pytest.mark.anyio
+async def test_threads_follow_the_depth_and_breadth_caps(client, db):
+    headers, post_id = seed(db)
+    children = {}
+
+    async def comment(parent=None):
+        response = await client.post("/comments/", params={"post_id": post_id}, headers=headers,
+                                     json={"text": "c", "parent_id": parent})
+        assert response.status_code == 200
+        id = response.json()["id"]
+        children.setdefault(parent, []).append(id)
+        return id
+
+    # Two threads, each comment with more replies than the breadth shown
+    for _ in range(2):
+        top = await comment()
+        for _ in range(5):
+            reply = await comment(top)
+            for _ in range(4):
+                await comment(reply)
+
+    response = await client.get(f"/comments/post/{post_id}", params={"depth": 2, "breadth": 3})
+    assert response.status_code == 200
+    assert sorted(c["id"] for c in response.json()) == expected_threads(children, children[None], 2, 3)
+
+    response = await client.get(f"/comments/post/{post_id}", params={"depth": 1, "breadth": 2})
+    assert sorted(c["id"] for c in response.json()) == expected_threads(children, children[None], 1, 2)
+
+    thread_root = children[children[None][0]][1]
+    response = await client.get(f"/comments/{thread_root}/thread", params={"depth": 1, "breadth": 2})
+    assert sorted(c["id"] for c in response.json()) == expected_threads(children, [thread_root], 1, 2)
+
+
+def seed_tree(db, width, levels):
+    # A full tree: one top-level comment, `width` replies per comment
+    headers, post_id = seed(db)
+    user_id = db.scalar(select(models.User.id).where(models.User.role == "viewer"))
+    level = [None]
+    for depth in range(levels + 1):
+        comments = [
+            models.Comment(content="c", post_id=post_id, user_id=user_id, parent_id=parent and parent.id,
+                           depth=depth, path="", reply_count=0 if depth == levels else width)
+            for parent in level for _ in range(1 if parent is None else width)
+        ]
+        db.add_all(comments)
+        db.flush()
+        paths = {parent.id: parent.path for parent in level if parent is not None}
+        for comment in comments:
+            prefix = paths[comment.parent_id] + "." if comment.parent_id else ""
+            comment.path = prefix + models.Comment.path_segment(comment.id)
+        db.flush()
+        level = comments
+    db.commit()
+    return post_id
+
+
+def vm_steps(db, query):
+    # SQLite virtual machine instructions spent on the query
+    steps = [0]
+
+    def count():
+        steps[0] += 1
+
+    dbapi_connection = db.connection().connection.dbapi_connection
+    dbapi_connection.set_progress_handler(count, 100)
+    try:
+        rows = db.execute(query).all()
+    finally:
+        dbapi_connection.set_progress_handler(None, 0)
+        db.rollback()
+    return steps[0], rows
+
+
+@pytest.mark.anyio
+async def test_row_cap_bounds_a_wide_deep_tree(client, db, monkeypatch):
+    post_id = seed_tree(db, width=5, levels=5)
+    monkeypatch.setattr(settings, "comment_max_rows", 50)
+
+    response = await client.get(f"/comments/post/{post_id}", params={"depth": 5, "breadth": 5})
+    comments = response.json()
+    assert len(comments) == 50
+    # Breadth-first: all of the first levels, then part of the next
+    depths = [comment["depth"] for comment in comments]
+    assert [depths.count(depth) for depth in range(4)] == [1, 5, 25, 19]
+    ids = {comment["id"] for comment in comments}
+    assert all(comment["parent_id"] in ids for comment in comments if comment["depth"])
+
+
+@pytest.mark.skipif(database.engine.dialect.name != "sqlite", reason="counts SQLite VM steps")
+def test_row_cap_bounds_the_work_not_just_the_result(db, monkeypatch):
+    post_id = seed_tree(db, width=5, levels=5)
+    roots = comments_router._top_level(post_id, 50)
+    monkeypatch.setattr(settings, "comment_max_rows", 50)
+    capped, rows = vm_steps(db, comments_router._threads(db, roots, 5, 5))
+    assert len(rows) == 50
+    monkeypatch.setattr(settings, "comment_max_rows", 5000)
+    full, rows = vm_steps(db, comments_router._threads(db, roots, 5, 5))
+    assert len(rows) == 3906
+    assert capped * 20 < full, (capped, full)
@@ -0,0 +1,32 @@
+from argparse import Namespace
+
+import pytest
+
+from app import database
+from app.cache import response_cache
+from app.config import settings
+from bench import explain, seed
+
+pytestmark = pytest.mark.skipif(
+    database.engine.dialect.name != "postgresql",
+    reason="needs TEST_DATABASE_URL=postgresql://...; SQLite plans say nothing about production",
+)
+
+
+def test_router_queries_do_not_scan_tables(monkeypatch):
+    # The advisor of bench.explain on a small seeded database. With sequential
+    # scans disabled the planner only picks one when no index can serve the
+    # query, so the size of the tables does not matter.
+    monkeypatch.setattr(settings, "database_async", False)
+    monkeypatch.setattr(response_cache, "backend", None)
+    manifest = seed.seed(Namespace(
+        users=200, writers=20, posts=2000, comments=5000, votes=5000, follows=500,
+        days=30, password="explain", prefix="explain", seed=1,
+    ))
+    checks = explain.record_statements(manifest)
+
+    with database.engine.connect() as conn:
+        conn.exec_driver_sql("ANALYZE")
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        findings = explain.find_seq_scans(conn, checks, min_rows=0)
+    assert findings == []
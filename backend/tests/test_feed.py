@@ -0,0 +1,94 @@
+import pytest
+
+from app import models, oauth
+from app.config import settings
+from app.routers import feed
+from app.timeline import MemoryTimelines
+
+POSTS = 30
+
+
+def seed(db, drafts=()):
+    writer = models.User(email="writer@example.com", password="x", role="blog_writer")
+    viewer = models.User(email="viewer@example.com", password="x", role="viewer")
+    db.add_all([writer, viewer])
+    db.flush()
+    writer.follower_count = 1
+    db.add(models.Follow(follower_id=viewer.id, followee_id=writer.id))
+    posts = [models.Post(title=f"post {i}", content="c", owner_id=writer.id, published=i not in drafts)
+             for i in range(POSTS)]
+    db.add_all(posts)
+    db.flush()
+    headers = {"Authorization": f"Bearer {oauth.create_user_token(viewer)}"}
+    ids = [post.id for post in posts]
+    viewer_id = viewer.id
+    db.commit()
+    return headers, viewer_id, ids
+
+
+@pytest.fixture
+async def timelines(monkeypatch):
+    timelines = MemoryTimelines(settings.timeline_max_length)
+    monkeypatch.setattr(feed, "timelines", timelines)
+    return timelines
+
+
+def post_queries(statements):
+    return [statement for statement in statements if "FROM posts" in statement]
+
+
+async def read_feed(client, headers, **params):
+    response = await client.get("/feed", params={"limit": 10, **params}, headers=headers)
+    assert response.status_code == 200
+    return [post["id"] for post in response.json()], response.headers.get("x-next-cursor")
+
+
+@pytest.mark.anyio
+async def test_feed_is_read_from_the_timeline_by_id(client, db, timelines, statements):
+    headers, viewer_id, ids = seed(db)
+    await timelines.add([viewer_id], ids)
+
+    statements.clear()
+    page, cursor = await read_feed(client, headers)
+    assert page == ids[:-11:-1]
+    queries = post_queries(statements)
+    assert len(queries) == 1 and "posts.id IN" in queries[0]
+
+    statements.clear()
+    page, _ = await read_feed(client, headers, cursor=cursor)
+    assert page == ids[-11:-21:-1]
+    queries = post_queries(statements)
+    assert len(queries) == 1 and "posts.id IN" in queries[0]
+
+
+@pytest.mark.anyio
+async def test_feed_without_a_timeline_reads_by_author(client, db, timelines, statements):
+    headers, _, ids = seed(db)
+
+    statements.clear()
+    page, _ = await read_feed(client, headers)
+    assert page == ids[:-11:-1]
+    queries = post_queries(statements)
+    assert len(queries) == 1 and "posts.id IN" not in queries[0]
+
+
+@pytest.mark.anyio
+async def test_feed_skips_timeline_ids_that_no_longer_qualify(client, db, timelines):
+    # The newest posts went back to drafts after they were fanned out
+    headers, viewer_id, ids = seed(db, drafts=range(POSTS - 8, POSTS))
+    await timelines.add([viewer_id], ids)
+
+    page, _ = await read_feed(client, headers)
+    assert page == ids[-9:-19:-1]
+
+
+@pytest.mark.anyio
+async def test_feed_reads_past_the_end_of_the_timeline(client, db, timelines):
+    # A timeline rebuilt after a restart only holds the posts since
+    headers, viewer_id, ids = seed(db)
+    await timelines.add([viewer_id], ids[-3:])
+
+    page, cursor = await read_feed(client, headers)
+    assert page == ids[:-11:-1]
+    page, _ = await read_feed(client, headers, cursor=cursor)
+    assert page == ids[-11:-21:-1]
@@ -0,0 +1,40 @@
+import importlib.util
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from app.config import settings
+
+CONF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+
+
+def load_conf():
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", CONF)
+    conf = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(conf)
+    return conf
+
+
+def server(workers):
+    return SimpleNamespace(cfg=SimpleNamespace(workers=workers))
+
+
+def test_workers_default_to_the_cpu_count(monkeypatch):
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    conf = load_conf()
+    assert conf.workers == conf._cpu_count()
+
+
+def test_several_workers_with_memory_backends_refuse_to_start(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    conf = load_conf()
+    with pytest.raises(RuntimeError, match="cache_backend, timeline_backend, rate_limit_backend"):
+        conf.on_starting(server(4))
+    conf.on_starting(server(1))
+
+
+def test_several_workers_with_shared_backends_start(monkeypatch):
+    for name in ("cache_backend", "timeline_backend", "rate_limit_backend"):
+        monkeypatch.setattr(settings, name, "redis")
+    load_conf().on_starting(server(4))
@@ -0,0 +1,107 @@
+import hashlib
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from app import images, models, oauth
+from app.config import settings
+from app.storage import staging_dir, storage
+
+
+def image_bytes(size, fmt="JPEG"):
+    out = io.BytesIO()
+    Image.new("RGB", size, "green").save(out, format=fmt)
+    return out.getvalue()
+
+
+def seed(db):
+    writer = models.User(email="writer@example.com", password="x", role="blog_writer")
+    db.add(writer)
+    db.flush()
+    post = models.Post(title="t", content="c", owner_id=writer.id, published=True)
+    db.add(post)
+    db.flush()
+    headers = {"Authorization": f"Bearer {oauth.create_user_token(writer)}"}
+    post_id = post.id
+    db.commit()
+    return headers, post_id
+
+
+def stored_post(db, post_id):
+    try:
+        post = db.get(models.Post, post_id)
+        return post.photo_path, post.photo_variants
+    finally:
+        db.rollback()
+
+
+def local_path(url):
+    return os.path.join(settings.upload_dir, url.removeprefix("uploads/"))
+
+
+@pytest.fixture
+def image_pool():
+    yield
+    images.shutdown_image_pool()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("size, expected", [
+    ((2000, 1000), {"medium": (1024, 512), "medium_webp": (1024, 512),
+                    "thumbnail": (320, 160), "thumbnail_webp": (320, 160)}),
+    # Small photos are re-encoded, never enlarged
+    ((40, 30), {name: (40, 30) for name in images.VARIANTS}),
+])
+async def test_render_variants_sizes(tmp_path, size, expected):
+    src = tmp_path / "photo.png"
+    src.write_bytes(image_bytes(size, "PNG"))
+
+    rendered = images.render_variants(str(src), await staging_dir())
+    try:
+        assert set(rendered) == set(images.VARIANTS)
+        for name, (path, digest, content_type) in rendered.items():
+            with Image.open(path) as variant:
+                assert variant.size == expected[name]
+                assert variant.format == images.VARIANTS[name][1]
+            assert content_type == images.CONTENT_TYPES[variant.format]
+            with open(path, "rb") as saved:
+                assert hashlib.file_digest(saved, "sha256").hexdigest() == digest
+    finally:
+        for path, _, _ in rendered.values():
+            os.unlink(path)
+
+
+@pytest.mark.anyio
+async def test_upload_builds_variants_under_the_photo_hash(client, db, image_pool):
+    headers, post_id = seed(db)
+    data = image_bytes((600, 400))
+
+    response = await client.put(f"/admin/posts/{post_id}/photo", content=data,
+                                headers={**headers, "Content-Type": "image/jpeg"})
+    assert response.status_code == 200
+
+    # The background task has run once the ASGI call returns
+    photo_path, variants = stored_post(db, post_id)
+    digest = hashlib.sha256(data).hexdigest()
+    assert photo_path == storage.url(f"posts/{digest[:2]}/{digest}.jpg")
+    assert set(variants) == set(images.VARIANTS)
+    sizes = {"medium": (600, 400), "medium_webp": (600, 400), "thumbnail": (320, 213), "thumbnail_webp": (320, 213)}
+    for name, url in variants.items():
+        assert url.startswith(f"uploads/posts/variants/{digest}/")
+        with Image.open(local_path(url)) as variant:
+            assert variant.size == sizes[name]
+
+
+@pytest.mark.anyio
+async def test_upload_that_is_not_an_image_is_refused(client, db, image_pool):
+    headers, post_id = seed(db)
+
+    response = await client.put(f"/admin/posts/{post_id}/photo", content=b"GIF89a but not really",
+                                headers={**headers, "Content-Type": "image/gif"})
+    assert response.status_code == 415
+    response = await client.post(f"/admin/posts/{post_id}/upload-photo", headers=headers,
+                                 files={"file": ("photo.jpg", b"\xff\xd8\xff not a jpeg", "image/jpeg")})
+    assert response.status_code == 415
+    assert stored_post(db, post_id) == (None, None)
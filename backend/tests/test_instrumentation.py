@@ -0,0 +1,74 @@
+import re
+
+import httpx
+import pytest
+
+from app import instrumentation, main, models, utils
+from app.config import settings
+from conftest import ENGINES
+
+_instrumented = set()
+
+
+@pytest.fixture
+async def instrumented(client, monkeypatch):
+    # The app with the middleware added, as instrumentation_enabled does at
+    # startup, and fresh histograms. Engine listeners stay for the session;
+    # outside an instrumented request they record nothing.
+    for engine in ENGINES:
+        if engine not in _instrumented:
+            instrumentation.instrument_engine(engine)
+            _instrumented.add(engine)
+    metrics = instrumentation.RouteMetrics()
+    monkeypatch.setattr(instrumentation, "route_metrics", metrics)
+    monkeypatch.setattr(main, "route_metrics", metrics)
+    transport = httpx.ASGITransport(app=instrumentation.InstrumentationMiddleware(main.app))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+    utils.shutdown_hash_pool()
+
+
+def sample(text, name, method, route, status=200):
+    match = re.search(rf'^{name}{{method="{method}",route="{re.escape(route)}",status="{status}"}} (\S+)$',
+                      text, re.MULTILINE)
+    assert match, f"{name} {method} {route} missing"
+    return float(match.group(1))
+
+
+@pytest.mark.anyio
+async def test_route_histograms_count_sql_bcrypt_and_serialization(instrumented, db):
+    db.add(models.User(email="user@example.com", password=utils.hash("secret"), role="viewer"))
+    db.commit()
+
+    assert (await instrumented.post("/login", data={"username": "user@example.com", "password": "secret"})
+            ).status_code == 200
+    for limit in (1, 2):
+        assert (await instrumented.get("/posts", params={"limit": limit})).status_code == 200
+    assert (await instrumented.get("/comments/post/1")).status_code == 200
+    assert (await instrumented.get("/nowhere")).status_code == 404
+
+    text = (await instrumented.get("/metrics")).text
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert sample(text, "http_request_duration_seconds_count", "GET", "/posts") == 2
+    assert sample(text, "db_statements_per_request_sum", "GET", "/posts") >= 2
+    assert sample(text, "serialization_duration_seconds_sum", "GET", "/posts") > 0
+    assert sample(text, "bcrypt_duration_seconds_sum", "POST", "/login") > 0
+    assert sample(text, "bcrypt_duration_seconds_sum", "GET", "/posts") == 0
+    # Routes are labelled by their template, unknown paths all as one
+    assert sample(text, "http_request_duration_seconds_count", "GET", "/comments/post/{post_id}") == 1
+    assert sample(text, "http_request_duration_seconds_count", "GET", "unmatched", 404) == 1
+
+
+@pytest.mark.anyio
+async def test_requests_with_the_profile_token_are_profiled(instrumented, tmp_path, monkeypatch):
+    pytest.importorskip("pyinstrument")
+    monkeypatch.setattr(settings, "profile_token", "let-me-see")
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+
+    assert (await instrumented.get("/posts")).status_code == 200
+    assert (await instrumented.get("/posts", headers={"X-Profile": "wrong"})).status_code == 200
+    assert list(tmp_path.iterdir()) == []
+
+    assert (await instrumented.get("/posts", headers={"X-Profile": "let-me-see"})).status_code == 200
+    [profile] = tmp_path.iterdir()
+    assert profile.name.endswith("-GET-posts.html")
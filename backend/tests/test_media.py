@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from app import models, oauth
+from app.config import settings
+from app.storage import content_key, storage, variants_prefix
+
+DIGEST = "ab" * 32
+
+
+def store(key):
+    path = os.path.join(settings.upload_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as out:
+        out.write(b"image")
+
+
+def seed(db, published):
+    writer = models.User(email="writer@example.com", password="x", role="blog_writer")
+    other = models.User(email="other@example.com", password="x", role="blog_writer")
+    db.add_all([writer, other])
+    db.flush()
+    photo = content_key("posts", DIGEST, "image/jpeg")
+    variant = content_key(variants_prefix(photo), "cd" * 32, "image/webp")
+    store(photo)
+    store(variant)
+    db.add(models.Post(title="t", content="c", owner_id=writer.id, published=published,
+                       photo_path=storage.url(photo), photo_variants={"thumbnail_webp": storage.url(variant)}))
+    tokens = {user.email: {"Authorization": f"Bearer {oauth.create_user_token(user)}"} for user in (writer, other)}
+    db.commit()
+    return photo, variant, tokens
+
+
+@pytest.mark.anyio
+async def test_draft_photos_are_only_served_to_their_owner(client, db):
+    photo, variant, tokens = seed(db, published=False)
+    for key in (photo, variant):
+        assert (await client.get(f"/uploads/{key}")).status_code == 404
+        assert (await client.get(f"/uploads/{key}", headers=tokens["other@example.com"])).status_code == 404
+        response = await client.get(f"/uploads/{key}", headers=tokens["writer@example.com"])
+        assert response.status_code == 200
+        assert response.headers["cache-control"].startswith("private")
+
+
+@pytest.mark.anyio
+async def test_published_photos_are_public(client, db):
+    photo, variant, _ = seed(db, published=True)
+    for key in (photo, variant):
+        response = await client.get(f"/uploads/{key}")
+        assert response.status_code == 200
+        assert response.headers["cache-control"].startswith("public")
+
+
+@pytest.mark.anyio
+async def test_files_of_no_post_are_not_served(client, db):
+    seed(db, published=True)
+    orphan = content_key("posts", "ef" * 32, "image/png")
+    store(orphan)
+    assert (await client.get(f"/uploads/{orphan}")).status_code == 404
@@ -0,0 +1,60 @@
+import pytest
+from passlib.context import CryptContext
+from sqlalchemy import select
+
+from app import models, utils
+from app.config import settings
+
+
+@pytest.fixture
+def hash_pool():
+    yield
+    utils.shutdown_hash_pool()
+
+
+def stored_hash(db, email):
+    try:
+        return db.scalar(select(models.User.password).where(models.User.email == email))
+    finally:
+        db.rollback()
+
+
+def login(client, password="secret"):
+    return client.post("/login", data={"username": "user@example.com", "password": password})
+
+
+@pytest.mark.anyio
+async def test_login_upgrades_an_outdated_hash(client, db, hash_pool):
+    weak = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+    db.add(models.User(email="user@example.com", password=weak, role="viewer"))
+    db.commit()
+
+    assert (await login(client, "wrong")).status_code == 403
+    assert stored_hash(db, "user@example.com") == weak
+
+    assert (await login(client)).status_code == 200
+    upgraded = stored_hash(db, "user@example.com")
+    assert upgraded != weak
+    assert upgraded.startswith(f"$2b${utils.BCRYPT_ROUNDS}$")
+    assert not utils.pwd_context.needs_update(upgraded)
+    assert (await login(client)).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_registered_users_can_log_in(client, db, hash_pool):
+    response = await client.post("/admin/register",
+                                 json={"email": "user@example.com", "password": "secret", "role": "viewer"})
+    assert response.status_code == 200
+    assert utils.verify("secret", stored_hash(db, "user@example.com"))
+    assert (await login(client)).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_saturated_hash_pool_answers_503(client, db, hash_pool, monkeypatch):
+    db.add(models.User(email="user@example.com", password=utils.hash("secret"), role="viewer"))
+    db.commit()
+    monkeypatch.setattr(utils, "_hash_inflight", settings.hash_queue_limit)
+
+    response = await login(client)
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(settings.hash_retry_after_seconds)
@@ -0,0 +1,59 @@
+import pytest
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import NullPool
+
+from app import database
+from app.config import settings
+from app.pool_metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool, pool_status
+
+
+@pytest.mark.anyio
+async def test_pool_metrics_count_the_checkouts_of_requests(client, session_mode):
+    pool = "async" if session_mode == "async" else "sync"
+    before = (await client.get("/metrics/pool")).json()[pool]["wait_seconds"]["count"]
+
+    # Distinct pages, so none is answered from the response cache
+    for limit in (1, 2, 3):
+        assert (await client.get("/posts", params={"limit": limit})).status_code == 200
+    status = (await client.get("/metrics/pool")).json()[pool]
+
+    assert status["pool"].startswith("Instrumented")
+    assert status["wait_seconds"]["count"] >= before + 3
+    assert status["wait_seconds"]["buckets"]["+Inf"] == status["wait_seconds"]["count"]
+    assert status["checked_out"] == 0
+    assert status["checkout_failures"] == 0
+
+
+def test_checkout_timeouts_are_counted(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/pool.db", poolclass=InstrumentedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.05)
+    try:
+        with engine.connect():
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+            status = pool_status(engine.pool)
+            assert (status["checked_out"], status["checkout_failures"]) == (1, 1)
+            assert status["wait_seconds"]["count"] == 1
+    finally:
+        engine.dispose()
+
+
+def test_pool_options_come_from_the_settings(monkeypatch):
+    monkeypatch.setattr(settings, "db_pgbouncer", False)
+    options = database._engine_options(InstrumentedQueuePool)
+    assert options["poolclass"] is InstrumentedQueuePool
+    assert (options["pool_size"], options["max_overflow"], options["pool_timeout"],
+            options["pool_recycle"], options["pool_pre_ping"]) == (
+        settings.db_pool_size, settings.db_max_overflow, settings.db_pool_timeout,
+        settings.db_pool_recycle, settings.db_pool_pre_ping)
+
+
+def test_pgbouncer_mode_leaves_pooling_and_prepared_statements_to_pgbouncer(monkeypatch):
+    monkeypatch.setattr(settings, "db_pgbouncer", True)
+    assert database._engine_options(InstrumentedQueuePool) == {"poolclass": NullPool}
+
+    options = database._engine_options(InstrumentedAsyncQueuePool, is_async=True)
+    assert options["poolclass"] is NullPool
+    connect_args = options["connect_args"]
+    assert connect_args["statement_cache_size"] == connect_args["prepared_statement_cache_size"] == 0
+    assert connect_args["prepared_statement_name_func"]() != connect_args["prepared_statement_name_func"]()
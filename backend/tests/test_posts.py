@@ -0,0 +1,42 @@
+import pytest
+
+from app import models
+
+POSTS = 120
+
+
+def seed(db):
+    writers = [models.User(email=f"writer{i}@example.com", password="x", role="blog_writer") for i in range(3)]
+    viewer = models.User(email="viewer@example.com", password="x", role="viewer")
+    db.add_all([*writers, viewer])
+    db.flush()
+    posts = [
+        models.Post(title=f"post {i}", content="body", owner_id=writers[i % 3].id, published=True)
+        for i in range(POSTS)
+    ]
+    db.add_all(posts)
+    db.flush()
+    db.add_all(models.Vote(user_id=viewer.id, post_id=post.id) for post in posts[::2])
+    for post in posts[::2]:
+        post.vote_count = 1
+    voted = {post.id for post in posts[::2]}
+    db.commit()
+    return voted
+
+
+@pytest.mark.anyio
+async def test_feed_query_count_does_not_grow_with_page_size(client, db, statements):
+    voted = seed(db)
+    counts = {}
+    for size in (1, 10, 100):
+        statements.clear()
+        response = await client.get("/posts", params={"limit": size})
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) == size
+        # Owners and vote counts come with the page, not from lazy loads
+        assert all(post["owner"]["email"].startswith("writer") for post in page)
+        assert all(post["vote"] == (post["id"] in voted) for post in page)
+        counts[size] = len(statements)
+
+    assert counts[1] == counts[10] == counts[100], counts
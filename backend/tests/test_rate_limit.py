@@ -0,0 +1,55 @@
+import httpx
+import pytest
+
+from app import models, rate_limit, utils
+from app.config import settings
+from app.main import app
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(rate_limit, "backend", rate_limit.MemoryBackend(settings.rate_limit_max_keys))
+
+
+def from_ip(ip):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=(ip, 1234)), base_url="http://test")
+
+
+@pytest.mark.anyio
+async def test_failed_logins_from_one_ip_do_not_lock_the_account_out(client, db, limits):
+    db.add(models.User(email="victim@example.com", password=utils.hash("secret"), role="viewer"))
+    db.commit()
+    limit, _ = rate_limit.LOGIN_ACCOUNT.rate
+
+    async with from_ip("10.0.0.1") as attacker, from_ip("10.0.0.2") as victim:
+        for _ in range(limit):
+            response = await attacker.post("/login", data={"username": "victim@example.com", "password": "guess"})
+            assert response.status_code == 403
+        response = await attacker.post("/login", data={"username": "victim@example.com", "password": "guess"})
+        assert response.status_code == 429
+
+        response = await victim.post("/login", data={"username": "victim@example.com", "password": "secret"})
+        assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_guessing_from_many_ips_is_capped_per_login_name(client, db, limits, monkeypatch):
+    monkeypatch.setattr(rate_limit, "LOGIN_USERNAME", rate_limit.Policy("login:username", "8/hour"))
+    db.add(models.User(email="victim@example.com", password=utils.hash("secret"), role="viewer"))
+    db.commit()
+    limit, _ = rate_limit.LOGIN_ACCOUNT.rate
+
+    # Each IP stays under its own account bucket
+    assert limit > 4
+    for i in range(2):
+        async with from_ip(f"10.0.1.{i}") as attacker:
+            for _ in range(4):
+                response = await attacker.post("/login", data={"username": "victim@example.com", "password": "guess"})
+                assert response.status_code == 403
+
+    async with from_ip("10.0.1.9") as attacker:
+        response = await attacker.post("/login", data={"username": " Victim@example.com", "password": "guess"})
+        assert response.status_code == 429
+        response = await attacker.post("/login", data={"username": "other@example.com", "password": "guess"})
+        assert response.status_code == 403
@@ -0,0 +1,83 @@
+import os
+
+import anyio
+import httpx
+import pytest
+from sqlalchemy import create_engine
+
+from app import models, oauth, replicas
+from app.cache import MemoryBackend, response_cache
+from app.config import settings
+from app.database import SQLALCHEMY_DATABASE_URL
+from app.main import app
+
+
+@pytest.fixture
+async def replica(monkeypatch):
+    # The test database stands in for a replica that is never behind
+    replica = replicas.Replica(SQLALCHEMY_DATABASE_URL)
+    monkeypatch.setattr(replicas, "replicas", [replica])
+    monkeypatch.setattr(settings, "replica_lag_tolerance_seconds", 0.2)
+    yield replica
+    await replica.dispose()
+
+
+@pytest.mark.anyio
+async def test_pages_read_from_a_replica_expire_after_the_lag_tolerance(client, replica):
+    assert (await client.get("/posts")).status_code == 200
+    misses = response_cache.misses
+    assert (await client.get("/posts")).status_code == 200
+    assert response_cache.misses == misses
+
+    await anyio.sleep(0.3)
+    assert (await client.get("/posts")).status_code == 200
+    assert response_cache.misses == misses + 1
+
+
+@pytest.fixture
+async def stale_replica(monkeypatch):
+    # An empty copy of the schema: a replica that has none of the writes yet
+    url = "sqlite:///" + os.path.join(os.path.dirname(settings.upload_dir), "replica.db")
+    engine = create_engine(url)
+    models.Base.metadata.create_all(engine)
+    replica = replicas.Replica(url)
+    monkeypatch.setattr(replicas, "replicas", [replica])
+    monkeypatch.setattr(settings, "replica_lag_tolerance_seconds", 0.5)
+    monkeypatch.setattr(response_cache, "backend", MemoryBackend(settings.cache_max_entries,
+                                                                 settings.cache_ttl_seconds, lag_window=0.5))
+    yield replica
+    await replica.dispose()
+    models.Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_writers_read_their_writes_from_the_primary(client, db, stale_replica):
+    writer = models.User(email="writer@example.com", password="x", role="blog_writer")
+    other = models.User(email="other@example.com", password="x", role="blog_writer")
+    db.add_all([writer, other])
+    db.flush()
+    writer_headers = {"Authorization": f"Bearer {oauth.create_user_token(writer)}"}
+    other_headers = {"Authorization": f"Bearer {oauth.create_user_token(other)}"}
+    db.commit()
+
+    # The middleware is only installed when replicas are configured at startup
+    transport = httpx.ASGITransport(app=replicas.ReadYourWritesMiddleware(app))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as bearer_client:
+        response = await bearer_client.post("/posts", json={"title": "t", "content": "c"}, headers=writer_headers)
+        assert response.status_code == 200
+
+        # Another client caches the page the replica gives it; the writer
+        # neither gets that page nor caches theirs
+        assert (await bearer_client.get("/posts")).json() == []
+        assert len((await bearer_client.get("/posts", headers=writer_headers)).json()) == 1
+        assert (await bearer_client.get("/posts", headers=other_headers)).json() == []
+
+        # Built after the write was invalidated, but the replica may not have
+        # had it: not a hit within the lag window
+        misses = response_cache.misses
+        assert (await bearer_client.get("/posts")).json() == []
+        assert response_cache.misses == misses + 1
+
+        await anyio.sleep(0.6)
+        assert (await bearer_client.get("/posts", headers=writer_headers)).json() == []
@@ -0,0 +1,82 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import models, search
+
+LONG_CONTENT = "A walk through the garden. " * 20
+
+
+def seed(db):
+    writer = models.User(email="writer@example.com", password="x", role="blog_writer")
+    db.add(writer)
+    db.flush()
+    posts = {
+        "title": models.Post(title="Garden notes", content="Tomatoes and beans", owner_id=writer.id, published=True),
+        "content": models.Post(title="Weekend", content=LONG_CONTENT, owner_id=writer.id, published=True),
+        "draft": models.Post(title="Garden draft", content="Not yet", owner_id=writer.id, published=False),
+        "other": models.Post(title="Kitchen", content="Bread", owner_id=writer.id, published=True),
+    }
+    db.add_all(posts.values())
+    db.flush()
+    ids = {name: post.id for name, post in posts.items()}
+    db.commit()
+    return ids
+
+
+@pytest.mark.anyio
+async def test_search_ranks_title_matches_first(client, db):
+    ids = seed(db)
+
+    response = await client.get("/posts/search", params={"q": "GARDEN"})
+    assert response.status_code == 200
+    results = response.json()
+    assert [post["id"] for post in results] == [ids["title"], ids["content"]]
+    assert results[0]["rank"] > results[1]["rank"]
+
+
+@pytest.mark.anyio
+async def test_search_snippets_are_cut_from_the_content(client, db):
+    seed(db)
+
+    results = (await client.get("/posts/search", params={"q": "garden"})).json()
+    assert results[0]["snippet"] == "Tomatoes and beans"
+    assert results[1]["snippet"] == LONG_CONTENT[:search.FALLBACK_SNIPPET_LENGTH]
+
+
+@pytest.mark.anyio
+async def test_search_skips_drafts(client, db):
+    ids = seed(db)
+
+    results = (await client.get("/posts/search", params={"q": "draft"})).json()
+    assert results == []
+    results = (await client.get("/posts/search", params={"q": "garden", "limit": 100})).json()
+    assert ids["draft"] not in [post["id"] for post in results]
+
+
+@pytest.mark.anyio
+async def test_search_needs_a_term(client, db):
+    assert (await client.get("/posts/search", params={"q": ""})).status_code == 422
+
+
+@pytest.mark.anyio
+async def test_posts_list_filters_on_search(client, db):
+    ids = seed(db)
+
+    response = await client.get("/posts", params={"search": "garden"})
+    assert response.status_code == 200
+    assert sorted(post["id"] for post in response.json()) == sorted([ids["title"], ids["content"]])
+
+    response = await client.get("/posts", params={"search": "kitchen"})
+    assert [post["id"] for post in response.json()] == [ids["other"]]
+
+
+class _Postgres:
+    class bind:
+        dialect = postgresql.dialect()
+
+
+def test_postgres_search_uses_the_tsvector():
+    sql = str(search.search_filter(_Postgres, "garden beds").compile(dialect=postgresql.dialect()))
+    assert "posts.search_vector @@ websearch_to_tsquery" in sql
+    sql = str(search.search_rank(_Postgres, "garden").compile(dialect=postgresql.dialect()))
+    assert sql.startswith("ts_rank_cd(posts.search_vector")
@@ -0,0 +1,79 @@
+import datetime
+
+import pytest
+
+from app import models, schemas
+from app.serialization import dumps
+
+
+def seed(db):
+    writer = models.User(email="writer@example.com", password="x", role="blog_writer")
+    viewer = models.User(email="viewer@example.com", password="x", role="viewer")
+    db.add_all([writer, viewer])
+    db.flush()
+    posts = [
+        models.Post(title="plain", content="c", owner_id=writer.id, published=True),
+        models.Post(title="photo", content="c", owner_id=writer.id, published=True, vote_count=3,
+                    photo_path="uploads/posts/ab/ab.jpg", photo_variants={"thumbnail": "uploads/posts/variants/t.jpg"}),
+    ]
+    db.add_all(posts)
+    db.flush()
+    top = models.Comment(content="top", user_id=viewer.id, post_id=posts[0].id, path="", depth=0, reply_count=1)
+    db.add(top)
+    db.flush()
+    top.path = models.Comment.path_segment(top.id)
+    reply = models.Comment(content="reply", user_id=writer.id, post_id=posts[0].id, parent_id=top.id, path="",
+                           depth=1)
+    db.add(reply)
+    db.flush()
+    reply.path = f"{top.path}.{models.Comment.path_segment(reply.id)}"
+    post_id = posts[0].id
+    db.commit()
+    return post_id
+
+
+def validated(schema, item):
+    # What FastAPI would have produced from the same data through the schema
+    return schema.model_validate(item).model_dump(mode="json")
+
+
+@pytest.mark.anyio
+async def test_list_pages_match_their_response_schemas(client, db):
+    post_id = seed(db)
+
+    response = await client.get("/posts")
+    assert response.headers["content-type"] == "application/json"
+    posts = response.json()
+    assert len(posts) == 2
+    for post in posts:
+        assert post == validated(schemas.Post, post)
+        assert list(post) == list(schemas.Post.model_fields)
+    photo = next(post for post in posts if post["title"] == "photo")
+    assert photo["vote"] == 3
+    assert photo["owner"] == {"id": photo["owner_id"], "email": "writer@example.com", "role": "blog_writer"}
+    assert photo["photo_variants"] == {"thumbnail": "uploads/posts/variants/t.jpg"}
+
+    comments = (await client.get(f"/comments/post/{post_id}")).json()
+    assert [comment["content"] for comment in comments] == ["top", "reply"]
+    for comment in comments:
+        assert comment == validated(schemas.CommentResponse, comment)
+        assert list(comment) == list(schemas.CommentResponse.model_fields)
+
+
+@pytest.mark.anyio
+async def test_openapi_schema_still_names_the_response_models(client):
+    spec = (await client.get("/openapi.json")).json()
+    for path, model in (("/posts", "Post"), ("/comments/post/{post_id}", "CommentResponse")):
+        schema = spec["paths"][path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        assert schema == {"type": "array", "items": {"$ref": f"#/components/schemas/{model}"},
+                          "title": schema["title"]}
+    assert set(spec["components"]["schemas"]["Post"]["properties"]) == set(schemas.Post.model_fields)
+
+
+def test_datetimes_are_encoded_like_pydantic():
+    aware = datetime.datetime(2026, 1, 2, 3, 4, 5, 678000, tzinfo=datetime.timezone.utc)
+    naive = aware.replace(tzinfo=None)
+    assert dumps({"at": aware, "naive": naive}) == b'{"at":"2026-01-02T03:04:05.678000Z","naive":"2026-01-02T03:04:05.678000"}'
+    assert dumps(aware).decode().strip('"') == validated(schemas.Post, {
+        "id": 1, "title": "t", "content": "c", "created_at": aware, "owner_id": 1,
+        "owner": {"id": 1, "email": "e"}})["created_at"]
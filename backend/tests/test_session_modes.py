@@ -0,0 +1,94 @@
+import httpx
+import pytest
+
+from app import cache, database, models, oauth, utils
+from app.config import settings
+from app.main import app
+
+# Fields that differ between two runs of the same requests
+VOLATILE = {"created_at", "access_token"}
+
+
+def normalize(value):
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items() if key not in VOLATILE}
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    return value
+
+
+async def scenario(client):
+    # The post, vote, comment, auth and admin routes, in the order a user
+    # would meet them; returns every answer
+    answers = []
+
+    async def call(method, url, token=None, **kwargs):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = await client.request(method, url, headers=headers, **kwargs)
+        body = response.json() if response.headers.get("content-type", "").startswith("application/json") else None
+        answers.append((method, url, response.status_code, normalize(body)))
+        return body
+
+    tokens, ids = {}, {}
+    for name, role in (("admin", "admin"), ("writer", "blog_writer"), ("viewer", "viewer"), ("other", "viewer")):
+        email = f"{name}@example.com"
+        user = await call("POST", "/admin/register", json={"email": email, "password": "secret", "role": role})
+        login = await call("POST", "/login", data={"username": email, "password": "secret"})
+        tokens[name], ids[name] = login["access_token"], user["id"]
+    await call("POST", "/login", data={"username": "viewer@example.com", "password": "wrong"})
+    await call("POST", "/admin/register", json={"email": "x@example.com", "password": "secret", "role": "admin"})
+
+    post = await call("POST", "/posts", tokens["writer"], json={"title": "Garden", "content": "Beans"})
+    await call("POST", "/posts", tokens["viewer"], json={"title": "t", "content": "c"})
+    await call("PUT", f"/posts/{post['id']}", tokens["writer"], json={"title": "Garden notes", "content": "Beans"})
+    await call("GET", "/posts")
+    await call("GET", "/posts/search", params={"q": "garden"})
+
+    await call("POST", "/vote/", tokens["viewer"], json={"post_id": post["id"], "dir": 1})
+    await call("POST", "/vote/", tokens["viewer"], json={"post_id": post["id"], "dir": 1})
+    await call("POST", "/vote/", tokens["other"], json={"post_id": post["id"], "dir": 0})
+    await call("POST", "/vote/", tokens["viewer"], json={"post_id": 999, "dir": 1})
+
+    comment = await call("POST", "/comments/", tokens["viewer"], params={"post_id": post["id"]}, json={"text": "Nice"})
+    await call("POST", "/comments/", tokens["other"], params={"post_id": post["id"]},
+               json={"text": "Agreed", "parent_id": comment["id"]})
+    await call("POST", "/comments/", tokens["writer"], params={"post_id": post["id"]}, json={"text": "Thanks"})
+    await call("GET", f"/comments/post/{post['id']}")
+    await call("GET", f"/comments/{comment['id']}/thread")
+
+    other_id = ids["other"]
+    await call("PATCH", f"/admin/user/{other_id}/role", tokens["writer"], json={"role": "admin"})
+    await call("PATCH", f"/admin/user/{other_id}/role", tokens["admin"], json={"role": "blog_writer"})
+    await call("POST", "/posts", tokens["other"], json={"title": "t", "content": "c"})
+    await call("DELETE", f"/admin/user/{other_id}", tokens["admin"])
+    await call("GET", f"/comments/post/{post['id']}")
+    await call("DELETE", f"/posts/{post['id']}", tokens["writer"])
+    await call("DELETE", f"/posts/{post['id']}", tokens["admin"])
+    await call("DELETE", f"/posts/{post['id']}", tokens["admin"])
+    await call("GET", "/posts")
+    return answers
+
+
+@pytest.mark.anyio
+async def test_sync_and_async_sessions_answer_alike(monkeypatch):
+    runs = {}
+    try:
+        for mode in ("sync", "async"):
+            monkeypatch.setattr(settings, "database_async", mode == "async")
+            # Each run starts from empty tables and caches
+            models.Base.metadata.drop_all(database.engine)
+            models.Base.metadata.create_all(database.engine)
+            monkeypatch.setattr(cache.response_cache, "backend", cache._create_backend())
+            oauth._user_cache.clear()
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                runs[mode] = await scenario(client)
+            await database.async_engine.dispose()
+    finally:
+        utils.shutdown_hash_pool()
+
+    assert len(runs["sync"]) == len(runs["async"])
+    for sync_answer, async_answer in zip(runs["sync"], runs["async"]):
+        assert sync_answer == async_answer
+    # The scenario did what it meant to, not merely the same wrong thing twice
+    statuses = [status for _, _, status, _ in runs["sync"]]
+    assert statuses.count(200) + statuses.count(201) > len(statuses) // 2
@@ -0,0 +1,100 @@
+import io
+import os
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+from app import storage as storage_module
+from app.storage import S3Storage, staging_file
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+BUCKET = "photos"
+
+
+def png_bytes():
+    out = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(out, format="PNG")
+    return out.getvalue()
+
+
+async def chunks(data):
+    yield data
+
+
+async def staged(data):
+    tmp_path = await staging_file()
+    with open(tmp_path, "wb") as out:
+        out.write(data)
+    return tmp_path
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        backend = S3Storage(BUCKET, region="us-east-1")
+        monkeypatch.setattr(storage_module, "storage", backend)
+        yield backend
+
+
+def stored_keys(s3):
+    return [item["Key"] for item in s3.client.list_objects_v2(Bucket=BUCKET).get("Contents", [])]
+
+
+@pytest.mark.anyio
+async def test_s3_put_get_url_delete(s3):
+    data = png_bytes()
+    key = "posts/ab/" + "ab" * 32 + ".png"
+    tmp_path = await staged(data)
+
+    assert not await s3.exists(key)
+    await s3.save(tmp_path, key, "image/png")
+    # save takes ownership of the staged file
+    assert not os.path.exists(tmp_path)
+    assert await s3.exists(key)
+    assert s3.client.head_object(Bucket=BUCKET, Key=key)["ContentType"] == "image/png"
+
+    async with s3.local_copy(key) as path:
+        with open(path, "rb") as copy:
+            assert copy.read() == data
+    assert not os.path.exists(path)
+
+    assert s3.url(key) == f"https://s3.amazonaws.com/{BUCKET}/{key}"
+    assert S3Storage(BUCKET, region="us-east-1", public_url="https://cdn.example.com/").url(key) \
+        == f"https://cdn.example.com/{key}"
+
+    await s3.delete(key)
+    assert not await s3.exists(key)
+    # Deleting what is already gone is not an error
+    await s3.delete(key)
+
+
+@pytest.mark.anyio
+async def test_uploads_are_stored_once_under_their_content_hash(s3):
+    first = await storage_module.store_upload(chunks(png_bytes()), "image/png")
+    second = await storage_module.store_upload(chunks(png_bytes()), "image/png")
+    assert first == second
+    assert stored_keys(s3) == [first]
+
+
+@pytest.mark.anyio
+async def test_uploads_are_stored_as_the_type_of_their_bytes(s3):
+    # Sent as a JPEG, stored and served as the PNG it is
+    key = await storage_module.store_upload(chunks(png_bytes()), "image/jpeg")
+    assert key.endswith(".png")
+    assert s3.client.head_object(Bucket=BUCKET, Key=key)["ContentType"] == "image/png"
+
+
+@pytest.mark.anyio
+async def test_uploads_that_are_not_images_are_refused(s3):
+    staging = await storage_module.staging_dir()
+    with pytest.raises(HTTPException) as error:
+        await storage_module.store_upload(chunks(b"<script>alert(1)</script>"), "image/png")
+    assert error.value.status_code == 415
+    assert stored_keys(s3) == []
+    assert os.listdir(staging) == []
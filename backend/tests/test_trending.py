@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+from app import trending
+from app.config import settings
+
+
+@pytest.mark.skipif(trending.fcntl is None, reason="needs fcntl")
+def test_only_one_worker_holds_the_decay_lock():
+    path = os.path.join(os.path.dirname(settings.upload_dir), "decay.lock")
+    first = trending._decay_lock(path)
+    assert first is not None
+    assert trending._decay_lock(path) is None
+
+    # Released when the holder goes away
+    first.close()
+    second = trending._decay_lock(path)
+    assert second is not None
+    second.close()
@@ -0,0 +1,110 @@
+import asyncio
+
+import anyio
+import pytest
+from sqlalchemy import func, select
+
+from app import models, oauth
+from app.config import settings
+from app.vote_buffer import ABSENT, ADDED, vote_buffer
+
+VIEWERS = 4
+
+
+def seed(db):
+    writer = models.User(email="writer@example.com", password="x", role="blog_writer")
+    viewers = [models.User(email=f"viewer{i}@example.com", password="x", role="viewer") for i in range(VIEWERS)]
+    db.add_all([writer, *viewers])
+    db.flush()
+    post = models.Post(title="t", content="c", owner_id=writer.id, published=True)
+    db.add(post)
+    db.flush()
+    headers = [{"Authorization": f"Bearer {oauth.create_user_token(viewer)}"} for viewer in viewers]
+    post_id = post.id
+    db.commit()
+    return headers, post_id
+
+
+def stored_votes(db, post_id):
+    # Ends the read transaction, so the test holds no lock the flusher needs
+    try:
+        return (db.scalar(select(models.Post.vote_count).where(models.Post.id == post_id)),
+                db.scalar(select(func.count()).select_from(models.Vote).where(models.Vote.post_id == post_id)))
+    finally:
+        db.rollback()
+
+
+@pytest.fixture
+async def buffer(client, monkeypatch):
+    monkeypatch.setattr(settings, "vote_buffer_enabled", True)
+    yield vote_buffer
+    await vote_buffer.close()
+
+
+def vote(client, headers, post_id, direction=1):
+    return client.post("/vote/", json={"post_id": post_id, "dir": direction}, headers=headers)
+
+
+@pytest.mark.anyio
+async def test_batch_is_written_after_the_interval(client, db, buffer, monkeypatch):
+    monkeypatch.setattr(settings, "vote_buffer_interval_ms", 100)
+    headers, post_id = seed(db)
+
+    # Each request waits for the commit of its batch, with a cold user cache
+    with anyio.fail_after(10):
+        responses = await asyncio.gather(*(vote(client, auth, post_id) for auth in headers))
+    assert [response.status_code for response in responses] == [201] * VIEWERS
+    assert sorted(response.json()["votes"] for response in responses) == [VIEWERS] * VIEWERS
+    assert stored_votes(db, post_id) == (VIEWERS, VIEWERS)
+
+
+@pytest.mark.anyio
+async def test_full_batch_is_written_without_waiting_for_the_interval(client, db, buffer, monkeypatch):
+    monkeypatch.setattr(settings, "vote_buffer_interval_ms", 60_000)
+    monkeypatch.setattr(settings, "vote_buffer_max_items", VIEWERS)
+    headers, post_id = seed(db)
+
+    with anyio.fail_after(10):
+        responses = await asyncio.gather(*(vote(client, auth, post_id) for auth in headers))
+    assert [response.status_code for response in responses] == [201] * VIEWERS
+    assert stored_votes(db, post_id) == (VIEWERS, VIEWERS)
+
+
+@pytest.mark.anyio
+async def test_last_vote_of_a_user_in_a_batch_wins(client, db, buffer, monkeypatch):
+    monkeypatch.setattr(settings, "vote_buffer_interval_ms", 200)
+    _, post_id = seed(db)
+    user_ids = db.scalars(select(models.User.id).where(models.User.role == "viewer").order_by(models.User.id)).all()
+    db.rollback()
+
+    # Submitted back to back, so both land in the same batch. Twice the same
+    # vote: one row, both answered with it
+    with anyio.fail_after(10):
+        outcomes = await asyncio.gather(vote_buffer.submit(user_ids[0], post_id, 1),
+                                        vote_buffer.submit(user_ids[0], post_id, 1))
+    assert outcomes == [(ADDED, 1), (ADDED, 1)]
+    assert stored_votes(db, post_id) == (1, 1)
+
+    # A vote taken back in the same batch is never written
+    with anyio.fail_after(10):
+        outcomes = await asyncio.gather(vote_buffer.submit(user_ids[1], post_id, 1),
+                                        vote_buffer.submit(user_ids[1], post_id, 0))
+    assert outcomes == [(ABSENT, 1), (ABSENT, 1)]
+    assert stored_votes(db, post_id) == (1, 1)
+
+
+@pytest.mark.anyio
+async def test_close_writes_what_is_still_buffered(client, db, buffer, monkeypatch):
+    monkeypatch.setattr(settings, "vote_buffer_durability", "none")
+    monkeypatch.setattr(settings, "vote_buffer_interval_ms", 60_000)
+    headers, post_id = seed(db)
+
+    for auth in headers:
+        assert (await vote(client, auth, post_id)).status_code == 202
+    assert len(vote_buffer) == VIEWERS
+    assert stored_votes(db, post_id) == (0, 0)
+
+    with anyio.fail_after(10):
+        await vote_buffer.close()
+    assert len(vote_buffer) == 0
+    assert stored_votes(db, post_id) == (VIEWERS, VIEWERS)
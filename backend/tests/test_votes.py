@@ -0,0 +1,72 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+
+from app import models, oauth
+from app.config import settings
+from app.vote_buffer import vote_buffer
+
+VIEWERS = 40
+POSTS = 3
+CALLS = 400
+
+
+def seed(db):
+    writer = models.User(email="writer@example.com", password="x", role="blog_writer")
+    viewers = [models.User(email=f"viewer{i}@example.com", password="x", role="viewer") for i in range(VIEWERS)]
+    db.add_all([writer, *viewers])
+    db.flush()
+    posts = [models.Post(title=f"post {i}", content="body", owner_id=writer.id, published=True) for i in range(POSTS)]
+    db.add_all(posts)
+    db.flush()
+    headers = [{"Authorization": f"Bearer {oauth.create_user_token(viewer)}"} for viewer in viewers]
+    post_ids = [post.id for post in posts]
+    # Nothing is loaded after this, so the session holds no lock during the test
+    db.commit()
+    return headers, post_ids
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("buffered", [False, True], ids=["direct", "buffered"])
+async def test_concurrent_votes_keep_vote_count_exact(client, db, monkeypatch, buffered):
+    monkeypatch.setattr(settings, "vote_buffer_enabled", buffered)
+    headers, post_ids = seed(db)
+    rng = random.Random(8)
+    # Viewers racing to vote and unvote on the same few posts, including the
+    # same viewer on the same post from several requests at once
+    calls = [(rng.choice(headers), rng.choice(post_ids), rng.randint(0, 1)) for _ in range(CALLS)]
+
+    responses = await asyncio.gather(*(
+        client.post("/vote/", json={"post_id": post_id, "dir": direction}, headers=auth)
+        for auth, post_id, direction in calls
+    ))
+    await vote_buffer.close()
+
+    # Conflicts are answered, never failed
+    assert {response.status_code for response in responses} <= {201, 404, 409}
+    assert sum(response.status_code == 201 for response in responses) > 0
+
+    db.expire_all()
+    counts = dict(db.execute(
+        select(models.Vote.post_id, func.count()).group_by(models.Vote.post_id)
+    ).all())
+    stored = dict(db.execute(select(models.Post.id, models.Post.vote_count)).all())
+    assert stored == {post_id: counts.get(post_id, 0) for post_id in post_ids}
+
+
+@pytest.mark.anyio
+async def test_unvote_after_decay_does_not_leave_a_negative_score(client, db):
+    headers, post_ids = seed(db)
+    post_id = post_ids[0]
+    assert (await client.post("/vote/", json={"post_id": post_id, "dir": 1}, headers=headers[0])).status_code == 201
+    # The vote is a day old, so most of its weight has decayed away
+    db.execute(update(models.Post).where(models.Post.id == post_id)
+               .values(hot_updated_at=datetime.utcnow() - timedelta(days=1)))
+    db.commit()
+
+    assert (await client.post("/vote/", json={"post_id": post_id, "dir": 0}, headers=headers[0])).status_code == 201
+    db.expire_all()
+    assert db.scalar(select(models.Post.hot_score).where(models.Post.id == post_id)) == 0